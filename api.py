@@ -1,7 +1,72 @@
-from fastapi import FastAPI
+"""HTTP API of the connecting server.
 
+Runs the acquisition scheduler in the same process and event loop, as background tasks started and stopped
+with the app, so the Modbus connections, the latest values, the live streams and the metrics are shared in memory.
+The jobs can be started, stopped and rescheduled at runtime through the ``/jobs`` routes.
 
-app = FastAPI()
+If the ``[sharding]`` section enables worker processes, the jobs run in the workers instead, see ``readings.sharding``.
+The latest values, the live streams and the metrics are then fed by the reports of the workers,
+while refreshes and the control of single jobs are not available.
+
+Run from the root of the project with: ::
+
+    python -m api
+
+The server can be configured with: ::
+
+    [api]
+    host = # Address to listen on
+    port = # Port to listen on
+    run_scheduler = # Whether to start the jobs with the app, disable it when running readings.scheduler separately
+
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import yaml
+from fastapi import FastAPI, HTTPException, WebSocket
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from config.config_compiler import ConfigError
+from config.config_loading import load_settings
+from readings import latest, live, metrics, modbus, questdb_http, scheduler, sharding
+
+# Default values of the server settings, see the module docstring
+DEFAULT_SETTINGS = {
+    "host": "127.0.0.1",
+    "port": 8000,
+    "run_scheduler": True,
+}
+# Seconds between comments keeping an idle SSE stream open
+SSE_KEEPALIVE = 15.0
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Starts the jobs, or their worker processes, with the app and closes all connections when it stops"""
+    if load_settings("api", DEFAULT_SETTINGS)["run_scheduler"]:
+        if sharding.is_enabled():
+            await asyncio.to_thread(sharding.start)
+        else:
+            await scheduler.start_async_jobs()
+    try:
+        yield
+    finally:
+        await asyncio.to_thread(sharding.stop)
+        await scheduler.stop_async_jobs()
+        questdb_http.close_connections()
+
+
+def _require_local_jobs():
+    """Rejects controlling the jobs when they run in worker processes"""
+    if sharding.supervisor is not None:
+        raise HTTPException(status_code=409, detail="Jobs run in worker processes, see /workers")
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.get("/")
@@ -14,8 +79,192 @@ async def say_hello(name: str):
     return {"message": f"Hello {name}"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Metrics of the acquisition in the Prometheus text format"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/latest/{table}")
+async def get_latest(table: str):
+    """Last known values of all fields of a table, with their timestamps and qualities, see ``readings.latest``"""
+    try:
+        return latest.store.get(table)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No values of table {table}")
+
+
+@app.get("/latest/{table}/{symbol}")
+async def get_latest_symbol(table: str, symbol: str):
+    """Last known values of a single symbol of a symbolic table"""
+    try:
+        return latest.store.get(table, symbol)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No values of symbol {symbol} in table {table}")
+
+
+def _split(value: Optional[str]) -> Optional[set[str]]:
+    """Parses a comma-separated filter, None means no filter"""
+    return None if not value else {item.strip() for item in value.split(",") if item.strip()}
+
+
+@app.get("/stream/sse")
+async def stream_sse(tables: Optional[str] = None, symbols: Optional[str] = None):
+    """Server-Sent Events stream of the completed readings, see ``readings.live``.
+
+    ``tables`` and ``symbols`` are optional comma-separated filters.
+    Each row is sent as a ``reading`` event with a JSON object of the ``table``, ``symbol``, ``timestamp``
+    (microseconds since the epoch) and ``values``.
+    """
+    tables, symbols = _split(tables), _split(symbols)
+
+    async def events():
+        # Subscribed once the stream starts, so a client leaving before doesn't leave its queue behind
+        with live.broker.subscribe(tables, symbols) as subscription:
+            while True:
+                try:
+                    messages = await asyncio.wait_for(subscription.get(), SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield "".join(f"event: reading\ndata: {json.dumps(message)}\n\n" for message in messages)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.websocket("/stream/ws")
+async def stream_ws(websocket: WebSocket, tables: Optional[str] = None, symbols: Optional[str] = None):
+    """WebSocket stream of the completed readings, with the same filters and messages as ``/stream/sse``"""
+    await websocket.accept()
+
+    async def forward():
+        while True:
+            for message in await subscription.get():
+                await websocket.send_text(json.dumps(message))
+
+    async def wait_for_disconnect():
+        # Also notices clients leaving while no readings are sent
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    with live.broker.subscribe(_split(tables), _split(symbols)) as subscription:
+        tasks = [asyncio.create_task(forward()), asyncio.create_task(wait_for_disconnect())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Errors of a closed connection are expected here
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
 @app.get("/quest/exec")
-async def fetch():
-    pass
+async def fetch(query: str, format: str = "json", limit: Optional[int] = None):
+    """Executes a query on QuestDB and streams the result back as it arrives.
+
+    The result is returned as JSON or CSV, limited to at most ``limit`` rows and the ``max_rows`` setting,
+    see ``readings.questdb_http``. Only SELECT and SHOW queries are accepted unless the ``allow_writes``
+    setting is on. If the client disconnects, the query is cancelled,
+    and its connection is released even if the body was never streamed.
+    """
+    try:
+        response = await questdb_http.query(query, format, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (OSError, asyncio.TimeoutError) as e:
+        raise HTTPException(status_code=502, detail=f"QuestDB is unreachable: {e!r}")
+
+    media_type = response.headers.get("content-type")
+    if response.status != 200:
+        return Response(await response.read(), status_code=response.status, media_type=media_type)
+    return StreamingResponse(response.stream(), media_type=media_type, background=BackgroundTask(response.close))
+
+
+@app.get("/refresh")
+async def refresh(table: Optional[str] = None, max_age: Optional[float] = None):
+    """Takes readings of a table, or all tables, now and returns them.
+
+    Concurrent refreshes of a table share a single reading,
+    and a reading younger than ``max_age`` seconds is returned without reading the meters again,
+    see ``readings.scheduler.refresh()``.
+    """
+    _require_local_jobs()
+    try:
+        return await scheduler.refresh(table, max_age)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown table: {table}")
+    except (OSError, *modbus.READ_ERRORS) as e:
+        raise HTTPException(status_code=502, detail=f"Reading the table failed: {e!r}")
+
+
+@app.get("/jobs")
+async def get_jobs():
+    """Schedules and scheduling statistics of the jobs, see ``readings.scheduler.job_stats()``"""
+    return scheduler.job_stats()
+
+
+@app.post("/jobs/{name}/start")
+async def start_job(name: str):
+    """Starts the job of a table, if it's not running"""
+    _require_local_jobs()
+    try:
+        scheduler.start_job(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {name}")
+    return scheduler.job_stats()[name]
+
+
+@app.post("/jobs/{name}/stop")
+async def stop_job(name: str):
+    """Stops the job of a table, after its reading in flight"""
+    _require_local_jobs()
+    try:
+        await scheduler.stop_job(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {name}")
+    return scheduler.job_stats()[name]
+
+
+@app.post("/jobs/{name}/reschedule")
+async def reschedule_job(name: str, interval: Optional[float] = None, aligned: Optional[bool] = None,
+                         jitter: Optional[float] = None):
+    """Changes the interval (in seconds), the alignment or the jitter of the job of a table"""
+    _require_local_jobs()
+    try:
+        scheduler.reschedule_job(name, interval, aligned, jitter)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {name}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return scheduler.job_stats()[name]
+
+
+@app.post("/config/reload")
+async def reload_config():
+    """Applies changes of the register reference file and the reading intervals right away, see ``reload_jobs()``.
+
+    Invalid or unreadable configuration files are answered with a 400, other errors surface as a 500.
+    """
+    _require_local_jobs()
+    try:
+        return await scheduler.reload_jobs()
+    except (ConfigError, yaml.YAMLError, OSError) as e:
+        raise HTTPException(status_code=400, detail=f"Reloading the configuration failed: {e!r}")
+
+
+@app.get("/workers")
+async def get_workers():
+    """State of the worker processes running the jobs, empty if they run in the API process"""
+    return sharding.supervisor.snapshot() if sharding.supervisor is not None else []
+
+
+def _main():
+    import uvicorn
+
+    settings = load_settings("api", DEFAULT_SETTINGS)
+    uvicorn.run(app, host=settings["host"], port=settings["port"])
+
+
+if __name__ == "__main__":
+    _main()
 
-#@app.get("/refresh")
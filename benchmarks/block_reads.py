@@ -0,0 +1,75 @@
+"""Benchmark comparing per-register reads with planned block reads.
+
+Run from the root of the project: ::
+
+    python -m benchmarks.block_reads
+
+Reads a ``phases``-like symbolic table from a local simulator and reports requests, connections and time per poll.
+
+"""
+import asyncio
+import time
+
+from benchmarks.simulator import Simulator
+from readings import modbus
+from readings.data_classes import Meter, Register
+
+PORT = 5020
+POLLS = 5
+FIELDS = ("voltage", "current", "power_active", "power_reactive", "power_apparent")
+
+
+def _make_meters() -> dict[str, Meter]:
+    identification = Meter.Identification("electric_meter", 1, "127.0.0.1", PORT)
+    register_types = {"float": Meter.RegisterType(">", ">", 2, "input")}
+    return {"electric": Meter(identification, register_types)}
+
+
+def _make_phases() -> dict[int, dict[str, Register]]:
+    # Layout of the electric meter, with 32-bit floats: phase every 18 registers
+    return {
+        phase: {name: Register(7500 + 18 * (phase - 1) + 2 * i, "float", "electric") for i, name in enumerate(FIELDS)}
+        for phase in (1, 2, 3)
+    }
+
+
+async def _per_register_poll(meters, phases):
+    # Old behaviour: a request and a new connection for every register
+    for fields in phases.values():
+        for register in fields.values():
+            meter = meters[register.meter]
+            await modbus._connect_meter(meter)
+            reg_type = meter.register_types[register.type]
+            await meter.client.read_input_registers(register.register, reg_type.length, meter.id.slave_id)
+            await meter.client.close()
+
+
+async def _block_poll(meters, phases):
+    for fields in phases.values():
+        await modbus.read_registers(meters, fields)
+
+
+async def _measure(name, poll, simulator, meters, phases):
+    simulator.reset()
+    connects = modbus.pool_stats()["connects"]
+    start = time.perf_counter()
+    for _ in range(POLLS):
+        await poll(meters, phases)
+    elapsed = time.perf_counter() - start
+    connects = modbus.pool_stats()["connects"] - connects
+    print(f"{name:>14}: {simulator.requests / POLLS:6.1f} requests/poll, {connects / POLLS:6.1f} connections/poll, "
+          f"{1000 * elapsed / POLLS:8.1f} ms/poll")
+
+
+async def _main():
+    meters = _make_meters()
+    phases = _make_phases()
+    async with Simulator(port=PORT) as simulator:
+        await _measure("per-register", _per_register_poll, simulator, meters, phases)
+        await _measure("block", _block_poll, simulator, meters, phases)
+        print(modbus.pool_stats())
+        await modbus.pool.close_all()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,89 @@
+"""Benchmark comparing the previous loading of the register reference file with the compiled loading.
+
+Run from the root of the project: ::
+
+    python -m benchmarks.config_loading
+
+Generates register reference files with 100, 1000 and 10000 registers, spread over meters of 100 registers
+and simple tables of 50 fields, and reports the time of loading each with ``yaml.safe_load``,
+of compiling it (parsing with the fastest loader and validating) and of loading its compiled form from the cache.
+
+"""
+import os
+import tempfile
+import time
+
+import yaml
+
+from config import config_compiler
+
+SIZES = (100, 1000, 10000)
+REGISTERS_PER_METER = 100
+FIELDS_PER_TABLE = 50
+REPEAT = 5
+
+
+def _generate(size: int) -> str:
+    lines = ["meters:"]
+    for meter in range(size // REGISTERS_PER_METER):
+        lines += [
+            f"  meter_{meter}: !<meter>",
+            "    id: !<id>",
+            f"      name: meter_{meter}",
+            "      slave_id: 1",
+            f"      ip_address: 10.0.{meter // 250}.{meter % 250}",
+            "      tcp_socket: 502",
+            "    register_types:",
+            "      float: !<reg_type>",
+            '        byteorder: ">"',
+            '        wordorder: ">"',
+            "        length: 2",
+            "        read_type: input",
+        ]
+    lines.append("tables:")
+    for register in range(size):
+        if register % FIELDS_PER_TABLE == 0:
+            lines += [f"  table_{register // FIELDS_PER_TABLE}: !<table>", "    type: simple", "    fields:"]
+        lines += [
+            f"      field_{register}: !<reg>",
+            f"        register: {register % REGISTERS_PER_METER * 2}",
+            "        type: float",
+            f"        meter: meter_{register // REGISTERS_PER_METER}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def _best(function) -> float:
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def _safe_load(path: str):
+    # Previous behaviour of config.config_loading.load_yaml_config()
+    with open(path, "r") as stream:
+        return yaml.safe_load(stream)
+
+
+def _main():
+    print(f"Parser: {config_compiler._BaseLoader.__name__}")
+    with tempfile.TemporaryDirectory() as directory:
+        config_compiler.CACHE_DIR = os.path.join(directory, "cache")
+        for size in SIZES:
+            path = os.path.join(directory, f"registers_{size}.yaml")
+            with open(path, "w") as stream:
+                stream.write(_generate(size))
+
+            safe_load = _best(lambda: _safe_load(path))
+            compiled = _best(lambda: config_compiler.compile_config(path, use_cache=False))
+            config_compiler.compile_config(path)
+            cached = _best(lambda: config_compiler.compile_config(path))
+            print(f"{size:6} registers: safe_load {safe_load * 1e3:8.1f} ms, compiled {compiled * 1e3:8.1f} ms, "
+                  f"cached {cached * 1e3:6.1f} ms, {safe_load / cached:6.1f}x faster")
+
+
+if __name__ == "__main__":
+    _main()
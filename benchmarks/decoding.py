@@ -0,0 +1,77 @@
+"""Benchmark comparing per-field decoding with the compiled block decoders.
+
+Run from the root of the project: ::
+
+    python -m benchmarks.decoding
+
+Decodes a block of floats, ints and bools laid out like the example configuration,
+with 10, 100 and 1000 registers, and reports the time per decoded block.
+The decoders need no connection, so the benchmark measures only the decoding on the hot path.
+
+"""
+import random
+import timeit
+
+from pymodbus import payload as mbp
+
+from readings.data_classes import Meter, Register
+from readings.decoding import BlockDecoder
+
+SIZES = (10, 100, 1000)
+# Cycle of field types, every other register is left unused as in the phase registers
+LAYOUT = ("float", "int", "bool16", "float", "uint8")
+REGISTER_TYPES = {
+    "float": Meter.RegisterType(">", ">", 2),
+    "int": Meter.RegisterType(">", ">", 1),
+    "uint8": Meter.RegisterType(">", ">", 1),
+    "bool16": Meter.RegisterType(">", ">", 1),
+}
+
+
+def _fields(size: int) -> list[tuple[str, Register, Meter.RegisterType]]:
+    fields = []
+    address = 0
+    while True:
+        type_name = LAYOUT[len(fields) % len(LAYOUT)]
+        reg_type = REGISTER_TYPES[type_name]
+        if address + reg_type.length > size:
+            return fields
+        fields.append((f"field_{len(fields)}", Register(address, type_name, "meter"), reg_type))
+        address += reg_type.length + 1
+
+
+def _reference(fields, registers) -> dict:
+    # Previous behaviour of readings.modbus._read_block(), decoding each field with pymodbus
+    results = {}
+    for key, register, reg_type in fields:
+        values = registers[register.register:register.register + reg_type.length]
+        decoder = mbp.BinaryPayloadDecoder.fromRegisters(values, reg_type.byteorder, reg_type.wordorder)
+        match register.type:
+            case "float":
+                results[key] = decoder.decode_32bit_float()
+            case "int":
+                results[key] = decoder.decode_16bit_int()
+            case "uint8":
+                results[key] = decoder.decode_8bit_uint()
+            case "bool16":
+                results[key] = bool(decoder.decode_16bit_uint())
+    return results
+
+
+def _main():
+    random.seed(0)
+    for size in SIZES:
+        fields = _fields(size)
+        registers = [random.randrange(1 << 16) for _ in range(size)]
+        decoder = BlockDecoder(0, size, fields)
+        assert repr(_reference(fields, registers)) == repr(decoder.decode(registers))
+
+        number = max(10000 // size, 10)
+        reference = min(timeit.repeat(lambda: _reference(fields, registers), number=number, repeat=5)) / number
+        compiled = min(timeit.repeat(lambda: decoder.decode(registers), number=number, repeat=5)) / number
+        print(f"{size:5} registers, {len(fields):4} fields: per field {reference * 1e6:9.1f} us/block, "
+              f"compiled {compiled * 1e6:7.1f} us/block, {reference / compiled:5.1f}x faster")
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,188 @@
+"""End-to-end benchmark of the acquisition, from Modbus requests to line protocol rows.
+
+Run from the root of the project: ::
+
+    python -m benchmarks.end_to_end [--meters N] [--polls N] [--latency SECONDS] [--error-rate SHARE] [--threaded]
+
+Loads the meters and tables of the register reference file and points them at local simulators
+seeded with ``benchmarks.simulator.registers_from_config()``, one simulator per endpoint of the file.
+With ``--meters N``, the meters and their tables are replicated N times, each copy on its own simulator,
+to size how many meters a single process can handle.
+
+Each poll reads all tables together with ``measure_and_save_async()``, like the scheduler does on an aligned tick,
+or with ``measure_and_save()`` in a thread per table with ``--threaded``.
+The rows are sent to a stand-in for the line protocol endpoint.
+
+The simulators and the stand-in run in a separate process, so the reported CPU time is only that of the acquisition.
+
+Reports polls/s, Modbus requests per poll, p50/p99 poll latency, CPU time per poll and failed table reads.
+
+"""
+import argparse
+import asyncio
+import math
+import multiprocessing
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.ilp_listener import IlpListener
+from benchmarks.simulator import Simulator, SlaveRegisters, registers_from_config
+from config.config_loading import load_yaml_config
+from readings import db_functions, modbus
+from readings.data_classes import Meter, Table, Register
+from readings.decoding import TYPES
+from readings.reading_execution import measure_and_save, measure_and_save_async
+
+BASE_PORT = 5100
+ILP_PORT = 9019
+WARMUP_POLLS = 3
+
+
+def _widen_register_types(meters: dict[str, Meter]):
+    # The example file defines floats with a length of 1 register, which can't hold them
+    for name, meter in meters.items():
+        for type_name, reg_type in meter.register_types.items():
+            if type_name in TYPES and TYPES[type_name][1] > 2 * reg_type.length:
+                reg_type.length = math.ceil(TYPES[type_name][1] / 2)
+                print(f"Widened register type '{type_name}' of meter '{name}' to {reg_type.length} registers")
+
+
+def _replicate(meters: dict[str, Meter], tables: dict[str, Table],
+               copies: int) -> (dict[str, Meter], dict[str, Table], dict[int, SlaveRegisters]):
+    """Copies the meters and tables, moving every endpoint of every copy to its own local port"""
+    seeded = registers_from_config(meters, tables)
+    ports: dict[tuple[tuple[str, int], int], int] = {}
+    new_meters, new_tables, simulators = {}, {}, {}
+    for copy in range(copies):
+        for name, meter in meters.items():
+            endpoint = (meter.id.ip_address, meter.id.tcp_socket)
+            port = ports.get((endpoint, copy))
+            if port is None:
+                port = ports[(endpoint, copy)] = BASE_PORT + len(ports)
+                simulators[port] = seeded.get(endpoint, {})
+            identification = Meter.Identification(f"{meter.id.name}_{copy}", meter.id.slave_id, "127.0.0.1", port)
+            new_meters[f"{name}_{copy}"] = Meter(identification, meter.register_types)
+
+        def copy_fields(fields: dict[any, Register]) -> dict[any, Register]:
+            return {key: Register(register.register, register.type, f"{register.meter}_{copy}")
+                    for key, register in fields.items()}
+
+        for name, table in tables.items():
+            if table.type == Table.Types.SYMBOLIC:
+                fields = {symbol: copy_fields(symbol_fields) for symbol, symbol_fields in table.fields.items()}
+            else:
+                fields = copy_fields(table.fields)
+            new_tables[f"{name}_{copy}"] = Table(fields, table.type, table.symbol_field)
+    return new_meters, new_tables, simulators
+
+
+async def _serve(simulators: dict[int, SlaveRegisters], latency: float, error_rate: float, connection):
+    with IlpListener(port=ILP_PORT) as listener:
+        servers = [Simulator(port=port, registers=registers, latency=latency, error_rate=error_rate, seed=port)
+                   for port, registers in simulators.items()]
+        for server in servers:
+            await server.start()
+        connection.send("ready")
+        while (command := await asyncio.to_thread(connection.recv)) != "stop":
+            if command == "reset":
+                for server in servers:
+                    server.reset()
+                listener.reset()
+            connection.send((sum(server.requests for server in servers),
+                             sum(server.errors for server in servers), listener.rows))
+        for server in servers:
+            await server.stop()
+
+
+def _harness(simulators: dict[int, SlaveRegisters], latency: float, error_rate: float, connection):
+    """Runs the simulators and the line protocol stand-in in the child process"""
+    asyncio.run(_serve(simulators, latency, error_rate, connection))
+
+
+async def _poll_async(meters, tables) -> int:
+    results = await asyncio.gather(*(measure_and_save_async(table, name, meters) for name, table in tables.items()),
+                                   return_exceptions=True)
+    return sum(isinstance(result, Exception) for result in results)
+
+
+def _run_polls(meters, tables, polls: int, threaded: bool) -> (list[float], int):
+    latencies = []
+    failures = 0
+    if threaded:
+        with ThreadPoolExecutor(max_workers=len(tables)) as executor:
+            for _ in range(polls):
+                start = time.perf_counter()
+                futures = [executor.submit(measure_and_save, table, name, meters) for name, table in tables.items()]
+                failures += sum(future.exception() is not None for future in futures)
+                latencies.append(time.perf_counter() - start)
+        return latencies, failures
+
+    async def run():
+        nonlocal failures
+        for _ in range(polls):
+            start = time.perf_counter()
+            failures += await _poll_async(meters, tables)
+            latencies.append(time.perf_counter() - start)
+        await modbus.close_connections()
+
+    asyncio.run(run())
+    return latencies, failures
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Benchmarks the acquisition against local simulators")
+    parser.add_argument("--meters", type=int, default=1, help="copies of the meters of the register reference file")
+    parser.add_argument("--polls", type=int, default=200, help="amount of measured polls")
+    parser.add_argument("--latency", type=float, default=0.0, help="delay of every Modbus response, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of the requests failing, 0 to 1")
+    parser.add_argument("--threaded", action="store_true", help="read the tables like the threaded scheduler")
+    args = parser.parse_args()
+
+    # The example file can't pass the validation, its floats overlap once widened
+    meters, tables = load_yaml_config(validate=False)
+    _widen_register_types(meters)
+    meters, tables, simulators = _replicate(meters, tables, args.meters)
+
+    connection, child_connection = multiprocessing.Pipe()
+    harness = multiprocessing.Process(target=_harness, daemon=True,
+                                      args=(simulators, args.latency, args.error_rate, child_connection))
+    harness.start()
+    assert connection.recv() == "ready"
+    # Send the rows to the stand-in, without spooling them on failures
+    db_functions.service = db_functions.IngestionService("127.0.0.1", ILP_PORT)
+    try:
+        _run_polls(meters, tables, WARMUP_POLLS, args.threaded)
+        db_functions.flush()
+        connection.send("reset")
+        connection.recv()
+
+        cpu = time.process_time()
+        start = time.perf_counter()
+        latencies, failures = _run_polls(meters, tables, args.polls, args.threaded)
+        db_functions.flush()
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        # Give the stand-in a moment to count the last rows
+        time.sleep(0.2)
+        connection.send("stats")
+        requests, errors, rows = connection.recv()
+    finally:
+        connection.send("stop")
+        harness.join(5)
+        db_functions.close()
+
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    print(f"{len(meters)} meters, {len(tables)} tables, {len(simulators)} simulators, "
+          f"latency {1000 * args.latency:.1f} ms, error rate {args.error_rate:.1%}"
+          f"{', threaded' if args.threaded else ''}")
+    print(f"{args.polls / elapsed:10.1f} polls/s")
+    print(f"{requests / args.polls:10.1f} requests/poll ({errors / args.polls:.2f} failed)")
+    print(f"{1000 * percentiles[49]:10.2f} ms p50 poll latency")
+    print(f"{1000 * percentiles[98]:10.2f} ms p99 poll latency")
+    print(f"{1000 * cpu / args.polls:10.2f} ms CPU/poll")
+    print(f"{rows / args.polls:10.1f} rows/poll, {failures / args.polls:.2f} failed table reads/poll")
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,89 @@
+"""Stand-in for the QuestDB InfluxDB line protocol endpoint, for benchmarking without a database.
+
+Usage: ::
+
+    with IlpListener(port=9019) as listener:
+        # send rows to 127.0.0.1:9019
+        print(listener.rows, listener.connections)
+
+"""
+import socketserver
+import threading
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        listener = self.server.listener
+        with listener.lock:
+            listener.connections += 1
+        for line in self.rfile:
+            with listener.lock:
+                listener.rows += 1
+                listener.bytes += len(line)
+                if listener.keep_lines:
+                    listener.lines.append(line)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class IlpListener:
+    """TCP server counting the received line protocol rows, running in a background thread.
+
+    Attributes
+    ----------
+    host : str
+        Address the server listens on
+    port : int
+        Port the server listens on
+    keep_lines : bool
+        Whether to store the received lines in ``lines``
+    rows : int
+        Amount of received rows
+    bytes : int
+        Amount of received bytes
+    connections : int
+        Amount of accepted connections
+    lines : list[bytes]
+        Received lines, if ``keep_lines`` is set
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 9019, keep_lines: bool = False):
+        self.host = host
+        self.port = port
+        self.keep_lines = keep_lines
+        self.rows = 0
+        self.bytes = 0
+        self.connections = 0
+        self.lines = []
+        self.lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def reset(self):
+        """Resets the counters"""
+        with self.lock:
+            self.rows = 0
+            self.bytes = 0
+            self.connections = 0
+            self.lines = []
+
+    def start(self):
+        """Starts listening in a background thread"""
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.listener = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the server"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,81 @@
+"""Benchmark comparing a Sender per row with the buffered ingestion service.
+
+Run from the root of the project: ::
+
+    python -m benchmarks.ingestion
+
+Ingests polls shaped like the example configuration (3 phase rows, 1 average row and 1 panel row)
+into a local stand-in for the line protocol endpoint, and reports rows/s, connections and flushes per poll.
+
+"""
+import time
+
+from questdb.ingress import Sender, TimestampMicros
+
+from benchmarks.ilp_listener import IlpListener
+from readings.db_functions import IngestionService
+
+PORT = 9019
+# Kept low for the Sender per row, opening many connections quickly may get throttled by the OS
+BASELINE_POLLS = 10
+POLLS = 1000
+
+
+def _poll_rows():
+    ts = TimestampMicros.now()
+    rows = [("phase", {"phase": str(phase)}, {"ts": ts, "voltage": 230.0, "current": 5.0, "power_active": 1.1,
+                                              "power_reactive": 0.2, "power_apparent": 1.2})
+            for phase in (1, 2, 3)]
+    rows.append(("electric_avg", {}, {"ts": ts, "current_demand": 4.0, "power_active_demand": 3.0,
+                                      "power_apparent_demand": 3.5}))
+    rows.append(("panel", {}, {"ts": ts, "oil_status": True, "water_status": False, "water_level": 2}))
+    return rows
+
+
+def _sender_per_row(polls):
+    # Old behaviour of ingest(): a connection and a flush for every row
+    flushes = 0
+    for _ in range(polls):
+        for table, symbols, columns in _poll_rows():
+            with Sender("127.0.0.1", PORT) as sender:
+                sender.row(table, symbols=symbols, columns=columns)
+                sender.flush()
+                flushes += 1
+    return flushes
+
+
+def _service(polls):
+    service = IngestionService("127.0.0.1", PORT)
+    for _ in range(polls):
+        for table, symbols, columns in _poll_rows():
+            service.row(table, columns, symbols=symbols)
+        # End of the poll cycle
+        service.flush()
+    service.close()
+    return service.stats.flushes
+
+
+def _wait_for(listener, rows):
+    deadline = time.monotonic() + 5
+    while listener.rows < rows and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def _measure(name, ingest, listener, polls):
+    listener.reset()
+    start = time.perf_counter()
+    flushes = ingest(polls)
+    _wait_for(listener, polls * 5)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>15}: {listener.rows / elapsed:10.0f} rows/s, {listener.connections / polls:5.2f} connections/poll, "
+          f"{flushes / polls:5.2f} flushes/poll")
+
+
+def _main():
+    with IlpListener(port=PORT) as listener:
+        _measure("sender per row", _sender_per_row, listener, BASELINE_POLLS)
+        _measure("service", _service, listener, POLLS)
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,210 @@
+"""Local Modbus TCP simulator for benchmarking the acquisition without real hardware.
+
+Usage: ::
+
+    async with Simulator(port=5020) as simulator:
+        # read from 127.0.0.1:5020
+        print(simulator.requests)
+
+The registers can be seeded from the register reference file with ``registers_from_config()``,
+so the configured tables decode to known values, and each simulator can delay its responses
+and fail a share of the requests, to resemble slow or unreliable gateways.
+
+"""
+import asyncio
+import random
+from typing import Optional
+
+from pymodbus import payload as mbp
+from pymodbus.datastore import ModbusServerContext, ModbusSlaveContext, ModbusSequentialDataBlock
+from pymodbus.framer.rtu_framer import ModbusRtuFramer
+from pymodbus.pdu import ExceptionResponse, ModbusExceptions
+from pymodbus.server.async_io import ModbusTcpServer, ModbusConnectedRequestHandler
+
+from readings.data_classes import Meter, Table
+
+# Registers of a simulator, per slave id and read type ("input" or "holding"), as {address: value}
+SlaveRegisters = dict[int, dict[str, dict[int, int]]]
+
+
+def encode_value(value: any, type_name: str, reg_type: Meter.RegisterType) -> list[int]:
+    """Encodes a value into registers, so that ``readings.modbus`` decodes it back
+
+    Parameters
+    ----------
+    value : any
+        Value to encode
+    type_name : str
+        Name of the register type, one of the types supported by ``readings.decoding``
+    reg_type : Meter.RegisterType
+        Register type with the byte and word order
+
+    Returns
+    -------
+    list[int]
+        Values of the registers, starting at the address of the field
+    """
+    builder = mbp.BinaryPayloadBuilder(byteorder=reg_type.byteorder, wordorder=reg_type.wordorder)
+    match type_name:
+        case "float":
+            builder.add_32bit_float(value)
+        case "int":
+            builder.add_16bit_int(value)
+        case "uint8":
+            # Decoded from the high byte of the register
+            return [value << 8]
+        case "bool16":
+            builder.add_16bit_uint(int(value))
+        case _:
+            raise ValueError(f"Register type unsupported by the simulator: {type_name}")
+    return builder.to_registers()
+
+
+def _example_value(address: int, type_name: str) -> any:
+    match type_name:
+        case "float":
+            return address / 10
+        case "int":
+            return address % 0x8000
+        case "uint8":
+            return address % 0x100
+        case _:
+            return bool(address % 2)
+
+
+def registers_from_config(meters: dict[str, Meter],
+                          tables: dict[str, Table]) -> dict[tuple[str, int], SlaveRegisters]:
+    """Seeds the registers of all fields of the tables with example values derived from their addresses
+
+    Parameters
+    ----------
+    meters : dict[str, Meter]
+        Meters of the register reference file
+    tables : dict[str, Table]
+        Tables of the register reference file
+
+    Returns
+    -------
+    dict[tuple[str, int], SlaveRegisters]
+        Registers to simulate, per endpoint ``(ip_address, tcp_socket)`` of the meters
+    """
+    endpoints: dict[tuple[str, int], SlaveRegisters] = {}
+    for table in tables.values():
+        fields = table.fields.values() if table.type == Table.Types.SYMBOLIC else [table.fields]
+        for symbol_fields in fields:
+            for register in symbol_fields.values():
+                meter = meters[register.meter]
+                reg_type = meter.register_types[register.type]
+                slave = endpoints.setdefault((meter.id.ip_address, meter.id.tcp_socket), {}) \
+                    .setdefault(meter.id.slave_id, {"input": {}, "holding": {}})
+                values = encode_value(_example_value(register.register, register.type), register.type, reg_type)
+                for offset, value in enumerate(values):
+                    slave[reg_type.read_type][register.register + offset] = value
+    return endpoints
+
+
+class _DelayedHandler(ModbusConnectedRequestHandler):
+    """Request handler delaying the responses by the latency of its simulator, without blocking other connections"""
+    def _send_(self, data):
+        latency = self.server.simulator.latency
+        if latency > 0:
+            asyncio.get_running_loop().call_later(latency, super()._send_, data)
+        else:
+            super()._send_(data)
+
+
+class Simulator:
+    """Modbus TCP server running on the current event loop, counting the requests it receives.
+
+    Unless seeded with ``registers``, all input and holding registers of the simulated slaves
+    are filled with their own addresses, so every request returns valid data.
+
+    Attributes
+    ----------
+    host : str
+        Address the server listens on
+    port : int
+        Port the server listens on
+    slave_ids : tuple[int]
+        Slave ids served by the simulator
+    latency : float
+        Delay of every response, in seconds
+    error_rate : float
+        Share of the requests answered with a Modbus exception, between 0 and 1
+    requests : int
+        Amount of requests received since the start or the last ``reset()``
+    errors : int
+        Amount of injected errors since the start or the last ``reset()``
+    rtu : bool
+        Whether the frames are RTU instead of Modbus TCP, like a serial gateway in transparent mode,
+        for meters with the ``rtu_over_tcp`` transport
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 5020, slave_ids: tuple[int] = (1,),
+                 latency: float = 0.0, error_rate: float = 0.0, registers: Optional[SlaveRegisters] = None,
+                 seed: Optional[int] = None, rtu: bool = False):
+        self.host = host
+        self.port = port
+        self.rtu = rtu
+        self.slave_ids = tuple(slave_ids) + tuple(slave_id for slave_id in registers or {} if slave_id not in slave_ids)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._registers = registers or {}
+        self._random = random.Random(seed)
+        self._server = None
+        self._task = None
+
+    def _trace(self, request, *_addr):
+        self.requests += 1
+
+    def _manipulate(self, response):
+        if self.error_rate > 0 and self._random.random() < self.error_rate:
+            self.errors += 1
+            error = ExceptionResponse(response.function_code, ModbusExceptions.SlaveBusy)
+            error.transaction_id = response.transaction_id
+            error.slave_id = response.slave_id
+            return error, False
+        return response, False
+
+    def reset(self):
+        """Resets the request and error counters"""
+        self.requests = 0
+        self.errors = 0
+
+    def _block(self, slave_id: int, read_type: str) -> ModbusSequentialDataBlock:
+        values = [address % 0x10000 for address in range(0x10000)]
+        for address, value in self._registers.get(slave_id, {}).get(read_type, {}).items():
+            values[address] = value
+        return ModbusSequentialDataBlock(0, values)
+
+    async def start(self):
+        """Starts the server and waits until it is listening"""
+        slaves = {
+            slave_id: ModbusSlaveContext(
+                ir=self._block(slave_id, "input"),
+                hr=self._block(slave_id, "holding"),
+                zero_mode=True,
+            )
+            for slave_id in self.slave_ids
+        }
+        context = ModbusServerContext(slaves=slaves, single=False)
+        self._server = ModbusTcpServer(context, framer=ModbusRtuFramer if self.rtu else None,
+                                       address=(self.host, self.port), allow_reuse_address=True,
+                                       handler=_DelayedHandler, request_tracer=self._trace,
+                                       response_manipulator=self._manipulate)
+        self._server.simulator = self
+        self._task = asyncio.create_task(self._server.serve_forever())
+        await self._server.serving
+
+    async def stop(self):
+        """Stops the server"""
+        await self._server.shutdown()
+        self._task.cancel()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
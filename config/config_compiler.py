@@ -0,0 +1,372 @@
+"""Module for compiling the register reference file into validated meters and tables.
+
+The file is parsed with the C LibYAML parser when PyYAML is built with it, then checked once as a whole,
+so configuration errors are reported on loading instead of by the first failing poll.
+A validated file is cached in its loaded form, pickled under the hash of its contents,
+so loading it again takes a single unpickling instead of parsing the YAML.
+
+The cache is stored in ``CACHE_DIR`` and trusted like the configuration itself, so it must not be writable
+by anyone who can't change the configuration.
+
+Checked are:
+    - references of the registers to meters and to register types of their meters
+    - register types, which must be decodable (see ``readings.decoding.TYPES``) and long enough for their type
+    - byte and word orders, read types, addresses, slave ids and request timeouts
+    - transports, with the endpoints and serial line settings they need
+    - partially overlapping registers of the same device, which would be decoded from each other's data
+    - deadbands of the tables and their fields
+    - sampling of the tables, which excludes deadbands
+
+"""
+import hashlib
+import os
+import pickle
+from typing import Optional
+
+import yaml
+
+from readings.data_classes import Deadband, Meter, Register, Sampling, Table
+from readings.decoding import TYPES
+
+# Directory of the compiled files, relative to the working directory at import
+CACHE_DIR = os.getcwd() + "/config/.cache"
+# Amount of compiled files kept in the cache, the least recently written are removed
+CACHE_ENTRIES = 8
+# Changed whenever the compiled form or the checks change, so older compiled files are not used
+CACHE_VERSION = b"5"
+
+MAX_ADDRESS = 0xFFFF
+ORDERS = ("<", ">", "!")
+READ_TYPES = ("input", "holding")
+TRANSPORTS = (Meter.Identification.Transports.TCP, Meter.Identification.Transports.RTU_OVER_TCP,
+              Meter.Identification.Transports.SERIAL)
+PARITIES = ("N", "E", "O")
+
+# Fastest available parser, with the constructors of the configuration classes
+_BaseLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class _Loader(_BaseLoader):
+    pass
+
+
+# The classes register their constructors only with the pure-Python SafeLoader
+for _class in (Meter, Meter.Identification, Meter.RegisterType, Table, Register, Deadband, Sampling):
+    _Loader.add_constructor(_class.yaml_tag, _class.from_yaml)
+
+
+class ConfigError(Exception):
+    """Raised when the register reference file is invalid.
+
+    Attributes
+    ----------
+    problems : list[str]
+        Every problem found, each prefixed with its location in the file
+    """
+    def __init__(self, path: str, problems: list[str]):
+        self.problems = problems
+        super().__init__(f"Invalid register reference file {path}:\n  " + "\n  ".join(problems))
+
+
+def _is_int(value: any, low: int, high: int) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and low <= value <= high
+
+
+def _check_transport(where: str, identification: Meter.Identification, problems: list[str]):
+    transport = identification.transport
+    if transport not in TRANSPORTS:
+        problems.append(f"{where}.transport: expected one of {', '.join(TRANSPORTS)}, got {transport!r}")
+        return
+    if transport == Meter.Identification.Transports.SERIAL:
+        if not isinstance(identification.serial_port, str):
+            problems.append(f"{where}.serial_port: expected the path of a serial port")
+    else:
+        if not isinstance(identification.ip_address, str):
+            problems.append(f"{where}.ip_address: expected an address")
+        if not _is_int(identification.tcp_socket, 1, 0xFFFF):
+            problems.append(f"{where}.tcp_socket: expected a port between 1 and 65535")
+    if transport == Meter.Identification.Transports.TCP:
+        return
+    if not _is_int(identification.baudrate, 1, 10_000_000):
+        problems.append(f"{where}.baudrate: expected bits per second, got {identification.baudrate!r}")
+    if identification.parity not in PARITIES:
+        problems.append(f"{where}.parity: expected one of {', '.join(PARITIES)}, got {identification.parity!r}")
+    if identification.stopbits not in (1, 2):
+        problems.append(f"{where}.stopbits: expected 1 or 2, got {identification.stopbits!r}")
+    if identification.bytesize not in (7, 8):
+        problems.append(f"{where}.bytesize: expected 7 or 8, got {identification.bytesize!r}")
+    gap = identification.inter_frame_gap
+    if gap is not None and (isinstance(gap, bool) or not isinstance(gap, (int, float)) or gap < 0):
+        problems.append(f"{where}.inter_frame_gap: expected a non-negative number of seconds, got {gap!r}")
+
+
+def _check_meter(name: str, meter: any, problems: list[str]):
+    where = f"meters.{name}"
+    if not isinstance(meter, Meter):
+        problems.append(f"{where}: expected a !<meter>")
+        return
+    identification = getattr(meter, "id", None)
+    if not isinstance(identification, Meter.Identification):
+        problems.append(f"{where}.id: expected an !<id>")
+    else:
+        _check_transport(f"{where}.id", identification, problems)
+        if not _is_int(getattr(identification, "slave_id", None), 0, 255):
+            problems.append(f"{where}.id.slave_id: expected a slave id between 0 and 255")
+        timeout = identification.timeout
+        if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float))
+                                    or timeout <= 0):
+            problems.append(f"{where}.id.timeout: expected a positive number of seconds, got {timeout!r}")
+    register_types = getattr(meter, "register_types", None)
+    if not isinstance(register_types, dict):
+        problems.append(f"{where}.register_types: expected a mapping of register types")
+        return
+    for type_name, reg_type in register_types.items():
+        type_where = f"{where}.register_types.{type_name}"
+        if not isinstance(reg_type, Meter.RegisterType):
+            problems.append(f"{type_where}: expected a !<reg_type>")
+            continue
+        if not hasattr(reg_type, "read_type"):
+            # Default of the constructor, which YAML doesn't call
+            reg_type.read_type = "input"
+        if reg_type.read_type not in READ_TYPES:
+            problems.append(f"{type_where}.read_type: expected one of {READ_TYPES}, got {reg_type.read_type!r}")
+        for attribute in ("byteorder", "wordorder"):
+            if getattr(reg_type, attribute, None) not in ORDERS:
+                problems.append(f"{type_where}.{attribute}: expected one of {ORDERS}")
+        length = getattr(reg_type, "length", None)
+        if not _is_int(length, 1, 125):
+            problems.append(f"{type_where}.length: expected between 1 and 125 registers, got {length!r}")
+        elif type_name not in TYPES:
+            problems.append(f"{type_where}: no decoder for type {type_name!r}, supported are {tuple(TYPES)}")
+        elif TYPES[type_name][1] > 2 * length:
+            problems.append(f"{type_where}.length: {length} register(s) can't hold a {TYPES[type_name][1]}-byte "
+                            f"{type_name}, check the register map of the meter for the length and addresses")
+
+
+def _check_deadband(where: str, deadband: any, problems: list[str]):
+    if deadband is None:
+        return
+    if not isinstance(deadband, Deadband):
+        problems.append(f"{where}: expected a !<deadband>")
+        return
+    for attribute in ("absolute", "percent", "max_silence"):
+        value = getattr(deadband, attribute)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            problems.append(f"{where}.{attribute}: expected a non-negative number, got {value!r}")
+    if deadband.mode not in (Deadband.Modes.ROW, Deadband.Modes.COLUMN):
+        problems.append(f"{where}.mode: expected {Deadband.Modes.ROW!r} or {Deadband.Modes.COLUMN!r}, "
+                        f"got {deadband.mode!r}")
+
+
+def _check_sampling(where: str, sampling: any, problems: list[str]):
+    if sampling is None:
+        return
+    if not isinstance(sampling, Sampling):
+        problems.append(f"{where}: expected a !<sampling>")
+        return
+    interval = sampling.interval
+    if isinstance(interval, bool) or not isinstance(interval, (int, float)) or interval <= 0:
+        problems.append(f"{where}.interval: expected a positive number of seconds, got {interval!r}")
+    if not isinstance(sampling.aggregates, list) or not sampling.aggregates:
+        problems.append(f"{where}.aggregates: expected a list of aggregates, got {sampling.aggregates!r}")
+        return
+    for aggregate in sampling.aggregates:
+        if aggregate not in Sampling.AGGREGATES:
+            problems.append(f"{where}.aggregates: unknown aggregate {aggregate!r}, "
+                            f"expected one of {', '.join(Sampling.AGGREGATES)}")
+
+
+def _table_registers(name: str, table: Table, problems: list[str]) -> list[tuple[str, any]]:
+    """Returns the registers of a table with their locations"""
+    where = f"tables.{name}"
+    if not isinstance(getattr(table, "fields", None), dict):
+        problems.append(f"{where}.fields: expected a mapping of fields")
+        return []
+    if table.type == Table.Types.SIMPLE:
+        return [(f"{where}.fields.{field}", register) for field, register in table.fields.items()]
+    if table.type == Table.Types.SYMBOLIC:
+        if not isinstance(table.symbol_field, str):
+            problems.append(f"{where}.symbol_field: required by a symbolic table")
+        registers = []
+        for symbol, fields in table.fields.items():
+            if not isinstance(fields, dict):
+                problems.append(f"{where}.fields.{symbol}: expected a mapping of the fields of the symbol")
+                continue
+            registers += [(f"{where}.fields.{symbol}.{field}", register) for field, register in fields.items()]
+        return registers
+    problems.append(f"{where}.type: expected {Table.Types.SIMPLE!r} or {Table.Types.SYMBOLIC!r}, "
+                    f"got {table.type!r}")
+    return []
+
+
+def _check_register(where: str, register: any, meters: dict[str, Meter],
+                    ranges: dict[tuple, list[tuple[int, int, str, str]]], problems: list[str]):
+    if not isinstance(register, Register):
+        problems.append(f"{where}: expected a !<reg>")
+        return
+    _check_deadband(f"{where}.deadband", register.deadband, problems)
+    meter = meters.get(getattr(register, "meter", None))
+    if meter is None:
+        problems.append(f"{where}.meter: unknown meter {getattr(register, 'meter', None)!r}")
+        return
+    if not isinstance(meter, Meter) or not isinstance(getattr(meter, "register_types", None), dict):
+        # Already reported with the meter
+        return
+    reg_type = meter.register_types.get(getattr(register, "type", None))
+    if not isinstance(reg_type, Meter.RegisterType):
+        problems.append(f"{where}.type: register type {getattr(register, 'type', None)!r} "
+                        f"is not defined in meter {register.meter!r}")
+        return
+    address = getattr(register, "register", None)
+    if not _is_int(address, 0, MAX_ADDRESS):
+        problems.append(f"{where}.register: expected an address between 0 and {MAX_ADDRESS}, got {address!r}")
+        return
+    length = getattr(reg_type, "length", None)
+    if not isinstance(length, int):
+        # Already reported with the register type
+        return
+    if address + length - 1 > MAX_ADDRESS:
+        problems.append(f"{where}.register: {length} register(s) from {address} exceed the address space")
+        return
+    identification = meter.id
+    device = (identification.endpoint, getattr(identification, "slave_id", None), getattr(reg_type, "read_type", None))
+    ranges.setdefault(device, []).append((address, address + length, register.type, where))
+
+
+def _check_overlaps(ranges: dict[tuple, list[tuple[int, int, str, str]]], problems: list[str]):
+    """Reports registers of the same device sharing addresses, unless they are read identically"""
+    for device_ranges in ranges.values():
+        device_ranges.sort()
+        widest = None
+        for current in device_ranges:
+            if widest is not None and current[0] < widest[1] and current[:3] != widest[:3]:
+                problems.append(f"{current[3]}: registers {current[0]}-{current[1] - 1} overlap "
+                                f"{widest[3]} ({widest[0]}-{widest[1] - 1})")
+            if widest is None or current[1] > widest[1]:
+                widest = current
+
+
+def validate(meters: dict[str, Meter], tables: dict[str, Table]) -> list[str]:
+    """Checks the loaded meters and tables, see the module docstring.
+
+    Defaults of the constructors which YAML doesn't call, such as the ``read_type`` of register types,
+    are filled in on the way.
+
+    Parameters
+    ----------
+    meters : dict[str, Meter]
+        Meters of the register reference file
+    tables : dict[str, Table]
+        Tables of the register reference file
+
+    Returns
+    -------
+    list[str]
+        Problems found, each prefixed with its location in the file, empty if the configuration is valid
+    """
+    problems = []
+    for name, meter in meters.items():
+        _check_meter(name, meter, problems)
+    ranges: dict[tuple, list[tuple[int, int, str, str]]] = {}
+    for name, table in tables.items():
+        if not isinstance(table, Table):
+            problems.append(f"tables.{name}: expected a !<table>")
+            continue
+        if "type" not in vars(table):
+            table.type = Table.Types.SIMPLE
+        _check_deadband(f"tables.{name}.deadband", table.deadband, problems)
+        _check_sampling(f"tables.{name}.sampling", table.sampling, problems)
+        sampled = table.sampling is not None
+        if sampled and table.deadband is not None:
+            problems.append(f"tables.{name}.deadband: sampled tables are aggregated, not filtered by a deadband")
+        for where, register in _table_registers(name, table, problems):
+            _check_register(where, register, meters, ranges, problems)
+            if sampled and getattr(register, "deadband", None) is not None:
+                problems.append(f"{where}.deadband: sampled tables are aggregated, not filtered by a deadband")
+    _check_overlaps(ranges, problems)
+    return problems
+
+
+def _parse(path: str, content: bytes) -> (dict[str, Meter], dict[str, Table]):
+    document = yaml.load(content, Loader=_Loader)
+    if not isinstance(document, dict) or not isinstance(document.get("meters"), dict) \
+            or not isinstance(document.get("tables"), dict):
+        raise ConfigError(path, ["expected the mappings meters: and tables: at the root"])
+    return document["meters"], document["tables"]
+
+
+def _read_cache(path: str) -> Optional[tuple[dict[str, Meter], dict[str, Table]]]:
+    try:
+        with open(path, "rb") as stream:
+            return pickle.load(stream)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        # Missing, or written by an incompatible version of the classes
+        return None
+
+
+def _write_cache(path: str, compiled: tuple[dict[str, Meter], dict[str, Table]]):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as stream:
+            pickle.dump(compiled, stream, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+        entries = sorted((entry for entry in os.scandir(CACHE_DIR) if entry.name.endswith(".pickle")),
+                         key=lambda entry: entry.stat().st_mtime_ns, reverse=True)
+        for entry in entries[CACHE_ENTRIES:]:
+            os.remove(entry.path)
+    except OSError as e:
+        # Loading works without the cache, only slower
+        print(f"Failed to cache the compiled register reference file: {e!r}")
+
+
+def compile_config(path: str, validate_config: bool = True,
+                   use_cache: bool = True) -> (dict[str, Meter], dict[str, Table]):
+    """Loads and validates the register reference file, or its compiled form from the cache.
+
+    Every call returns new objects, so callers may modify them.
+
+    Parameters
+    ----------
+    path : str
+        Path to the register reference file
+    validate_config : bool, optional
+        Whether to check the configuration, by default True.
+        Unvalidated configurations are not cached.
+    use_cache : bool, optional
+        Whether to read and write the compiled form, by default True
+
+    Raises
+    ------
+    ConfigError
+        If the configuration is invalid
+    OSError
+        If the file can't be read
+    yaml.YAMLError
+        If the file is not valid YAML
+
+    Returns
+    -------
+    dict[str, Meter]
+        Dictionary containing all meters found in the register reference file
+    dict[str, Table]
+        Dictionary containing all tables found in the register reference file
+    """
+    with open(path, "rb") as stream:
+        content = stream.read()
+    cache_path = None
+    if use_cache:
+        cache_path = f"{CACHE_DIR}/{hashlib.sha256(CACHE_VERSION + content).hexdigest()}.pickle"
+        compiled = _read_cache(cache_path)
+        if compiled is not None:
+            return compiled
+
+    meters, tables = _parse(path, content)
+    if not validate_config:
+        return meters, tables
+    problems = validate(meters, tables)
+    if problems:
+        raise ConfigError(path, problems)
+    if cache_path is not None:
+        _write_cache(cache_path, (meters, tables))
+    return meters, tables
@@ -3,14 +3,14 @@
 Methods
 -------
 load_config
+load_settings
 
 """
 
 import os
 from configparser import ConfigParser
 
-import yaml
-
+from config.config_compiler import compile_config
 from readings.data_classes import Meter, Table
 
 
@@ -18,8 +18,12 @@ class ConfigNotFound(Exception):
     pass
 
 
+# Path to the .ini config file, relative to the working directory at import
+CONFIG_PATH = os.getcwd() + "/config/config.ini"
+
+
 # Base source https://www.postgresqltutorial.com/postgresql-python/connect/
-def load_config(section: str, filename=os.getcwd() + "/config/config.ini"):
+def load_config(section: str, filename=CONFIG_PATH):
     """Loads configuration from a .ini file.
 
     The working directory is assumed to be the root of the project,
@@ -59,6 +63,38 @@ def load_config(section: str, filename=os.getcwd() + "/config/config.ini"):
     return config
 
 
+def load_settings(section: str, defaults: dict[str, any]) -> dict[str, any]:
+    """Loads optional settings from a section of the .ini file, falling back to defaults.
+
+    Values are converted to the types of the corresponding defaults, booleans accept ``true``/``false``,
+    ``yes``/``no``, ``on``/``off`` and ``1``/``0``. Settings which are not specified keep their default values.
+
+    Parameters
+    ----------
+    section : str
+        Section of the config file to load, it doesn't need to exist
+    defaults : dict[str, any]
+        Default values of the settings
+
+    Returns
+    -------
+    dict[str, any]
+        Dictionary of the settings
+    """
+    settings = dict(defaults)
+    try:
+        for name, value in load_config(section=section).items():
+            if name not in defaults:
+                settings[name] = value
+            elif isinstance(defaults[name], bool):
+                settings[name] = value.strip().lower() in ("1", "true", "yes", "on")
+            else:
+                settings[name] = type(defaults[name])(value)
+    except ConfigNotFound:
+        pass
+    return settings
+
+
 def get_register_reference_path():
     """Returns the path to the register reference file
 
@@ -77,8 +113,20 @@ def get_register_reference_path():
         return os.getcwd() + "/config/modbus_registers.yaml"
 
 
-def load_yaml_config() -> (dict[str, Meter], dict[str, Table]):
-    """Loads the register reference file
+def load_yaml_config(validate: bool = True) -> (dict[str, Meter], dict[str, Table]):
+    """Loads the register reference file, validated and from the compiled cache when possible
+
+    See ``config.config_compiler`` for the checks and the cache.
+
+    Parameters
+    ----------
+    validate : bool, optional
+        Whether to check the configuration, by default True
+
+    Raises
+    ------
+    config.config_compiler.ConfigError
+        If the configuration is invalid, with all the problems found
 
     Returns
     -------
@@ -87,9 +135,4 @@ def load_yaml_config() -> (dict[str, Meter], dict[str, Table]):
     dict[str, Table]
         Dictionary containing all tables found in the register reference file
     """
-    path = get_register_reference_path()
-    with open(path, "r") as stream:
-        registers = yaml.safe_load(stream)
-    meters = registers["meters"]
-    tables = registers["tables"]
-    return meters, tables
+    return compile_config(get_register_reference_path(), validate_config=validate)
@@ -27,3 +27,22 @@ CREATE TABLE IF NOT EXISTS panel (
   diverter_position int /* przyjmuje wartości 1, 2, 3, 4 */
 );
 
+
+-- Optional columns, added by QuestDB itself on the first row that has them, as ILP ingestion creates missing columns.
+-- Create them up front when column auto-creation is disabled on the server.
+--
+-- Duration of the reading in seconds, in every table, when the latency_column setting of [acquisition]
+-- in config.ini is set (here to read_latency), see readings/reading_execution.py:
+--   ALTER TABLE phase ADD COLUMN read_latency double;
+--   ALTER TABLE electric_avg ADD COLUMN read_latency double;
+--   ALTER TABLE panel ADD COLUMN read_latency double;
+--
+-- A sampled table stores <field>_<aggregate> columns instead of its fields, one for each aggregate of its
+-- sampling in modbus_registers.yaml, see readings/sampling.py. min, max and mean are doubles, count is a long,
+-- and last is a double for float fields, a long for int and uint8 fields and a boolean for bool16 fields.
+-- For example, for the voltage of phase sampled with all the aggregates:
+--   ALTER TABLE phase ADD COLUMN voltage_min double;
+--   ALTER TABLE phase ADD COLUMN voltage_max double;
+--   ALTER TABLE phase ADD COLUMN voltage_mean double;
+--   ALTER TABLE phase ADD COLUMN voltage_last double;
+--   ALTER TABLE phase ADD COLUMN voltage_count long;
@@ -0,0 +1,235 @@
+"""Module for arbitrating access of meters to their shared Modbus connections.
+
+Each endpoint (see ``Meter.Identification.endpoint``) gets an ``Arbiter``,
+which limits the amount of requests in flight on its connection without blocking the event loop,
+and measures how long each meter waited for and held its access.
+Endpoints of serial buses get a ``BusArbiter``, which also keeps the inter-frame gaps and orders the requests.
+
+"""
+import asyncio
+import time
+from typing import Optional
+
+
+class ContentionStats:
+    """Contention counters of a single meter.
+
+    Attributes
+    ----------
+    acquisitions : int
+        Amount of times the meter got access to its connection
+    contended : int
+        Amount of acquisitions which had to wait for another request
+    wait_time : float
+        Total time spent waiting for access, in seconds
+    max_wait_time : float
+        Longest single wait, in seconds
+    hold_time : float
+        Total time the access was held, in seconds
+    max_hold_time : float
+        Longest single hold, in seconds
+    """
+    def __init__(self):
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.hold_time = 0.0
+        self.max_hold_time = 0.0
+
+    def snapshot(self) -> dict[str, any]:
+        """Returns the counters as a dictionary, including average wait and hold times"""
+        return {
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "wait_time": self.wait_time,
+            "max_wait_time": self.max_wait_time,
+            "wait_time_avg": self.wait_time / self.acquisitions if self.acquisitions else 0.0,
+            "hold_time": self.hold_time,
+            "max_hold_time": self.max_hold_time,
+            "hold_time_avg": self.hold_time / self.acquisitions if self.acquisitions else 0.0,
+        }
+
+
+class _Hold:
+    """Async context manager returned by ``Arbiter.hold()``"""
+    __slots__ = ("arbiter", "stats", "slave_id", "address", "token", "acquired_at")
+
+    def __init__(self, arbiter: "Arbiter", stats: ContentionStats, slave_id: int, address: int):
+        self.arbiter = arbiter
+        self.stats = stats
+        self.slave_id = slave_id
+        self.address = address
+        # Set by the arbiter on acquiring, to release the same access
+        self.token = None
+        self.acquired_at = 0.0
+
+    async def __aenter__(self):
+        arbiter = self.arbiter
+        stats = self.stats
+        if arbiter.busy():
+            stats.contended += 1
+        start = time.perf_counter()
+        arbiter.waiting += 1
+        try:
+            await arbiter._acquire(self)
+        finally:
+            arbiter.waiting -= 1
+        self.acquired_at = time.perf_counter()
+        wait = self.acquired_at - start
+        stats.acquisitions += 1
+        stats.wait_time += wait
+        stats.max_wait_time = max(stats.max_wait_time, wait)
+
+    async def __aexit__(self, *exc_info):
+        hold = time.perf_counter() - self.acquired_at
+        self.arbiter._release(self)
+        stats = self.stats
+        stats.hold_time += hold
+        stats.max_hold_time = max(stats.max_hold_time, hold)
+
+
+class Arbiter:
+    """Limits the amount of concurrent requests on a single connection.
+
+    Backed by an ``asyncio.Semaphore``, which is recreated when used from a different event loop,
+    so the arbiter can outlive the loops created by ``asyncio.run()``.
+    The limit is only enforced within a single event loop, like the connections of ``ConnectionPool``.
+
+    Usage: ::
+
+        async with arbiter.hold("meter_name"):
+            # send the request
+
+    Attributes
+    ----------
+    limit : int
+        Maximum amount of concurrent holders
+    stats : dict[str, ContentionStats]
+        Contention counters per meter name
+    waiting : int
+        Amount of requests currently waiting for access
+    """
+    def __init__(self, limit: int = 1):
+        self.limit = limit
+        self.stats: dict[str, ContentionStats] = {}
+        self.waiting = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        return self._semaphore
+
+    def busy(self) -> bool:
+        """Whether a new request would have to wait"""
+        return self._semaphore is not None and self._loop is asyncio.get_running_loop() and self._semaphore.locked()
+
+    async def _acquire(self, hold: _Hold):
+        hold.token = self._get_semaphore()
+        await hold.token.acquire()
+
+    def _release(self, hold: _Hold):
+        hold.token.release()
+
+    def hold(self, meter: str, slave_id: int = 0, address: int = 0) -> _Hold:
+        """Returns an async context manager holding access to the connection on behalf of the meter.
+
+        The slave id and the address of the request are only used by ``BusArbiter`` to order the requests,
+        others are served in the order of arrival.
+        """
+        stats = self.stats.get(meter)
+        if stats is None:
+            stats = self.stats[meter] = ContentionStats()
+        return _Hold(self, stats, slave_id, address)
+
+
+def inter_frame_gap(baudrate: int) -> float:
+    """Returns the silence required between two frames on a serial bus, in seconds.
+
+    As required by the Modbus serial line specification, 3.5 characters of 11 bits,
+    and a fixed 1.75 ms above 19200 bits per second.
+    """
+    if baudrate > 19200:
+        return 0.00175
+    return 3.5 * 11 / baudrate
+
+
+class BusArbiter(Arbiter):
+    """Sends the requests of all meters on a serial bus one at a time, separated by the inter-frame gap.
+
+    RTU frames carry no transaction ids, so a bus can't have more than one request in flight,
+    also when it's reached through an RTU-over-TCP gateway. Waiting requests are not served
+    in the order of arrival, but those to the slave of the previous request first, then by slave id and address,
+    so the slaves answer in runs instead of the bus turning around between them on every request.
+
+    Attributes
+    ----------
+    gap : float
+        Silence between the end of a response and the next request, in seconds
+    """
+    def __init__(self, gap: float):
+        super().__init__(1)
+        self.gap = gap
+        self._busy = False
+        self._waiters: list[tuple[int, int, int, asyncio.Future]] = []
+        self._sequence = 0
+        self._last_slave: Optional[int] = None
+        # Monotonic time at which the gap after the last response ends
+        self._quiet_at = 0.0
+
+    def _check_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Requests of a closed loop never finish, so their state is dropped
+            self._loop = loop
+            self._busy = False
+            self._waiters = []
+
+    def busy(self) -> bool:
+        return self._loop is asyncio.get_running_loop() and (self._busy or bool(self._waiters))
+
+    async def _acquire(self, hold: _Hold):
+        self._check_loop()
+        if self._busy or self._waiters:
+            future = self._loop.create_future()
+            waiter = (hold.slave_id, hold.address, self._sequence, future)
+            self._sequence += 1
+            self._waiters.append(waiter)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Granted just before the cancellation, pass the bus on
+                    self._grant_next()
+                else:
+                    self._waiters.remove(waiter)
+                raise
+        else:
+            self._busy = True
+        delay = self._quiet_at - time.monotonic()
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self._grant_next()
+                raise
+
+    def _release(self, hold: _Hold):
+        self._last_slave = hold.slave_id
+        self._quiet_at = time.monotonic() + self.gap
+        self._grant_next()
+
+    def _grant_next(self):
+        last_slave = self._last_slave
+        while self._waiters:
+            waiter = min(self._waiters, key=lambda item: (item[0] != last_slave, item[0], item[1], item[2]))
+            self._waiters.remove(waiter)
+            if not waiter[3].done():
+                # The bus stays busy, handed over to the waiter
+                waiter[3].set_result(None)
+                return
+        self._busy = False
@@ -0,0 +1,294 @@
+"""Module for sharing persistent Modbus connections between meters.
+
+Meters behind the same gateway (same transport, IP address and TCP socket) or on the same serial port
+share a single connection, which is kept alive across polls instead of being opened and closed for every read.
+
+Connections are checked before each use and replaced if they were lost or went idle for too long.
+Clients are bound to the event loop they were connected on, so each loop gets its own connections
+and the connections of closed loops are closed.
+Connections are therefore only reused by ``readings.scheduler.AsyncJob`` tasks sharing a long-lived loop.
+The threaded ``Job`` runs every reading in a new loop with ``asyncio.run()``, so it connects anew for each reading.
+Failed connection attempts are retried with an exponential backoff, during which
+requests for the endpoint fail immediately instead of waiting for the connection timeout.
+
+"""
+import asyncio
+import importlib.util
+import threading
+import time
+from typing import Iterable, Optional
+
+from pymodbus import client as mbc
+from pymodbus.framer.rtu_framer import ModbusRtuFramer
+
+from readings.data_classes import Meter
+
+
+class PoolStats:
+    """Counters describing the work done by a ``ConnectionPool``.
+
+    Attributes
+    ----------
+    connects : int
+        Amount of successfully established connections
+    reconnects : int
+        Amount of connections established to replace a previous connection to the same endpoint
+    failed_connects : int
+        Amount of failed connection attempts
+    idle_closed : int
+        Amount of connections closed because of exceeding the idle timeout
+    handshake_time : float
+        Total time spent establishing connections, in seconds
+    """
+    def __init__(self):
+        self.connects = 0
+        self.reconnects = 0
+        self.failed_connects = 0
+        self.idle_closed = 0
+        self.handshake_time = 0.0
+
+
+def endpoint_name(endpoint: tuple) -> str:
+    """Returns a readable name of an endpoint, see ``Meter.Identification.endpoint``"""
+    return ":".join(str(part) for part in endpoint[1:])
+
+
+def _create_client(identification: Meter.Identification, timeout: float) -> mbc.ModbusBaseClient:
+    """Creates a client for the transport of the meter, without connecting it"""
+    transports = Meter.Identification.Transports
+    match identification.transport:
+        case transports.TCP:
+            return mbc.AsyncModbusTcpClient(identification.ip_address, identification.tcp_socket, timeout=timeout,
+                                            # Reconnecting is handled by the pool
+                                            reconnect_delay=0)
+        case transports.RTU_OVER_TCP:
+            return mbc.AsyncModbusTcpClient(identification.ip_address, identification.tcp_socket,
+                                            framer=ModbusRtuFramer, timeout=timeout, reconnect_delay=0)
+        case transports.SERIAL:
+            if importlib.util.find_spec("serial") is None:
+                raise ConnectionError("The serial transport requires the pyserial package")
+            return mbc.AsyncModbusSerialClient(identification.serial_port, framer=ModbusRtuFramer,
+                                               baudrate=identification.baudrate, bytesize=identification.bytesize,
+                                               parity=identification.parity, stopbits=identification.stopbits,
+                                               timeout=timeout, reconnect_delay=0)
+        case _:
+            raise ValueError(f"Transport unsupported by the connection pool: {identification.transport}")
+
+
+class _Connection:
+    """State of the connection to a single endpoint from a single event loop"""
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.client: Optional[mbc.ModbusBaseClient] = None
+        self.loop = loop
+        self.last_used = 0.0
+        self.ever_connected = False
+        self.failures = 0
+        self.next_attempt = 0.0
+        # Prevents concurrent connection attempts to the same endpoint
+        self.connect_lock = asyncio.Lock()
+
+
+def _discard(client: mbc.ModbusBaseClient):
+    """Closes the transport of a client without waiting, also if its event loop is already closed"""
+    client.delay_ms = 0
+    transport, client.transport = client.transport, None
+    if transport is not None:
+        try:
+            transport.abort()
+        except RuntimeError:
+            # The event loop of the transport is closed and can't close the socket anymore
+            sock = getattr(transport, "_sock", None)
+            if sock is not None:
+                sock.close()
+                transport._sock = None
+    try:
+        client.connected = False
+    except AttributeError:
+        # The serial client derives it from its transport
+        pass
+
+
+class ConnectionPool:
+    """Pool of persistent Modbus clients, keyed by the endpoints of the meters, see ``Meter.Identification``.
+
+    Attributes
+    ----------
+    idle_timeout : float
+        Seconds after which an unused connection is closed and replaced on the next use
+    connect_timeout : float
+        Timeout of connecting and of single requests, in seconds
+    backoff_initial : float
+        Seconds to wait before retrying after the first failed connection attempt
+    backoff_max : float
+        Upper limit of the wait between connection attempts, in seconds
+    stats : PoolStats
+        Counters of the pool, see also ``snapshot()``
+    """
+    def __init__(self, idle_timeout: float = 60.0, connect_timeout: float = 3.0,
+                 backoff_initial: float = 1.0, backoff_max: float = 60.0):
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.stats = PoolStats()
+        self._connections: dict[tuple[tuple, asyncio.AbstractEventLoop], _Connection] = {}
+        # Only guards the dictionary, never held while awaiting
+        self._lock = threading.Lock()
+
+    def _get_connection(self, endpoint: tuple, loop: asyncio.AbstractEventLoop) -> _Connection:
+        key = (endpoint, loop)
+        with self._lock:
+            connection = self._connections.get(key)
+            if connection is None:
+                # Drop the connections of loops closed since, e.g. by asyncio.run()
+                for old_key, old in list(self._connections.items()):
+                    if old.loop.is_closed():
+                        if old.client is not None:
+                            _discard(old.client)
+                        del self._connections[old_key]
+                connection = self._connections[key] = _Connection(loop)
+            return connection
+
+    def _loop_connections(self, loop: asyncio.AbstractEventLoop) -> list[_Connection]:
+        with self._lock:
+            return [connection for connection in self._connections.values() if connection.loop is loop]
+
+    @staticmethod
+    def _is_healthy(connection: _Connection) -> bool:
+        client = connection.client
+        return client.connected and client.transport is not None and not client.transport.is_closing()
+
+    async def get(self, identification: Meter.Identification) -> mbc.ModbusBaseClient:
+        """Returns a connected client for the endpoint of a meter, connecting if necessary.
+
+        Parameters
+        ----------
+        identification : Meter.Identification
+            Identification of the meter, with its transport and its endpoint
+
+        Raises
+        ------
+        ConnectionError
+            If the connection could not be established, or the endpoint is still backing off after a failure
+
+        Returns
+        -------
+        mbc.ModbusBaseClient
+            Connected client, shared with other meters on the same endpoint
+        """
+        connection = self._get_connection(identification.endpoint, asyncio.get_running_loop())
+        async with connection.connect_lock:
+            return await self._get(connection, identification)
+
+    async def _get(self, connection: _Connection, identification: Meter.Identification) -> mbc.ModbusBaseClient:
+        now = time.monotonic()
+
+        if connection.client is not None:
+            if not self._is_healthy(connection):
+                _discard(connection.client)
+                connection.client = None
+            elif now - connection.last_used > self.idle_timeout:
+                # Gateways tend to silently drop idle connections, so don't trust it anymore
+                await connection.client.close()
+                connection.client = None
+                self.stats.idle_closed += 1
+            else:
+                connection.last_used = now
+                return connection.client
+
+        name = endpoint_name(identification.endpoint)
+        if now < connection.next_attempt:
+            raise ConnectionError(f"Connection to {name} is backing off "
+                                  f"for {connection.next_attempt - now:.1f} s after {connection.failures} failures")
+
+        client = _create_client(identification, self.connect_timeout)
+        start = time.perf_counter()
+        await client.connect()
+        self.stats.handshake_time += time.perf_counter() - start
+
+        if not client.connected:
+            _discard(client)
+            connection.failures += 1
+            self.stats.failed_connects += 1
+            backoff = min(self.backoff_initial * 2 ** (connection.failures - 1), self.backoff_max)
+            connection.next_attempt = time.monotonic() + backoff
+            raise ConnectionError(f"Failed to connect to {name}, retrying in {backoff:.1f} s")
+
+        self.stats.connects += 1
+        if connection.ever_connected:
+            self.stats.reconnects += 1
+        connection.ever_connected = True
+        connection.failures = 0
+        connection.client = client
+        connection.last_used = time.monotonic()
+        return client
+
+    async def close_idle(self):
+        """Closes connections of the running event loop that exceeded the idle timeout or were lost"""
+        now = time.monotonic()
+        for connection in self._loop_connections(asyncio.get_running_loop()):
+            if connection.client is None:
+                continue
+            if not self._is_healthy(connection):
+                _discard(connection.client)
+                connection.client = None
+            elif now - connection.last_used > self.idle_timeout:
+                client, connection.client = connection.client, None
+                await client.close()
+                self.stats.idle_closed += 1
+
+    async def close_endpoints(self, endpoints: Iterable[tuple]):
+        """Closes and forgets the connections to the endpoints from all event loops.
+
+        Their next use connects again with the current settings of the meter, e.g. after a change of its baudrate.
+
+        Parameters
+        ----------
+        endpoints : Iterable[tuple]
+            Endpoints of the meters, see ``Meter.Identification.endpoint``
+        """
+        endpoints = set(endpoints)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            forgotten = [self._connections.pop(key) for key in list(self._connections) if key[0] in endpoints]
+        for connection in forgotten:
+            if connection.client is None:
+                continue
+            if connection.loop is loop:
+                await connection.client.close()
+            else:
+                # Clients of other loops can't be awaited from this one
+                _discard(connection.client)
+
+    async def close_all(self):
+        """Closes all connections of the running event loop, the pool can still be used afterwards"""
+        for connection in self._loop_connections(asyncio.get_running_loop()):
+            client, connection.client = connection.client, None
+            if client is not None:
+                await client.close()
+
+    def open_connections(self) -> int:
+        """Returns the amount of currently connected clients"""
+        with self._lock:
+            return sum(1 for connection in self._connections.values()
+                       if connection.client is not None and connection.client.connected)
+
+    def snapshot(self) -> dict[str, any]:
+        """Returns the current statistics of the pool.
+
+        Returns
+        -------
+        dict[str, any]
+            Dictionary with the keys ``open_connections``, ``connects``, ``reconnects``, ``failed_connects``,
+            ``idle_closed``, ``handshake_time`` (total, in seconds) and ``handshake_time_avg`` (in seconds)
+        """
+        stats = self.stats
+        return {
+            "open_connections": self.open_connections(),
+            "connects": stats.connects,
+            "reconnects": stats.reconnects,
+            "failed_connects": stats.failed_connects,
+            "idle_closed": stats.idle_closed,
+            "handshake_time": stats.handshake_time,
+            "handshake_time_avg": stats.handshake_time / stats.connects if stats.connects else 0.0,
+        }
@@ -2,7 +2,6 @@
 
 """
 import yaml
-import threading
 
 
 # classes for yaml to deserialize into
@@ -26,14 +25,12 @@ class Meter(yaml.YAMLObject):
     register_types : dict[str, RegisterType]
         Dictionary containing information about register types
     client : pymodbus.client.ModbusBaseClient
-        Lazy-loaded Modbus client for the meter
-    lock : threading.Lock
-        Lock for the client, to prevent concurrent connections
+        Lazy-loaded Modbus client for the meter, shared with meters on the same endpoint
+        through ``readings.connection_pool``
     """
     yaml_loader = yaml.SafeLoader
     yaml_tag = u"meter"
     client = None
-    lock = threading.Lock()
 
     class Identification(yaml.YAMLObject):
         """Class for storing information necessary for connection to a meter.
@@ -44,25 +41,89 @@ class Meter(yaml.YAMLObject):
                 attribute: value
                 # etc
 
+        A meter is reached through one of the transports:
+            - ``tcp`` (default), Modbus TCP at ``ip_address`` and ``tcp_socket``
+            - ``rtu_over_tcp``, RTU frames through a serial gateway at ``ip_address`` and ``tcp_socket``
+            - ``serial``, RTU frames on the serial port ``serial_port``, which requires the pyserial package
+
+        Meters with the same endpoint share its connection. On the serial transports, they also share the bus,
+        whose requests are sent one at a time with an inter-frame gap, see ``readings.arbitration.BusArbiter``.
+
         Attributes
         ----------
         name : str
             Friendly name of the meter
         slave_id : int
             Modbus slave id
-        ip_address : str
-            IP address of the meter
-        tcp_socket : int
-            TCP socket of the meter
+        ip_address : str | None
+            IP address of the meter or its gateway
+        tcp_socket : int | None
+            TCP socket of the meter or its gateway
+        timeout : float | None
+            Timeout of single requests to the meter in seconds, by default the ``request_timeout`` setting
+            of ``readings.modbus``
+        transport : str
+            Transport of the requests, see ``Transports``
+        serial_port : str | None
+            Serial port of the ``serial`` transport, e.g. ``/dev/ttyUSB0``
+        baudrate : int
+            Speed of the serial line in bits per second, also behind an RTU gateway
+        parity : str
+            Parity of the serial line, ``N``, ``E`` or ``O``
+        stopbits : int
+            Stop bits of the serial line
+        bytesize : int
+            Data bits of the serial line
+        inter_frame_gap : float | None
+            Silence between frames on the bus in seconds, by default 3.5 characters at the baudrate
         """
+        class Transports:
+            TCP = "tcp"
+            RTU_OVER_TCP = "rtu_over_tcp"
+            SERIAL = "serial"
+
         yaml_loader = yaml.SafeLoader
         yaml_tag = u"id"
 
-        def __init__(self, name, slave_id, ip_address, tcp_socket):
+        # Defaults of the attributes missing in yaml
+        ip_address = None
+        tcp_socket = None
+        timeout = None
+        transport = Transports.TCP
+        serial_port = None
+        baudrate = 9600
+        parity = "N"
+        stopbits = 1
+        bytesize = 8
+        inter_frame_gap = None
+
+        def __init__(self, name, slave_id, ip_address=None, tcp_socket=None, timeout=None,
+                     transport=Transports.TCP, serial_port=None, baudrate=9600, parity="N", stopbits=1, bytesize=8,
+                     inter_frame_gap=None):
             self.name = name
             self.slave_id = slave_id
             self.ip_address = ip_address
             self.tcp_socket = tcp_socket
+            self.timeout = timeout
+            self.transport = transport
+            self.serial_port = serial_port
+            self.baudrate = baudrate
+            self.parity = parity
+            self.stopbits = stopbits
+            self.bytesize = bytesize
+            self.inter_frame_gap = inter_frame_gap
+
+        @property
+        def endpoint(self) -> tuple:
+            """Connection of the meter, shared by all meters with the same endpoint"""
+            if self.transport == self.Transports.SERIAL:
+                return self.transport, self.serial_port
+            return self.transport, self.ip_address, self.tcp_socket
+
+        @property
+        def on_bus(self) -> bool:
+            """Whether the meter is on a serial bus, directly or behind a gateway"""
+            return self.transport in (self.Transports.RTU_OVER_TCP, self.Transports.SERIAL)
 
     class RegisterType(yaml.YAMLObject):
         """Class for storing information about a register type.
@@ -126,6 +187,25 @@ class Table(yaml.YAMLObject):
                     # etc
 
 
+    Optionally, only changed values are ingested, see ``Deadband``: ::
+
+        tables:
+            table_name: !<table>
+                deadband: !<deadband>
+                    # default of all fields, refer to Deadband class
+                fields:
+                    register_name: !<reg>
+                        deadband: !<deadband>
+                            # overrides the thresholds of the table for a single field
+
+    or, instead, readings are taken more often and aggregated into a single row per reading interval,
+    see ``Sampling``: ::
+
+        tables:
+            table_name: !<table>
+                sampling: !<sampling>
+                    # refer to Sampling class
+
     In a simple table, all fields are ingested to the same row
 
     In a symbolic table, some fields are separated to several rows, per each symbol value.
@@ -143,6 +223,16 @@ class Table(yaml.YAMLObject):
         representing the symbol they will be grouped by
     symbol_field : str
         Name of the field used for storing the symbol in a symbolic table
+    deadband : Deadband | None
+        Change-only ingestion of the fields, all readings are ingested if neither the table nor its fields have one
+    sampling : Sampling | None
+        Sampling of the fields faster than they are ingested, None to ingest every reading
+    plan : readings.modbus.ReadPlan
+        Lazy-compiled plan for reading the fields, created on the first reading of the table
+    change_filter : readings.deadband.ChangeFilter
+        Lazy-created filter of the ingested values, see ``deadband``
+    aggregator : readings.sampling.WindowAggregator
+        Lazy-created aggregator of the sampled values, see ``sampling``
     """
     class Types:
         SIMPLE = "simple"
@@ -154,11 +244,19 @@ class Table(yaml.YAMLObject):
     type = None
     fields = None
     symbol_field = None
-
-    def __init__(self, fields: dict, type: str = Types.SIMPLE, symbol_field: str = None):
+    deadband = None
+    sampling = None
+    plan = None
+    change_filter = None
+    aggregator = None
+
+    def __init__(self, fields: dict, type: str = Types.SIMPLE, symbol_field: str = None,
+                 deadband: "Deadband" = None, sampling: "Sampling" = None):
         self.type = type
         self.fields = fields
         self.symbol_field = symbol_field
+        self.deadband = deadband
+        self.sampling = sampling
 
 
 class Register(yaml.YAMLObject):
@@ -179,23 +277,113 @@ class Register(yaml.YAMLObject):
         Modbus address of the register
     type : str
         Name of the register type, must be defined in the meter's register_types
-        and have an associated decoder in ``_decode_type()`` within ``modbus.py``
+        and have an associated decoder in ``TYPES`` within ``decoding.py``
     meter : str
         Name of the meter the register should be read from
+    deadband : Deadband | None
+        Thresholds of the field, overriding those of the table's deadband
 
     """
     yaml_loader = yaml.SafeLoader
     yaml_tag = u"reg"
 
-    def __init__(self, register: int, type: str, meter: str):
+    deadband = None
+
+    def __init__(self, register: int, type: str, meter: str, deadband: "Deadband" = None):
         self.register = register
         self.type = type
         self.meter = meter
+        self.deadband = deadband
 
     def __int__(self) -> int:
         return self.register
 
 
+class Deadband(yaml.YAMLObject):
+    """Class for storing when values of a table are ingested, instead of on every reading.
+
+    Define in yaml within a table, or within a register to override the thresholds of a single field, with: ::
+
+        deadband: !<deadband>
+            absolute: 0.5       # change of a float which is ingested
+            percent: 1.0        # change of a float which is ingested, relative to the last ingested value
+            max_silence: 900    # seconds after which a value is ingested even if it didn't change
+            mode: row           # "row" or "column"
+
+    A float is ingested once it differs from the last ingested value by more than either threshold,
+    with no thresholds on any change. Other values, such as booleans and integers, are ingested on any change.
+    In the ``row`` mode, the whole row is ingested when any of its fields is, in the ``column`` mode
+    only the ingested fields are, leaving the other columns of the row empty.
+    ``max_silence`` and ``mode`` are only taken from the deadband of the table.
+
+    Attributes
+    ----------
+    absolute : float
+        Absolute threshold, 0 for none
+    percent : float
+        Threshold relative to the last ingested value, in percent, 0 for none
+    max_silence : float
+        Longest time without ingesting a value, in seconds
+    mode : str
+        Whether whole rows or single columns are ingested, either ``row`` or ``column``
+    """
+    class Modes:
+        ROW = "row"
+        COLUMN = "column"
+
+    yaml_loader = yaml.SafeLoader
+    yaml_tag = u"deadband"
+
+    # Defaults of the attributes missing in yaml
+    absolute = 0.0
+    percent = 0.0
+    max_silence = 900.0
+    mode = Modes.ROW
+
+    def __init__(self, absolute: float = 0.0, percent: float = 0.0, max_silence: float = 900.0,
+                 mode: str = Modes.ROW):
+        self.absolute = absolute
+        self.percent = percent
+        self.max_silence = max_silence
+        self.mode = mode
+
+
+class Sampling(yaml.YAMLObject):
+    """Class for storing how a table is sampled between its ingested rows.
+
+    Define in yaml within a table with: ::
+
+        sampling: !<sampling>
+            interval: 1                             # seconds between the readings
+            aggregates: [min, max, mean, last, count]
+
+    The table is read every ``interval`` seconds, and its readings are aggregated over windows
+    of the table's reading interval, aligned to the wall clock, into a single row per window.
+    Each field is ingested to the columns ``<field>_<aggregate>``, e.g. ``voltage_max``.
+    ``min``, ``max`` and ``mean`` are only computed for numbers, ``last`` is the last read value
+    and ``count`` the amount of readings of the field within the window.
+
+    Attributes
+    ----------
+    interval : float
+        Seconds between the readings of the table
+    aggregates : list[str]
+        Aggregates ingested for each field, from ``AGGREGATES``
+    """
+    AGGREGATES = ("min", "max", "mean", "last", "count")
+
+    yaml_loader = yaml.SafeLoader
+    yaml_tag = u"sampling"
+
+    # Defaults of the attributes missing in yaml
+    interval = 1.0
+    aggregates = list(AGGREGATES)
+
+    def __init__(self, interval: float = 1.0, aggregates: list[str] = None):
+        self.interval = interval
+        self.aggregates = list(self.AGGREGATES) if aggregates is None else aggregates
+
+
 class DataTemplates:
     """Contains expected keys and types of the data receieved from the meters."""
     PHASE = {
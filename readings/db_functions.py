@@ -6,25 +6,443 @@ Requires a configuration file in the config folder with the following format: ::
     host = # IP address of the QuestDB server
     port = # Port of the QuestDB's InfluxDB line protocol
 
+Rows are not sent one by one, but accumulated in a buffer shared by all tables
+and sent over a long-lived connection, see ``IngestionService``.
+The thresholds for sending the buffer can be configured with: ::
+
+    [questdb_ingest]
+    flush_rows = # Amount of buffered rows
+    flush_bytes = # Size of the buffer in bytes
+    flush_interval = # Age of the oldest buffered row in seconds
+
+Rows which could not be sent are kept on disk and replayed once QuestDB is reachable again,
+see ``readings.spool``. The spool can be configured in the same section with: ::
+
+    spool_dir = # Directory of the spool, by default the spool folder in the working directory
+    spool_max_bytes = # Size cap of the spool, the oldest rows are evicted above it
+    spool_segment_bytes = # Size of a single spool file
+    retry_interval = # Seconds between reconnection attempts, rows go straight to the spool in between
+
+Worker processes, see ``readings.sharding``, each keep their own spool in a ``worker-<index>`` subdirectory,
+so they never write or replay the segments of each other. Segments left over by workers which no longer exist
+are merged into the spools of the remaining ones, see ``merge_worker_spools()``.
+
 """
+import asyncio
+import os
+import re
+import socket
 import sys
+import threading
+import time
 from typing import Optional
 
-from questdb.ingress import Sender, IngressError, TimestampMicros
+from questdb.ingress import Sender, Buffer, IngressError, TimestampMicros
 
-from config.config_loading import load_config
+from config.config_loading import load_config, load_settings
+from readings import metrics
+from readings.spool import Spool
+
+# Default values of the ingestion settings, see the module docstring
+DEFAULT_SETTINGS = {
+    "flush_rows": 1000,
+    "flush_bytes": 64 * 1024,
+    "flush_interval": 5.0,
+    "spool_dir": "",
+    "spool_max_bytes": 100 * 1024 * 1024,
+    "spool_segment_bytes": 4 * 1024 * 1024,
+    "retry_interval": 10.0,
+}
+# Approximate size of the batches replayed from the spool
+REPLAY_CHUNK_BYTES = 1024 * 1024
+# Timeout of the connection used for replaying the spool, in seconds
+REPLAY_TIMEOUT = 15.0
+# Name of the spool subdirectory of a worker process
+WORKER_SPOOL_DIR = "worker-{}"
+WORKER_SPOOL_PATTERN = re.compile(r"worker-(\d+)")
 
 # Global variables
 config = None
+# Shared ingestion service, lazy-loaded
+service: Optional["IngestionService"] = None
+# Flush scheduled by flush_async(), shared by callers until it starts
+_pending_flush: Optional[asyncio.Task] = None
+# Index of the worker process whose spool this process uses, None for the main spool
+spool_worker: Optional[int] = None
+
+# Metrics recorded on every flush
+FLUSH_SECONDS = metrics.registry.histogram(
+    "ingest_flush_duration_seconds", "Duration of flushes to QuestDB, including spooling on failure")
+FLUSH_ROWS = metrics.registry.histogram(
+    "ingest_flush_rows", "Amount of rows per flush", buckets=(1, 5, 10, 50, 100, 500, 1000, 5000, 10000))
+FLUSH_BYTES = metrics.registry.histogram(
+    "ingest_flush_bytes", "Size of the flushed buffer in bytes",
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576))
+
+
+class IngestStats:
+    """Counters describing the work done by an ``IngestionService``.
+
+    Attributes
+    ----------
+    rows : int
+        Amount of rows added to the buffer
+    flushes : int
+        Amount of successful flushes
+    flushed_rows : int
+        Amount of rows sent to QuestDB
+    flushed_bytes : int
+        Amount of bytes sent to QuestDB
+    failed_flushes : int
+        Amount of flushes which failed
+    dropped_rows : int
+        Amount of rows lost because of failed flushes without a spool
+    connects : int
+        Amount of connections made to QuestDB
+    flush_time : float
+        Total time spent flushing, in seconds
+    """
+    def __init__(self):
+        self.rows = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.flushed_bytes = 0
+        self.failed_flushes = 0
+        self.dropped_rows = 0
+        self.connects = 0
+        self.flush_time = 0.0
+
+
+class IngestionService:
+    """Buffers rows of all tables and sends them to QuestDB in batches over a persistent connection.
+
+    The buffer is flushed when ``flush()`` is called, which ``ingest()`` schedules once any of the thresholds
+    is reached. Adding rows never waits for the network: a flush only swaps in a fresh buffer while holding
+    the lock shared with ``row()``, and sends the full one afterwards. Flushes run one at a time,
+    so ``close()`` waits for a flush in flight before flushing the rest.
+    If sending fails, the connection is dropped and the rows are written to the spool.
+    Until ``retry_interval`` passes, following flushes go straight to the spool.
+    After the next successful flush, the spool is replayed in a background thread over a separate connection,
+    so the replay doesn't delay the live readings.
+
+    Safe to use from several threads.
+
+    Attributes
+    ----------
+    host : str
+        Address of the QuestDB server
+    port : int
+        Port of the QuestDB's InfluxDB line protocol
+    flush_rows : int
+        Amount of buffered rows which triggers a flush
+    flush_bytes : int
+        Size of the buffer in bytes which triggers a flush
+    flush_interval : float
+        Age of the oldest buffered row in seconds which triggers a flush on the next added row
+    spool : Spool | None
+        Spool for the rows which could not be sent, they are dropped if None
+    retry_interval : float
+        Seconds to wait after a failure before connecting again
+    stats : IngestStats
+        Counters of the service
+    """
+    def __init__(self, host: str, port: int, flush_rows: int = 1000, flush_bytes: int = 64 * 1024,
+                 flush_interval: float = 5.0, spool: Optional[Spool] = None, retry_interval: float = 10.0):
+        self.host = host
+        self.port = int(port)
+        self.flush_rows = flush_rows
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.spool = spool
+        self.retry_interval = retry_interval
+        self.stats = IngestStats()
+        self._sender: Optional[Sender] = None
+        self._buffer = Buffer()
+        self._rows = 0
+        self._oldest = 0.0
+        self._retry_at = 0.0
+        self._replay_thread: Optional[threading.Thread] = None
+        self._closed = False
+        # Guards the buffer, held only briefly, so adding rows doesn't wait for a flush
+        self._lock = threading.Lock()
+        # Serializes the flushes, guards the sender and the spool
+        self._send_lock = threading.Lock()
+
+    def row(self, table: str, columns: dict[str, any], symbols: Optional[dict[str, str]] = None) -> bool:
+        """Adds a row to the buffer, without sending it.
+
+        Parameters
+        ----------
+        table : str
+            The table to ingest the row into
+        columns : dict[str, any]
+            The columns of the row, including the timestamp
+        symbols : dict[str, str], optional
+            The symbols of the row
+
+        Returns
+        -------
+        bool
+            Whether a threshold is reached and the buffer should be flushed
+        """
+        with self._lock:
+            self._buffer.row(table, symbols=symbols, columns=columns)
+            if self._rows == 0:
+                self._oldest = time.monotonic()
+            self._rows += 1
+            self.stats.rows += 1
+            return (self._rows >= self.flush_rows
+                    or len(self._buffer) >= self.flush_bytes
+                    or time.monotonic() - self._oldest >= self.flush_interval)
+
+    def flush(self):
+        """Sends all buffered rows to QuestDB.
+
+        Blocks while connecting and sending, rows can be added from other threads in the meantime.
+        """
+        with self._send_lock:
+            self._flush()
+
+    def _flush(self):
+        # Called with the send lock held
+        with self._lock:
+            if self._rows == 0:
+                return
+            buffer, rows = self._buffer, self._rows
+            self._buffer, self._rows = Buffer(), 0
+        size = len(buffer)
+        start = time.perf_counter()
+        try:
+            if self._sender is None and time.monotonic() < self._retry_at:
+                # QuestDB failed recently, don't wait for another timeout
+                self._save_buffer(buffer, rows)
+                return
+            try:
+                if self._sender is None:
+                    sender = Sender(self.host, self.port, auto_flush=False)
+                    sender.connect()
+                    self._sender = sender
+                    self.stats.connects += 1
+                self._sender.flush(buffer, clear=False)
+            except IngressError as e:
+                sys.stderr.write(f"Failed to send {rows} rows to QuestDB: {e}\n")
+                self.stats.failed_flushes += 1
+                self._retry_at = time.monotonic() + self.retry_interval
+                self._disconnect()
+                self._save_buffer(buffer, rows)
+            else:
+                self.stats.flushes += 1
+                self.stats.flushed_rows += rows
+                self.stats.flushed_bytes += size
+                if self._closed:
+                    # Rows added after close(), e.g. by a flush scheduled before it, don't reopen the connection
+                    self._disconnect()
+                else:
+                    self._start_replay()
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stats.flush_time += elapsed
+            FLUSH_SECONDS.observe(elapsed)
+            FLUSH_ROWS.observe(rows)
+            FLUSH_BYTES.observe(size)
+
+    def _save_buffer(self, buffer: Buffer, rows: int):
+        """Writes the rows of a buffer to the spool, or drops them if there is none"""
+        if self.spool is None:
+            self.stats.dropped_rows += rows
+        else:
+            self.spool.append(str(buffer).encode())
+
+    def _start_replay(self):
+        """Starts replaying the spool in a background thread, unless it's empty or already being replayed"""
+        if self.spool is None or (self._replay_thread is not None and self._replay_thread.is_alive()):
+            return
+        if self.spool.pending_bytes() == 0:
+            return
+        self._replay_thread = threading.Thread(target=self._replay, name="spool-replay", daemon=True)
+        self._replay_thread.start()
+
+    def _replay(self):
+        try:
+            # The line protocol over TCP is plain text, so the spooled lines are sent as they are
+            with socket.create_connection((self.host, self.port), timeout=REPLAY_TIMEOUT) as connection:
+                self.spool.replay(connection.sendall, REPLAY_CHUNK_BYTES)
+        except OSError as e:
+            sys.stderr.write(f"Failed to replay the spool to QuestDB: {e}\n")
+
+    def _disconnect(self):
+        if self._sender is not None:
+            try:
+                self._sender.close(flush=False)
+            except IngressError:
+                pass
+            self._sender = None
+
+    def close(self):
+        """Flushes the remaining rows and closes the connection.
+
+        Waits for a flush in flight and a running replay of the spool to finish, rows which are not sent stay
+        in the spool. Rows added afterwards are still sent by the next flush, without keeping the connection open.
+        """
+        with self._send_lock:
+            self._closed = True
+            self._flush()
+            self._disconnect()
+            replay_thread = self._replay_thread
+        if replay_thread is not None:
+            replay_thread.join()
+        if self.spool is not None:
+            self.spool.close()
+
+    def snapshot(self) -> dict[str, any]:
+        """Returns the counters of the service as a dictionary, including the amount of buffered rows"""
+        stats = self.stats
+        return {
+            "buffered_rows": self._rows,
+            "rows": stats.rows,
+            "flushes": stats.flushes,
+            "flushed_rows": stats.flushed_rows,
+            "flushed_bytes": stats.flushed_bytes,
+            "failed_flushes": stats.failed_flushes,
+            "dropped_rows": stats.dropped_rows,
+            "connects": stats.connects,
+            "flush_time": stats.flush_time,
+            **self._spool_snapshot(),
+        }
+
+    def _spool_snapshot(self) -> dict[str, any]:
+        if self.spool is None:
+            return {}
+        stats = self.spool.stats
+        return {
+            "spool_bytes": self.spool.pending_bytes(),
+            "spooled_rows": stats.spooled_rows,
+            "replayed_rows": stats.replayed_rows,
+            "evicted_rows": stats.evicted_rows,
+        }
+
+
+def _spool_dir(settings: dict[str, any], worker: Optional[int] = None) -> str:
+    """Returns the spool directory of the main process, or of a worker process"""
+    directory = settings["spool_dir"] or os.getcwd() + "/spool"
+    return directory if worker is None else os.path.join(directory, WORKER_SPOOL_DIR.format(worker))
+
+
+def _open_spool(settings: dict[str, any], worker: Optional[int] = None) -> Spool:
+    return Spool(
+        _spool_dir(settings, worker),
+        max_bytes=settings["spool_max_bytes"],
+        segment_bytes=settings["spool_segment_bytes"],
+    )
+
+
+def use_worker_spool(worker: int):
+    """Makes this process use the spool of a worker process, must be called before any row is ingested.
+
+    Raises
+    ------
+    RuntimeError
+        If the ingestion service was already created with another spool
+    """
+    global spool_worker
+    if service is not None:
+        raise RuntimeError("The ingestion service is already running, its spool can't be changed")
+    spool_worker = worker
+
+
+def merge_worker_spools(workers: int) -> int:
+    """Moves the segments of the spools of worker processes which no longer exist into the remaining spools.
+
+    Must be called while no worker process is running, segments of worker ``index`` are moved
+    to worker ``index % workers``, or to the main spool if ``workers`` is 0.
+
+    Parameters
+    ----------
+    workers : int
+        Amount of worker processes about to be started
+
+    Returns
+    -------
+    int
+        Amount of moved segments
+    """
+    settings = load_settings("questdb_ingest", DEFAULT_SETTINGS)
+    base = _spool_dir(settings)
+    if not os.path.isdir(base):
+        return 0
+    moved = 0
+    for name in sorted(os.listdir(base)):
+        match = WORKER_SPOOL_PATTERN.fullmatch(name)
+        if match is None or int(match.group(1)) < workers:
+            continue
+        spool = _open_spool(settings, int(match.group(1)) % workers if workers else None)
+        moved += spool.adopt(os.path.join(base, name))
+        spool.close()
+    return moved
+
+
+def _get_service() -> IngestionService:
+    """Lazily creates the ingestion service from the configuration file.
+
+    The main process first takes over the spools left by worker processes, see ``merge_worker_spools()``.
+    """
+    global config, service
+    if service is None:
+        if config is None:
+            config = load_config(section="questdb_influx")
+        settings = load_settings("questdb_ingest", DEFAULT_SETTINGS)
+        if spool_worker is None:
+            merge_worker_spools(0)
+        spool = _open_spool(settings, spool_worker)
+        service = IngestionService(
+            config["host"], config["port"],
+            flush_rows=settings["flush_rows"],
+            flush_bytes=settings["flush_bytes"],
+            flush_interval=settings["flush_interval"],
+            spool=spool,
+            retry_interval=settings["retry_interval"],
+        )
+    return service
+
+
+@metrics.registry.collector
+def _collect_metrics() -> list[metrics.Family]:
+    """Exposes the counters of the ingestion service and the depth of its buffer and spool"""
+    if service is None:
+        return []
+    stats = service.snapshot()
+    families = [
+        ("ingest_buffered_rows", "gauge", "Amount of rows waiting in the buffer", [({}, stats["buffered_rows"])]),
+        ("ingest_rows_total", "counter", "Amount of rows added to the buffer", [({}, stats["rows"])]),
+        ("ingest_flushed_rows_total", "counter", "Amount of rows sent to QuestDB", [({}, stats["flushed_rows"])]),
+        ("ingest_failed_flushes_total", "counter", "Amount of failed flushes", [({}, stats["failed_flushes"])]),
+        ("ingest_dropped_rows_total", "counter", "Amount of rows lost without a spool", [({}, stats["dropped_rows"])]),
+        ("ingest_connects_total", "counter", "Amount of connections made to QuestDB", [({}, stats["connects"])]),
+    ]
+    if "spool_bytes" in stats:
+        families += [
+            ("ingest_spool_bytes", "gauge", "Size of the rows waiting in the spool", [({}, stats["spool_bytes"])]),
+            ("ingest_spooled_rows_total", "counter", "Amount of rows written to the spool",
+             [({}, stats["spooled_rows"])]),
+            ("ingest_replayed_rows_total", "counter", "Amount of rows replayed from the spool",
+             [({}, stats["replayed_rows"])]),
+            ("ingest_evicted_rows_total", "counter", "Amount of rows evicted from the full spool",
+             [({}, stats["evicted_rows"])]),
+        ]
+    return families
 
 
 def ingest(table: str, reading: dict[str, any],
-           timestamp=TimestampMicros.now(),
+           timestamp: Optional[TimestampMicros] = None,
            symbols: Optional[dict[str, str]] = None):
     """Ingests data from a reading into QuestDB.
 
     Verifying that the data has the format correct to the table is the responsibility of the caller.
 
+    The row is buffered and sent together with other rows, call ``flush()`` to send it immediately.
+    Once a threshold of the buffer is reached, a flush is scheduled on the running event loop,
+    see ``flush_async()``, or done right away when called outside of one.
+
     Parameters
     ----------
     table : str
@@ -33,6 +451,7 @@ def ingest(table: str, reading: dict[str, any],
         The data to ingest. The keys are expected to be the column names.
     timestamp : TimestampMicros, optional
         The timestamp to use for the data. Defaults to the current time.
+        Pass the time of taking the reading where it's known, see ``reading_execution.PollTiming``.
     symbols : dict[str, str], optional
         The symbols to categorize the data by. Defaults to None.
 
@@ -50,32 +469,84 @@ def ingest(table: str, reading: dict[str, any],
 
 
     """
+    if timestamp is None:
+        timestamp = TimestampMicros.now()
     if symbols is None:
         symbols = {}
-    global config
-    if config is None:
-        config = load_config(section="questdb_influx")
+    if _get_service().row(
+        table,
+        symbols=symbols,
+        columns={
+            "ts": timestamp,
+            **reading,
+        },
+    ):
+        _schedule_flush()
+
+
+def flush():
+    """Sends all buffered readings to QuestDB.
+
+    Blocks until the data is sent, use ``flush_async()`` from a coroutine.
+    """
+    if service is not None:
+        service.flush()
+
+
+async def _flush_soon():
+    global _pending_flush
+    # Let the other tasks of the current poll cycle add their rows first
+    await asyncio.sleep(0)
+    if _pending_flush is asyncio.current_task():
+        # Rows added from now on need another flush
+        _pending_flush = None
+    await asyncio.to_thread(service.flush)
+
+
+def _schedule_flush() -> Optional[asyncio.Task]:
+    """Schedules a flush on the running event loop, shared with the flushes already scheduled.
+
+    Flushes right away when there is no running event loop, i.e. outside of the event loop's thread.
+    """
+    global _pending_flush
     try:
-        with Sender(**config) as sender:
-            print(reading)
-            sender.row(
-                table,
-                symbols=symbols,
-                columns={
-                    "ts": timestamp,
-                    **reading,
-                },
-            )
-            sender.flush()
-    except IngressError as e:
-        sys.stderr.write(f"Failed to send data to QuestDB: {e}\n")
-
-
-def ingest_phases(phases: list[dict[str, any]]):
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        service.flush()
+        return None
+    if _pending_flush is None or _pending_flush.get_loop() is not loop:
+        _pending_flush = loop.create_task(_flush_soon())
+    return _pending_flush
+
+
+async def flush_async():
+    """Sends all buffered readings to QuestDB in a worker thread.
+
+    Callers arriving before the flush starts share it, so tables finishing their polls together
+    are sent in a single batch.
+    """
+    if service is None:
+        return
+    await asyncio.shield(_schedule_flush())
+
+
+def close():
+    """Sends all buffered readings to QuestDB and closes the connection"""
+    if service is not None:
+        service.close()
+
+
+def ingest_stats() -> dict[str, any]:
+    """Returns the counters of the ingestion service, see ``IngestionService.snapshot()``"""
+    return _get_service().snapshot()
+
+
+def ingest_phases(phases: list[dict[str, any]], timestamp: Optional[TimestampMicros] = None):
     """Ingests a list of specifically phase readings into QuestDB.
     """
     i = 1
-    ts = TimestampMicros.now()
+    ts = timestamp if timestamp is not None else TimestampMicros.now()
     for phase in phases:
         ingest("phase", phase, timestamp=ts, symbols={"phase": str(i)})
         i += 1
+    flush()
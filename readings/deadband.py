@@ -0,0 +1,140 @@
+"""Module for ingesting only the values which changed since they were last ingested.
+
+Tables with a deadband, see ``readings.data_classes.Deadband``, get a ``ChangeFilter`` remembering
+the last ingested value of every field. A reading is compared with those values instead of with the previous
+reading, so slow drifts are still ingested once they exceed the thresholds, and every value is ingested
+at least once per ``max_silence``, so the series can be reconstructed by carrying the values forward.
+
+The filter only affects the ingestion, the latest values and the live streams get every reading.
+
+"""
+from typing import Optional
+
+from readings import metrics
+from readings.data_classes import Deadband, Table
+
+SUPPRESSED = metrics.registry.counter(
+    "ingest_suppressed_values_total", "Amount of read values not ingested because they didn't change", ("table",))
+
+
+class _RowState:
+    """Last ingested values of a single row (a symbol of a symbolic table)"""
+    __slots__ = ("values", "written_at", "row_written_at")
+
+    def __init__(self):
+        self.values: dict[str, any] = {}
+        # Timestamps of the last ingestion of each field, in microseconds
+        self.written_at: dict[str, int] = {}
+        self.row_written_at = 0
+
+
+def _changed(band: tuple[float, float], new: any, old: any) -> bool:
+    if old is None:
+        return True
+    absolute, percent = band
+    if type(new) is not float or not (absolute or percent):
+        return new != old
+    difference = abs(new - old)
+    if difference != difference:
+        # NaN on either side
+        return True
+    return bool(absolute and difference > absolute or percent and difference > abs(old) * percent / 100)
+
+
+class ChangeFilter:
+    """Decides which values of the readings of a table are ingested.
+
+    Attributes
+    ----------
+    enabled : bool
+        Whether the table or any of its fields has a deadband, otherwise all values are ingested
+    max_silence : int
+        Longest time without ingesting a value, in microseconds
+    mode : str
+        Whether whole rows or single columns are ingested, see ``Deadband.Modes``
+    """
+    def __init__(self, table: Table):
+        default = table.deadband or Deadband()
+        self.max_silence = int(default.max_silence * 1e6)
+        self.mode = default.mode
+        # Thresholds as (absolute, percent) per field name, or per (symbol, field name) in a symbolic table
+        self._bands: dict[tuple[Optional[str], str], tuple[float, float]] = {}
+        if table.type == Table.Types.SYMBOLIC:
+            registers = {(str(symbol), name): register
+                         for symbol, fields in table.fields.items() for name, register in fields.items()}
+        else:
+            registers = {(None, name): register for name, register in table.fields.items()}
+        for key, register in registers.items():
+            deadband = register.deadband or default
+            self._bands[key] = (float(deadband.absolute), float(deadband.percent))
+        self.enabled = table.deadband is not None or any(register.deadband is not None
+                                                        for register in registers.values())
+        self._rows: dict[Optional[str], _RowState] = {}
+
+    def filter(self, values: dict[str, any], timestamp: int, symbol: Optional[str] = None,
+               table_name: str = "") -> Optional[dict[str, any]]:
+        """Returns the values of a reading which should be ingested and remembers them.
+
+        Parameters
+        ----------
+        values : dict[str, any]
+            Values of the reading, fields other than those of the table (such as the latency) are ingested
+            along with the filtered fields, but never on their own
+        timestamp : int
+            Timestamp of the reading, in microseconds since the epoch
+        symbol : str, optional
+            Symbol of the row in a symbolic table
+        table_name : str, optional
+            Name of the table, used as the label of the metrics
+
+        Returns
+        -------
+        dict[str, any] | None
+            Values to ingest, None if nothing should be ingested
+        """
+        state = self._rows.get(symbol)
+        if state is None:
+            state = self._rows[symbol] = _RowState()
+        bands = self._bands
+        if self.mode == Deadband.Modes.COLUMN:
+            return self._filter_columns(state, values, timestamp, symbol, table_name)
+
+        fields = [(name, value, bands[(symbol, name)]) for name, value in values.items() if (symbol, name) in bands]
+        if (timestamp - state.row_written_at < self.max_silence
+                and not any(value is not None and _changed(band, value, state.values.get(name))
+                            for name, value, band in fields)):
+            SUPPRESSED.inc((table_name,), len(fields))
+            return None
+        for name, value, _ in fields:
+            if value is not None:
+                state.values[name] = value
+        state.row_written_at = timestamp
+        return values
+
+    def _filter_columns(self, state: _RowState, values: dict[str, any], timestamp: int, symbol: Optional[str],
+                        table_name: str) -> Optional[dict[str, any]]:
+        bands = self._bands
+        ingested = {}
+        others = {}
+        for name, value in values.items():
+            band = bands.get((symbol, name))
+            if band is None:
+                others[name] = value
+            elif value is not None and (
+                    timestamp - state.written_at.get(name, 0) >= self.max_silence
+                    or _changed(band, value, state.values.get(name))):
+                ingested[name] = value
+                state.values[name] = value
+                state.written_at[name] = timestamp
+        SUPPRESSED.inc((table_name,), len(values) - len(others) - len(ingested))
+        if not ingested:
+            return None
+        ingested.update(others)
+        return ingested
+
+
+def get_filter(table: Table) -> Optional[ChangeFilter]:
+    """Lazily creates the filter of a table, returns None if neither the table nor its fields have a deadband"""
+    if table.change_filter is None:
+        table.change_filter = ChangeFilter(table)
+    return table.change_filter if table.change_filter.enabled else None
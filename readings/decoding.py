@@ -0,0 +1,179 @@
+"""Module for decoding blocks of registers with precompiled ``struct`` formats.
+
+Produces the same values as decoding each field with ``pymodbus.payload.BinaryPayloadDecoder``,
+but the formats, offsets and converters are worked out once, when the read is planned, instead of for every value.
+
+Supported types:
+    - ``"float"`` (4 bytes) ``-> float``
+    - ``"int"`` (2 bytes) ``-> int``
+    - ``"uint8"`` (1 byte) ``-> int``
+    - ``"bool16"`` (2 bytes) ``-> bool``
+
+"""
+import struct
+from typing import Callable, Optional
+
+from readings.data_classes import Meter, Register
+
+# Decoded types, as tuples of the struct code, the size in bytes and a converter applied to the unpacked value
+TYPES: dict[str, tuple[str, int, Optional[Callable]]] = {
+    "float": ("f", 4, None),
+    "int": ("h", 2, None),
+    "uint8": ("B", 1, None),
+    "bool16": ("H", 2, bool),
+}
+
+
+def _is_little(order: str) -> bool:
+    if order == "<":
+        return True
+    if order in (">", "!"):
+        return False
+    raise ValueError(f"Unsupported byte or word order: {order}")
+
+
+def _byte_order(size: int, reg_type: Meter.RegisterType) -> tuple[str, Optional[tuple[int, ...]]]:
+    """Works out how to unpack a value from the big-endian bytes of its registers.
+
+    Mirrors ``BinaryPayloadDecoder``: words are reversed for a little-endian word order,
+    and bytes within each word are swapped for a little-endian byte order.
+
+    Parameters
+    ----------
+    size : int
+        Size of the value in bytes
+    reg_type : Meter.RegisterType
+        Register type with the byte and word order
+
+    Returns
+    -------
+    str
+        Struct byte order prefix
+    tuple[int, ...] | None
+        Order in which the bytes need to be rearranged before unpacking, if a prefix alone can't express it
+    """
+    if size == 1:
+        # A single byte, taken from the high byte of the register regardless of the order
+        return ">", None
+    byte_little = _is_little(reg_type.byteorder)
+    words = range(size // 2)
+    if size > 2 and _is_little(reg_type.wordorder):
+        words = reversed(words)
+    permutation = []
+    for word in words:
+        permutation += [2 * word + 1, 2 * word] if byte_little else [2 * word, 2 * word + 1]
+    if permutation == list(range(size)):
+        return ">", None
+    if permutation == list(reversed(range(size))):
+        return "<", None
+    return ">", tuple(permutation)
+
+
+class _Field:
+    """A single value unpacked from the payload of a block"""
+    __slots__ = ("key", "format", "offset", "permutation", "converter")
+
+    def __init__(self, key, format: struct.Struct, offset: int, permutation: Optional[tuple[int, ...]],
+                 converter: Optional[Callable]):
+        self.key = key
+        self.format = format
+        self.offset = offset
+        self.permutation = permutation
+        self.converter = converter
+
+    def decode(self, payload: bytes) -> any:
+        if self.permutation is None:
+            value = self.format.unpack_from(payload, self.offset)[0]
+        else:
+            offset = self.offset
+            value = self.format.unpack(bytes(payload[offset + i] for i in self.permutation))[0]
+        return value if self.converter is None else self.converter(value)
+
+
+class BlockDecoder:
+    """Decodes all fields of a block of registers.
+
+    If the fields don't overlap and share a byte order, the whole block is unpacked
+    with a single ``struct.Struct.unpack_from()``, with padding over the unused bytes.
+    Otherwise, each field is unpacked on its own, still with a precompiled format.
+
+    Attributes
+    ----------
+    count : int
+        Amount of registers in the block
+    single : bool
+        Whether the block is unpacked with a single format
+    """
+    def __init__(self, start: int, count: int, fields: list[tuple[any, Register, Meter.RegisterType]]):
+        """Compiles the decoder.
+
+        Parameters
+        ----------
+        start : int
+            Address of the first register in the block
+        count : int
+            Amount of registers in the block
+        fields : list[tuple[any, Register, Meter.RegisterType]]
+            Fields of the block, as tuples of the field name, its register and its register type
+
+        Raises
+        ------
+        ValueError
+            If a type is not supported, or takes more registers than its register type defines
+        """
+        self.count = count
+        self._payload = struct.Struct(f">{count}H")
+        self._fields: list[_Field] = []
+
+        parts = []
+        prefix = None
+        position = 0
+        self.single = True
+        for key, register, reg_type in sorted(fields, key=lambda field: field[1].register):
+            if register.type not in TYPES:
+                raise ValueError(f"Register type unsupported by the decoder: {register.type}")
+            code, size, converter = TYPES[register.type]
+            if size > 2 * reg_type.length:
+                raise ValueError(f"Register type '{register.type}' takes {size} bytes, "
+                                 f"but its length is {reg_type.length} registers")
+            order, permutation = _byte_order(size, reg_type)
+            offset = 2 * (register.register - start)
+            self._fields.append(_Field(key, struct.Struct(order + code), offset, permutation, converter))
+
+            if permutation is not None or offset < position or (size > 1 and prefix not in (None, order)):
+                self.single = False
+            if size > 1:
+                prefix = order
+            if offset > position:
+                parts.append(f"{offset - position}x")
+            parts.append(code)
+            position = offset + size
+
+        if self.single:
+            self._format = struct.Struct((prefix or ">") + "".join(parts))
+            self._keys = [field.key for field in self._fields]
+            self._converters = [(i, field.converter) for i, field in enumerate(self._fields)
+                                if field.converter is not None]
+
+    def decode(self, registers: list[int]) -> dict:
+        """Decodes the fields from the registers of a response.
+
+        Parameters
+        ----------
+        registers : list[int]
+            Registers of the response, starting at the first register of the block
+
+        Returns
+        -------
+        dict
+            Decoded values, with the field names as keys
+        """
+        payload = self._payload.pack(*registers[:self.count])
+        if not self.single:
+            return {field.key: field.decode(payload) for field in self._fields}
+        values = self._format.unpack_from(payload)
+        if self._converters:
+            values = list(values)
+            for i, converter in self._converters:
+                values[i] = converter(values[i])
+        return dict(zip(self._keys, values))
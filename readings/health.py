@@ -0,0 +1,88 @@
+"""Module tracking the health of the meters, so a meter which doesn't respond doesn't stall the others.
+
+Each meter gets a ``CircuitBreaker``. After consecutive failed reads the circuit opens and the meter is skipped
+without sending any request, so meters sharing its gateway keep polling at their full rate.
+Once its backoff passes, a single read probes the meter, closing the circuit if it answers
+or opening it again for twice as long if it doesn't.
+
+"""
+import time
+
+
+class CircuitOpen(ConnectionError):
+    """Raised instead of reading a meter whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Decides whether a meter is read, based on its consecutive failures.
+
+    Attributes
+    ----------
+    failure_threshold : int
+        Amount of consecutive failed reads after which the circuit opens
+    backoff_initial : float
+        Seconds the circuit stays open after it first opens
+    backoff_max : float
+        Upper limit of the time the circuit stays open, in seconds
+    state : str
+        ``closed`` while the meter is read, ``open`` while it's skipped
+        and ``half_open`` while a probe is in flight
+    failures : int
+        Amount of consecutive failed reads
+    trips : int
+        Amount of times the circuit opened
+    open_until : float
+        Monotonic time up to which an open circuit skips the meter
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    STATES = (CLOSED, OPEN, HALF_OPEN)
+
+    def __init__(self, failure_threshold: int = 3, backoff_initial: float = 5.0, backoff_max: float = 300.0):
+        self.failure_threshold = failure_threshold
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+        # Amount of times the circuit opened since it was last closed, doubling the backoff each time
+        self._reopened = 0
+
+    def allow(self) -> bool:
+        """Returns whether the meter should be read now.
+
+        An open circuit past its backoff lets a single read through as the probe, others are skipped until it ends.
+        """
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() >= self.open_until:
+            self.state = self.HALF_OPEN
+            return True
+        return False
+
+    def succeeded(self):
+        """Records a read answered by the meter, closing the circuit"""
+        self.state = self.CLOSED
+        self.failures = 0
+        self._reopened = 0
+
+    def failed(self):
+        """Records a read the meter didn't answer, opening the circuit after too many of them or a failed probe"""
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            backoff = min(self.backoff_initial * 2 ** self._reopened, self.backoff_max)
+            self._reopened += 1
+            self.trips += 1
+            self.state = self.OPEN
+            self.open_until = time.monotonic() + backoff
+
+    def snapshot(self) -> dict[str, any]:
+        """Returns the state of the circuit as a dictionary, with the seconds until the next probe"""
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "trips": self.trips,
+            "retry_in": max(self.open_until - time.monotonic(), 0.0) if self.state == self.OPEN else 0.0,
+        }
@@ -0,0 +1,161 @@
+"""Module keeping the last known value of every field, so current readings can be served without QuestDB.
+
+Values are stored per table, symbol and field, with the timestamp of their reading and a quality flag.
+The polls replace the whole state of a record at once, so readers never see a value with a timestamp
+of another reading, without any locks.
+
+Usage: ::
+
+    from readings import latest
+
+    latest.store.update("phases", {"voltage": 230.1}, timestamp, symbol="1")
+    latest.store.get("phases", "1")  # {"voltage": {"value": 230.1, "timestamp": ..., "quality": "good"}}
+
+"""
+from array import array
+from typing import Optional
+
+# Quality flags of the values, stored as indexes into QUALITIES
+GOOD = 0
+BAD = 1
+QUALITIES = ("good", "bad")
+
+
+class _Record:
+    """Last values of the fields of a single table row (a symbol of a symbolic table).
+
+    The state is a tuple of the field values, their timestamps in microseconds since the epoch
+    and their qualities, replaced as a whole on every update.
+    """
+    __slots__ = ("fields", "state")
+
+    def __init__(self, fields: tuple[str, ...]):
+        self.fields = fields
+        self.state: tuple[list, array, bytearray] = (
+            [None] * len(fields), array("q", [0] * len(fields)), bytearray([BAD] * len(fields))
+        )
+
+    def update(self, values: dict[str, any], timestamp: int):
+        old_values, old_timestamps, old_qualities = self.state
+        new_values, timestamps, qualities = list(old_values), array("q", old_timestamps), bytearray(old_qualities)
+        for i, name in enumerate(self.fields):
+            value = values.get(name)
+            if value is None:
+                # Not read this time, the last known value stays
+                qualities[i] = BAD
+            else:
+                new_values[i] = value
+                timestamps[i] = timestamp
+                qualities[i] = GOOD
+        self.state = (new_values, timestamps, qualities)
+
+    def mark_bad(self):
+        values, timestamps, _ = self.state
+        self.state = (values, timestamps, bytearray([BAD] * len(self.fields)))
+
+    def snapshot(self) -> dict[str, dict[str, any]]:
+        values, timestamps, qualities = self.state
+        return {
+            name: {"value": values[i], "timestamp": timestamps[i] or None, "quality": QUALITIES[qualities[i]]}
+            for i, name in enumerate(self.fields)
+        }
+
+
+class LatestValues:
+    """Store of the last known values of all tables.
+
+    Updated from the poll loop, read from any thread or task.
+    A field which was never read has the value and timestamp None and a bad quality.
+    """
+    def __init__(self):
+        # Records per table and symbol, the symbol of a simple table is None
+        self._tables: dict[str, dict[Optional[str], _Record]] = {}
+
+    def update(self, table: str, values: dict[str, any], timestamp: int, symbol: Optional[str] = None):
+        """Stores the values of a reading.
+
+        Parameters
+        ----------
+        table : str
+            Name of the table
+        values : dict[str, any]
+            Values of the fields, a None value keeps the last known value and marks it as bad
+        timestamp : int
+            Timestamp of the reading, in microseconds since the epoch
+        symbol : str, optional
+            Symbol of the row in a symbolic table
+        """
+        records = self._tables.get(table)
+        if records is None:
+            records = self._tables[table] = {}
+        record = records.get(symbol)
+        if record is None or any(name not in record.fields for name in values):
+            # New fields, e.g. after a change of the configuration
+            fields = tuple(dict.fromkeys((*(record.fields if record else ()), *values)))
+            new_record = _Record(fields)
+            if record is not None:
+                new_record.state = _merge_state(record, new_record)
+            record = records[symbol] = new_record
+        record.update(values, timestamp)
+
+    def mark_bad(self, table: str, symbol: Optional[str] = None):
+        """Marks the values of a table as bad, after its reading failed.
+
+        Parameters
+        ----------
+        table : str
+            Name of the table
+        symbol : str, optional
+            Symbol of the row in a symbolic table whose values are marked, all rows of the table if not specified
+        """
+        records = self._tables.get(table, {})
+        for record in list(records.values()) if symbol is None else [records.get(symbol)]:
+            if record is not None:
+                record.mark_bad()
+
+    def tables(self) -> list[str]:
+        """Returns the names of the tables with stored values"""
+        return list(self._tables)
+
+    def get(self, table: str, symbol: Optional[str] = None) -> dict:
+        """Returns the last known values of a table, or of a single symbol of a symbolic table.
+
+        Parameters
+        ----------
+        table : str
+            Name of the table
+        symbol : str, optional
+            Symbol of the row, by default all rows of the table
+
+        Raises
+        ------
+        KeyError
+            If there are no values of the table or the symbol
+
+        Returns
+        -------
+        dict
+            Dictionary of the fields, each with its ``value``, ``timestamp`` (microseconds since the epoch)
+            and ``quality``. For all symbols of a symbolic table, the dictionaries of the fields are nested
+            under their symbols.
+        """
+        records = self._tables[table]
+        if symbol is not None:
+            return records[symbol].snapshot()
+        if list(records) == [None]:
+            return records[None].snapshot()
+        return {row_symbol: record.snapshot() for row_symbol, record in list(records.items())}
+
+
+def _merge_state(old: _Record, new: _Record) -> tuple[list, array, bytearray]:
+    """Carries the values of the fields of an old record over to a record with more fields"""
+    values, timestamps, qualities = new.state
+    old_values, old_timestamps, old_qualities = old.state
+    for i, name in enumerate(old.fields):
+        j = new.fields.index(name)
+        values[j], timestamps[j], qualities[j] = old_values[i], old_timestamps[i], old_qualities[i]
+    return values, timestamps, qualities
+
+
+# Store shared by the acquisition and the API
+store = LatestValues()
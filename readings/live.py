@@ -0,0 +1,166 @@
+"""Module for pushing completed readings to live subscribers, such as the WebSocket and SSE streams of the API.
+
+Every row of a completed poll is published to the subscriptions whose filters match it.
+Publishing never waits for the subscribers: each subscription keeps at most one pending message per table row,
+so a newer reading of the row replaces (coalesces) the one not yet delivered,
+and when a subscription has too many pending rows, the oldest are dropped.
+A slow consumer only misses intermediate readings and can't hold back the acquisition.
+
+Usage: ::
+
+    with live.broker.subscribe(tables={"phases"}) as subscription:
+        while True:
+            for message in await subscription.get():
+                print(message)
+
+"""
+import asyncio
+import threading
+from typing import Optional
+
+from readings import metrics
+
+# Default maximum amount of pending rows of a subscription
+DEFAULT_MAX_PENDING = 100
+
+DROPPED = metrics.registry.counter(
+    "live_dropped_messages_total", "Amount of messages dropped because a subscriber was too slow")
+COALESCED = metrics.registry.counter(
+    "live_coalesced_messages_total", "Amount of messages replaced by a newer reading before being delivered")
+
+
+class Subscription:
+    """Filtered, bounded queue of readings for a single subscriber.
+
+    Must be created with ``Broker.subscribe()`` on the event loop of the subscriber.
+
+    Attributes
+    ----------
+    tables : set[str] | None
+        Names of the subscribed tables, all tables if None
+    symbols : set[str] | None
+        Subscribed symbols of symbolic tables, all symbols if None; rows of simple tables are always delivered
+    max_pending : int
+        Maximum amount of rows waiting for delivery
+    dropped : int
+        Amount of messages dropped because of exceeding ``max_pending``
+    coalesced : int
+        Amount of messages replaced by a newer reading of the same row
+    """
+    def __init__(self, broker: "Broker", tables: Optional[set[str]] = None, symbols: Optional[set[str]] = None,
+                 max_pending: int = DEFAULT_MAX_PENDING):
+        self.tables = tables
+        self.symbols = symbols
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.coalesced = 0
+        self._broker = broker
+        self._pending: dict[tuple[str, Optional[str]], dict] = {}
+        self._lock = threading.Lock()
+        self._ready = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+
+    def matches(self, table: str, symbol: Optional[str]) -> bool:
+        """Checks whether the row is subscribed to"""
+        return ((self.tables is None or table in self.tables)
+                and (self.symbols is None or symbol is None or symbol in self.symbols))
+
+    def _offer(self, key: tuple[str, Optional[str]], message: dict):
+        with self._lock:
+            if self._pending.pop(key, None) is not None:
+                self.coalesced += 1
+                COALESCED.inc()
+            elif len(self._pending) >= self.max_pending:
+                del self._pending[next(iter(self._pending))]
+                self.dropped += 1
+                DROPPED.inc()
+            self._pending[key] = message
+        try:
+            if asyncio.get_running_loop() is self._loop:
+                self._ready.set()
+                return
+        except RuntimeError:
+            pass
+        # Published from another thread, e.g. by the threaded scheduler
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # The loop of the subscriber is closed
+            pass
+
+    async def get(self) -> list[dict]:
+        """Waits for readings and returns all pending ones, oldest first"""
+        await self._ready.wait()
+        return self.drain()
+
+    def drain(self) -> list[dict]:
+        """Returns all pending readings without waiting, oldest first"""
+        with self._lock:
+            self._ready.clear()
+            messages = list(self._pending.values())
+            self._pending.clear()
+        return messages
+
+    def close(self):
+        """Stops receiving readings"""
+        self._broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Broker:
+    """Fans out published readings to the matching subscriptions"""
+    def __init__(self):
+        self._subscriptions: list[Subscription] = []
+
+    def subscribe(self, tables: Optional[set[str]] = None, symbols: Optional[set[str]] = None,
+                  max_pending: int = DEFAULT_MAX_PENDING) -> Subscription:
+        """Creates a subscription on the running event loop, see ``Subscription``"""
+        subscription = Subscription(self, tables, symbols, max_pending)
+        # Replaced instead of appended to, so publish() can iterate without a lock
+        self._subscriptions = self._subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions = [other for other in self._subscriptions if other is not subscription]
+
+    def subscribers(self) -> int:
+        """Returns the amount of active subscriptions"""
+        return len(self._subscriptions)
+
+    def publish(self, table: str, values: dict[str, any], timestamp: int, symbol: Optional[str] = None):
+        """Delivers a row of a reading to the matching subscriptions, without waiting for them.
+
+        Parameters
+        ----------
+        table : str
+            Name of the table
+        values : dict[str, any]
+            Values of the fields
+        timestamp : int
+            Timestamp of the reading, in microseconds since the epoch
+        symbol : str, optional
+            Symbol of the row in a symbolic table
+        """
+        subscriptions = self._subscriptions
+        if not subscriptions:
+            return
+        message = None
+        for subscription in subscriptions:
+            if subscription.matches(table, symbol):
+                if message is None:
+                    message = {"table": table, "symbol": symbol, "timestamp": timestamp, "values": values}
+                subscription._offer((table, symbol), message)
+
+
+@metrics.registry.collector
+def _collect_metrics() -> list[metrics.Family]:
+    return [("live_subscribers", "gauge", "Amount of live stream subscribers", [({}, broker.subscribers())])]
+
+
+# Broker shared by the acquisition and the API
+broker = Broker()
@@ -0,0 +1,221 @@
+"""Module for collecting metrics of the acquisition and exposing them in the Prometheus text format.
+
+The hot paths record into ``Counter`` and ``Histogram`` objects, which only add to plain numbers
+and rely on the GIL instead of locks, so recording costs about as much as a dictionary lookup.
+Statistics already kept elsewhere, such as those of the connection pool or the ingestion service,
+are read by collectors only when the metrics are rendered.
+
+Usage: ::
+
+    from readings import metrics
+
+    REQUESTS = metrics.registry.counter("requests_total", "Amount of requests", ("meter",))
+    REQUESTS.inc(("electric",))
+
+    text = metrics.registry.render()
+
+"""
+import bisect
+import math
+from typing import Callable, Iterable
+
+# Upper bounds of the default histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Family of samples returned by a collector: name, type, help and samples as (labels, value)
+Family = tuple[str, str, str, list[tuple[dict[str, str], float]]]
+# Family with its samples already formatted as lines, as exchanged between processes: name, type, help and lines
+RenderedFamily = tuple[str, str, str, list[str]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def with_labels(family: RenderedFamily, labels: dict[str, str]) -> RenderedFamily:
+    """Adds labels to all samples of a rendered family, e.g. to tell apart the same metric of several processes"""
+    name, type, help, lines = family
+    extra = _format_labels(labels)[1:-1]
+    relabeled = []
+    for line in lines:
+        # The metric name ends at the first brace of the labels or at the space before the value
+        end = min(i for i in (line.find("{"), line.find(" ")) if i >= 0)
+        if line[end] == "{":
+            relabeled.append(f"{line[:end + 1]}{extra},{line[end + 1:]}")
+        else:
+            relabeled.append(f"{line[:end]}{{{extra}}}{line[end:]}")
+    return name, type, help, relabeled
+
+
+class Counter:
+    """Monotonically increasing value per combination of labels.
+
+    Attributes
+    ----------
+    name : str
+        Name of the metric
+    help : str
+        Description of the metric
+    labelnames : tuple[str, ...]
+        Names of the labels, their values are passed to ``inc()`` in the same order
+    """
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        """Increases the value of the labels by the amount"""
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: tuple = ()) -> float:
+        """Returns the current value of the labels"""
+        return self._values.get(labels, 0)
+
+    def _lines(self) -> Iterable[str]:
+        for labels, value in list(self._values.items()):
+            yield f"{self.name}{_format_labels(dict(zip(self.labelnames, labels)))} {_format_value(value)}"
+
+
+class _Series:
+    """Bucket counts of a single combination of labels"""
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * (buckets + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """Distribution of observed values per combination of labels, with fixed buckets.
+
+    Attributes
+    ----------
+    name : str
+        Name of the metric
+    help : str
+        Description of the metric
+    labelnames : tuple[str, ...]
+        Names of the labels, their values are passed to ``observe()`` in the same order
+    buckets : tuple[float, ...]
+        Sorted upper bounds of the buckets, an infinite bucket is always added
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, _Series] = {}
+
+    def observe(self, value: float, labels: tuple = ()):
+        """Records a value for the labels"""
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = _Series(len(self.buckets))
+        series.counts[bisect.bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def _lines(self) -> Iterable[str]:
+        for labels, series in list(self._series.items()):
+            label_dict = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), list(series.counts)):
+                cumulative += count
+                bucket_labels = _format_labels({**label_dict, "le": _format_value(float(bound))})
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(label_dict)} {_format_value(series.sum)}"
+            yield f"{self.name}_count{_format_labels(label_dict)} {series.count}"
+
+
+class Registry:
+    """Set of metrics and collectors rendered together.
+
+    Collectors are functions returning families of samples, see ``Family``,
+    called on every ``render()`` to expose statistics kept outside of the registry.
+    Sources return families already rendered elsewhere, see ``RenderedFamily``, such as those of worker processes.
+    Samples of families with the same name are rendered together, under a single header.
+    """
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._collectors: list[Callable[[], Iterable[Family]]] = []
+        self._sources: list[Callable[[], Iterable[RenderedFamily]]] = []
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        """Creates and registers a ``Counter``"""
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        """Creates and registers a ``Histogram``"""
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def collector(self, collect: Callable[[], Iterable[Family]]) -> Callable[[], Iterable[Family]]:
+        """Registers a collector, usable as a decorator"""
+        self._collectors.append(collect)
+        return collect
+
+    def source(self, collect: Callable[[], Iterable[RenderedFamily]]) -> Callable[[], Iterable[RenderedFamily]]:
+        """Registers a source of rendered families, usable as a decorator"""
+        self._sources.append(collect)
+        return collect
+
+    def families(self) -> list[RenderedFamily]:
+        """Returns all metrics as rendered families, merged by name"""
+        families: dict[str, RenderedFamily] = {}
+
+        def add(name: str, type: str, help: str, lines: Iterable[str]):
+            family = families.get(name)
+            if family is None:
+                families[name] = (name, type, help, list(lines))
+            else:
+                family[3].extend(lines)
+
+        for metric in list(self._metrics.values()):
+            add(metric.name, metric.type, metric.help, metric._lines())
+        for collect in self._collectors:
+            for name, type, help, samples in collect():
+                add(name, type, help,
+                    (f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples))
+        for collect in self._sources:
+            for family in collect():
+                add(*family)
+        return list(families.values())
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, type, help, samples in self.families():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {type}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+# Registry shared by all modules
+registry = Registry()
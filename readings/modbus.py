@@ -9,19 +9,100 @@ See Also
     See for information on the structure of the file
 
 """
-from typing import Optional
-
-import yaml
-from pymodbus import client as mbc, payload as mbp
-
-from config.config_loading import get_register_reference_path
+import asyncio
+import time
+from typing import Iterable, Optional
+
+from pymodbus.exceptions import ModbusException
+
+from config.config_compiler import compile_config
+from config.config_loading import get_register_reference_path, load_settings, load_yaml_config
+from readings import metrics
+from readings.arbitration import Arbiter, BusArbiter, inter_frame_gap
+from readings.connection_pool import ConnectionPool, endpoint_name
+from readings.health import CircuitBreaker, CircuitOpen
 from readings.data_classes import Meter, Register
+from readings.decoding import BlockDecoder
+
+# Maximum amount of registers that can be read with a single request, as defined by the Modbus protocol
+MAX_BLOCK_LENGTH = 125
+
+# Default values of the tunable settings, see ``_get_settings()``
+DEFAULT_SETTINGS = {
+    # Amount of unused registers allowed between two fields to still read them with one request
+    "max_read_gap": 4,
+    # Maximum amount of concurrent requests on a single connection, many gateways handle only one at a time,
+    # serial buses always handle one at a time
+    "max_in_flight": 1,
+    # Seconds after which an unused connection is closed and replaced on the next use
+    "idle_timeout": 60.0,
+    # Timeout of connecting and of single requests, in seconds,
+    # pymodbus drops the connection shared by all meters of the gateway when a request reaches it
+    "connect_timeout": 3.0,
+    # Timeout of single requests, in seconds, overridden by the timeout of a meter,
+    # a request reaching it only fails its meter, so it should be shorter than connect_timeout
+    "request_timeout": 2.0,
+    # Amount of failed requests retried per meter and poll
+    "retry_budget": 1,
+    # Amount of consecutive failed polls of a meter after which it's skipped, see ``readings.health``
+    "breaker_failures": 3,
+    # Seconds a meter is first skipped for, doubled each time its probe fails
+    "breaker_backoff_initial": 5.0,
+    # Upper limit of the time a meter is skipped for, in seconds
+    "breaker_backoff_max": 300.0,
+    # Seconds to wait before reconnecting after the first failure, doubled with each consecutive failure
+    "backoff_initial": 1.0,
+    # Upper limit of the wait between reconnection attempts, in seconds
+    "backoff_max": 60.0,
+}
 
 # Global variables
 # Dictionary containing all loaded meters
 meters: Optional[dict[str, Meter]] = None
 # Path to the register and meter config file
 config: str = get_register_reference_path()
+# Tunable settings, lazy-loaded
+settings: Optional[dict[str, any]] = None
+# Connections shared by all meters, lazy-loaded
+pool: Optional[ConnectionPool] = None
+# Arbiters limiting in-flight requests per endpoint
+arbiters: dict[tuple, Arbiter] = {}
+# Circuit breakers per meter name
+breakers: dict[str, CircuitBreaker] = {}
+
+# Errors of a meter failing to respond, its fields are then left empty instead of failing the whole reading
+READ_ERRORS = (ConnectionError, asyncio.TimeoutError, ModbusException)
+
+# Metrics recorded on every request
+REQUEST_SECONDS = metrics.registry.histogram(
+    "modbus_request_duration_seconds", "Duration of Modbus requests, once the connection is free", ("meter",))
+REQUEST_ERRORS = metrics.registry.counter(
+    "modbus_request_errors_total", "Amount of failed Modbus requests", ("meter",))
+REQUEST_RETRIES = metrics.registry.counter(
+    "modbus_request_retries_total", "Amount of retried Modbus requests", ("meter",))
+SKIPPED_READS = metrics.registry.counter(
+    "modbus_skipped_reads_total", "Amount of reads of a meter skipped because its circuit is open", ("meter",))
+
+
+def _get_settings() -> dict[str, any]:
+    """Lazily loads the tunable settings of the module.
+
+    Settings can be overridden in the /config/config.ini file: ::
+
+        [modbus]
+        setting_name = # value
+
+    Settings which are not specified keep their values from ``DEFAULT_SETTINGS``.
+
+    Returns
+    -------
+    dict[str, any]
+        Dictionary of the settings, with values converted to the types of the defaults
+    """
+    global settings
+    if settings is None:
+        settings = load_settings("modbus", DEFAULT_SETTINGS)
+    return settings
 
 
 def _get_meters() -> dict[str, Meter]:
@@ -47,124 +128,509 @@ def _get_panel() -> Meter:
     return _get_meters()["water_panel"]
 
 
+def _get_pool() -> ConnectionPool:
+    """Lazily creates the connection pool shared by all meters
+
+    Returns
+    -------
+    ConnectionPool
+        Pool configured with the settings from ``_get_settings()``
+    """
+    global pool
+    if pool is None:
+        current = _get_settings()
+        pool = ConnectionPool(
+            idle_timeout=current["idle_timeout"],
+            connect_timeout=current["connect_timeout"],
+            backoff_initial=current["backoff_initial"],
+            backoff_max=current["backoff_max"],
+        )
+    return pool
+
+
+def pool_stats() -> dict[str, any]:
+    """Returns statistics of the connection pool, see ``ConnectionPool.snapshot()``"""
+    return _get_pool().snapshot()
+
+
+def forget_register_reference():
+    """Drops the loaded meters, so they are reloaded from the register reference file on the next use"""
+    global meters
+    meters = None
+
+
+async def forget_meters(names: Iterable[str], definitions: Iterable[Meter]):
+    """Drops the connections, arbiters and circuit breakers of changed meters.
+
+    They are recreated on the next read, so new connection settings like the baudrate
+    or the inter-frame gap apply, see ``readings.scheduler.reload_jobs()``.
+
+    Parameters
+    ----------
+    names : Iterable[str]
+        Names of the changed meters
+    definitions : Iterable[Meter]
+        Previous and new definitions of the changed meters, whose endpoints are closed
+    """
+    endpoints = {meter.id.endpoint for meter in definitions}
+    for endpoint in endpoints:
+        arbiters.pop(endpoint, None)
+    for name in names:
+        breakers.pop(name, None)
+    if pool is not None:
+        await pool.close_endpoints(endpoints)
+
+
+async def close_connections():
+    """Closes all pooled connections of the running event loop, they are reopened on the next read"""
+    if pool is not None:
+        await pool.close_all()
+
+
 async def _connect_meter(meter: Meter):
-    """Lazily connects to the meter, creates a client if needed
+    """Assigns a connected client from the connection pool to the meter
+
+    Meters with the same endpoint share the client, see ``Meter.Identification``.
 
     Parameters
     ----------
     meter : Meter
         Reference to the meter object
+
+    Raises
+    ------
+    ConnectionError
+        If the meter can't be connected to
     """
-    if meter.client is None:
-        meter.client = mbc.AsyncModbusTcpClient(meter.id.ip_address, meter.id.tcp_socket)
-    if not meter.client.connected:
-        await meter.client.connect()
+    meter.client = await _get_pool().get(meter.id)
 
 
 def _load_register_reference():
-    global config, meters
-    with open(config, "r") as stream:
-        meters = yaml.safe_load(stream)
+    global meters
+    meters, _ = compile_config(config)
 
 
 async def _modbus_test(phase: int):
-    global meters
-    electric = meters["electric"]
-    assert electric is not None
-    client = mbc.AsyncModbusTcpClient(electric.id.ip_address, electric.id.tcp_socket)
-    await client.connect()
-    response = await client.read_input_registers(electric.registers["phases"][phase]["voltage"].register, 1,
-                                                 electric.id.slave_id)
-    print(response)
+    """Reads the voltage of a phase from the ``phases`` table of the register reference file"""
+    meters, tables = load_yaml_config()
+    voltage = tables["phases"].fields[phase]["voltage"]
+    print(await read_registers(meters, {"voltage": voltage}))
+    await close_connections()
 
-    await client.close()
 
+class ReadBlock:
+    """A range of consecutive registers read from a meter with a single Modbus request.
 
-def _decode_type(register: Register, decoder: mbp.BinaryPayloadDecoder) -> any:
-    """Decodes the register value based on the register type
+    Created by ``_plan_reads()``, contains the fields which are decoded from the response.
 
-    Supported types:
-        - ``"float"`` (4 bytes) ``-> float``
-        - ``"int"`` (2 bytes) ``-> int``
-        - ``"uint8"`` (1 byte) ``-> int``
-        - ``"bool16"`` (2 bytes) ``-> bool``
+    Attributes
+    ----------
+    meter : str
+        Name of the meter the block is read from
+    slave_id : int
+        Modbus slave id the request is addressed to
+    read_type : str
+        Type of the read, either ``"input"`` or ``"holding"``
+    start : int
+        Address of the first register in the block
+    count : int
+        Amount of registers in the block
+    fields : list[tuple[str, Register, Meter.RegisterType]]
+        Fields decoded from the block, as tuples of the field name, its register and its register type
+    decoder : BlockDecoder
+        Decoder of the fields, compiled by ``compile()`` once all the fields are added
+    """
+    def __init__(self, meter: str, slave_id: int, read_type: str, start: int):
+        self.meter = meter
+        self.slave_id = slave_id
+        self.read_type = read_type
+        self.start = start
+        self.count = 0
+        self.fields = []
+        self.decoder: Optional[BlockDecoder] = None
+
+    @property
+    def end(self) -> int:
+        """Address one past the last register in the block"""
+        return self.start + self.count
+
+    def add(self, key: str, register: Register, reg_type: Meter.RegisterType):
+        """Adds a field to the block, extending it if necessary"""
+        self.fields.append((key, register, reg_type))
+        self.count = max(self.count, register.register + reg_type.length - self.start)
+
+    def compile(self):
+        """Compiles the decoder of the block, see ``readings.decoding.BlockDecoder``"""
+        self.decoder = BlockDecoder(self.start, self.count, self.fields)
+
+
+def _plan_reads(meters: dict[str, Meter], registers: dict[str, Register],
+                max_gap: Optional[int] = None) -> list[ReadBlock]:
+    """Groups registers into as few Modbus requests as possible.
+
+    Registers are grouped by meter, slave id and read type, then sorted by address.
+    A register is merged into the previous block if at most ``max_gap`` unused registers separate them
+    and the block does not exceed ``MAX_BLOCK_LENGTH``.
 
     Parameters
     ----------
-    register : Register
-        current register with supported type-string in register.type
-    decoder :  mbp.BinaryPayloadDecoder
-        pymodbus decoder created from the response and containing the necessary number of bytes for the type
+    meters : dict[str, Meter]
+        Dictionary of meters, should contain all meters needed for the registers
+    registers : dict[str, Register]
+        Dictionary of registers to read, with the register name as key
+    max_gap : int, optional
+        Amount of unused registers allowed within a block, defaults to the ``max_read_gap`` setting
 
     Raises
     ------
     ValueError
-        If the register type is not supported by the decoder or implemented in this function
+        If a register type is not defined in the meter configuration or can't be decoded
 
     Returns
     -------
-    any
-        Decoded value, type depends on the register type
+    list[ReadBlock]
+        Blocks to read, each with the fields that should be decoded from it and a compiled decoder
+    """
+    if max_gap is None:
+        max_gap = _get_settings()["max_read_gap"]
 
+    groups: dict[tuple[str, int, str], list] = {}
+    for key, register in registers.items():
+        meter = meters[register.meter]
+        assert meter is not None
+        reg_type = meter.register_types.get(register.type)
+        if reg_type is None:
+            raise ValueError(f"Register type '{register.type}' not found in configuration")
+        group = (register.meter, meter.id.slave_id, reg_type.read_type)
+        groups.setdefault(group, []).append((key, register, reg_type))
+
+    blocks = []
+    for (meter_name, slave_id, read_type), fields in groups.items():
+        fields.sort(key=lambda field: field[1].register)
+        block = None
+        for key, register, reg_type in fields:
+            if (block is None
+                    or register.register > block.end + max_gap
+                    or register.register + reg_type.length - block.start > MAX_BLOCK_LENGTH):
+                block = ReadBlock(meter_name, slave_id, read_type, register.register)
+                blocks.append(block)
+            block.add(key, register, reg_type)
+    for block in blocks:
+        block.compile()
+    return blocks
+
+
+async def _read_block(meter: Meter, block: ReadBlock) -> dict:
+    """Reads a block of registers from the meter and decodes its fields.
+
+    Requires the meter to be connected.
+
+    Parameters
+    ----------
+    meter : Meter
+        Reference to the meter object
+    block : ReadBlock
+        Block planned by ``_plan_reads()``
 
+    Returns
+    -------
+    dict
+        Decoded values of the fields in the block, with the field names as keys
     """
-    match register.type:
-        case "float":
-            return decoder.decode_32bit_float()
-        case "int":
-            return decoder.decode_16bit_int()
-        case "uint8":
-            return decoder.decode_8bit_uint()
-        case "bool16":
-            return bool(decoder.decode_16bit_uint())
+    match block.read_type:
+        case "input":
+            response = await meter.client.read_input_registers(block.start, block.count, block.slave_id)
+        case "holding":
+            response = await meter.client.read_holding_registers(block.start, block.count, block.slave_id)
         case _:
-            raise ValueError(f"Register type unsupported by the decoder: {register.type}")
+            raise NotImplementedError(f"Register read type '{block.read_type}' not supported")
+
+    if response.isError():
+        raise ConnectionError(f"Error reading registers {block.start}-{block.end - 1}: {response}")
+
+    return block.decoder.decode(response.registers)
 
 
-async def _read_register(meter: Meter, register: Register) -> any:
-    """Reads a given register from the meter.
+def _get_arbiter(meter: Meter) -> Arbiter:
+    """Returns the arbiter of the connection of the meter.
 
-    Requires the meter to be connected and the register to be defined in the meter configuration.
+    Meters on the same endpoint share the connection, so they also share the arbiter.
 
     Parameters
     ----------
     meter : Meter
         Reference to the meter object
-        Needs to be already connected
-    register : Register
-        Reference to the intended register object
 
     Returns
     -------
-    any
-        Value from the register decoded according to its type
+    Arbiter
+        Arbiter limited to the ``max_in_flight`` setting,
+        or a ``BusArbiter`` with the inter-frame gap of the meter if it's on a serial bus
     """
-    await _connect_meter(meter)
-    # assert meter.client is not None and meter.client.connected
-    reg_type = meter.register_types[register.type]
-    if reg_type is None:
-        raise ValueError(f"Register type '{register.type}' not found in configuration")
+    identification = meter.id
+    endpoint = identification.endpoint
+    arbiter = arbiters.get(endpoint)
+    if arbiter is None:
+        if identification.on_bus:
+            gap = identification.inter_frame_gap
+            arbiter = BusArbiter(inter_frame_gap(identification.baudrate) if gap is None else gap)
+        else:
+            arbiter = Arbiter(_get_settings()["max_in_flight"])
+        arbiters[endpoint] = arbiter
+    return arbiter
+
+
+def _get_breaker(meter_name: str) -> CircuitBreaker:
+    """Returns the circuit breaker of the meter, configured with the ``breaker_*`` settings"""
+    breaker = breakers.get(meter_name)
+    if breaker is None:
+        current = _get_settings()
+        breaker = breakers[meter_name] = CircuitBreaker(
+            failure_threshold=current["breaker_failures"],
+            backoff_initial=current["breaker_backoff_initial"],
+            backoff_max=current["breaker_backoff_max"],
+        )
+    return breaker
+
+
+def health_stats() -> dict[str, dict[str, any]]:
+    """Returns the state of the circuit of each meter, see ``CircuitBreaker.snapshot()``"""
+    return {meter: breaker.snapshot() for meter, breaker in list(breakers.items())}
+
+
+def lock_stats() -> dict[str, dict[str, any]]:
+    """Returns contention statistics of each meter, see ``ContentionStats.snapshot()``"""
+    return {
+        meter: stats.snapshot()
+        for arbiter in list(arbiters.values())
+        for meter, stats in list(arbiter.stats.items())
+    }
+
+
+@metrics.registry.collector
+def _collect_metrics() -> list[metrics.Family]:
+    """Exposes the statistics of the connection pool and the arbiters"""
+    families = []
+    if pool is not None:
+        stats = pool.snapshot()
+        families += [
+            ("modbus_open_connections", "gauge", "Amount of open pooled connections",
+             [({}, stats["open_connections"])]),
+            ("modbus_connects_total", "counter", "Amount of connections made to the meters",
+             [({}, stats["connects"])]),
+            ("modbus_reconnects_total", "counter", "Amount of connections replacing a previous one",
+             [({}, stats["reconnects"])]),
+            ("modbus_failed_connects_total", "counter", "Amount of failed connection attempts",
+             [({}, stats["failed_connects"])]),
+        ]
+    endpoints = list(arbiters.items())
+    families += [
+        ("modbus_requests_waiting", "gauge", "Amount of requests waiting for their connection",
+         [({"endpoint": endpoint_name(endpoint)}, arbiter.waiting) for endpoint, arbiter in endpoints]),
+        ("modbus_wait_seconds_total", "counter", "Total time requests waited for their connection",
+         [({"meter": meter}, stats.wait_time)
+          for _, arbiter in endpoints for meter, stats in list(arbiter.stats.items())]),
+    ]
+    circuits = list(breakers.items())
+    families += [
+        ("modbus_circuit_state", "gauge", "Whether the circuit of the meter is in the state",
+         [({"meter": meter, "state": state}, int(breaker.state == state))
+          for meter, breaker in circuits for state in CircuitBreaker.STATES]),
+        ("modbus_circuit_trips_total", "counter", "Amount of times the circuit of the meter opened",
+         [({"meter": meter}, breaker.trips) for meter, breaker in circuits]),
+    ]
+    return families
+
+
+async def _read_meter_blocks(meter_name: str, meter: Meter, blocks: list[ReadBlock]) -> dict:
+    """Reads blocks planned for a single meter, concurrently up to the ``max_in_flight`` setting.
+
+    Each request is limited to the timeout of the meter, or the ``request_timeout`` setting,
+    and failed requests are retried while the ``retry_budget`` of the meter for this read lasts.
+    The meter is skipped while its circuit is open, see ``readings.health``.
 
-    match reg_type.read_type:
-        case "input":
-            response = await meter.client.read_input_registers(register.register, reg_type.length, meter.id.slave_id)
-        case "holding":
-            response = await meter.client.read_holding_registers(register.register, reg_type.length, meter.id.slave_id)
-        case _:
-            raise NotImplementedError(f"Register read type '{reg_type.read_type}' not supported")
+    Parameters
+    ----------
+    meter_name : str
+        Name of the meter, used for the contention statistics
+    meter : Meter
+        Reference to the meter object
+    blocks : list[ReadBlock]
+        Blocks of the meter, planned by ``_plan_reads()``
 
-    if response.isError():
-        raise ConnectionError(f"Error reading register {register.register}: {response}")
+    Raises
+    ------
+    CircuitOpen
+        If the circuit of the meter is open
+    ConnectionError | asyncio.TimeoutError | ModbusException
+        If none of the blocks could be read
 
-    decoder = mbp.BinaryPayloadDecoder.fromRegisters(response.registers, reg_type.byteorder, reg_type.wordorder)
+    Returns
+    -------
+    dict
+        Decoded values of the fields in all the blocks, with the field names as keys,
+        fields of blocks which couldn't be read are None
+    """
+    labels = (meter_name,)
+    breaker = _get_breaker(meter_name)
+    if not breaker.allow():
+        SKIPPED_READS.inc(labels)
+        retry = f"retrying in {breaker.snapshot()['retry_in']:.1f} s" if breaker.state == CircuitBreaker.OPEN \
+            else "waiting for its probe"
+        raise CircuitOpen(f"Meter {meter_name} is not responding, {retry}")
+
+    current = _get_settings()
+    timeout = meter.id.timeout or current["request_timeout"]
+    budget = current["retry_budget"]
+    arbiter = _get_arbiter(meter)
+
+    async def read(block: ReadBlock) -> dict:
+        nonlocal budget
+        while True:
+            try:
+                await _connect_meter(meter)
+                async with arbiter.hold(meter_name, block.slave_id, block.start):
+                    start = time.perf_counter()
+                    try:
+                        return await asyncio.wait_for(_read_block(meter, block), timeout)
+                    except Exception:
+                        REQUEST_ERRORS.inc(labels)
+                        raise
+                    finally:
+                        REQUEST_SECONDS.observe(time.perf_counter() - start, labels)
+            except READ_ERRORS:
+                if budget <= 0:
+                    raise
+                budget -= 1
+                REQUEST_RETRIES.inc(labels)
+
+    try:
+        results = {}
+        failed = []
+        for block, block_result in zip(blocks, await asyncio.gather(*(read(block) for block in blocks),
+                                                                    return_exceptions=True)):
+            if isinstance(block_result, READ_ERRORS):
+                failed.append(block_result)
+                results.update((key, None) for key, _, _ in block.fields)
+            elif isinstance(block_result, BaseException):
+                raise block_result
+            else:
+                results.update(block_result)
+        if len(failed) == len(blocks):
+            breaker.failed()
+            raise failed[0]
+        breaker.succeeded()
+        return results
+    finally:
+        # A probe cancelled or ended by another error must not leave the meter skipped for good
+        if breaker.state == CircuitBreaker.HALF_OPEN:
+            breaker.failed()
+
+
+class ReadPlan:
+    """Precompiled reads of a set of registers, reusable for every poll of the same registers.
+
+    Created by ``compile_plan()`` and read by ``read_plan()``.
+
+    Attributes
+    ----------
+    keys : list
+        Keys of the registers, in the order of the input dictionary
+    meter_blocks : dict[str, list[ReadBlock]]
+        Blocks to read, grouped by the name of their meter
+    """
+    def __init__(self, keys: list, blocks: list[ReadBlock]):
+        self.keys = keys
+        self.meter_blocks: dict[str, list[ReadBlock]] = {}
+        for block in blocks:
+            self.meter_blocks.setdefault(block.meter, []).append(block)
+
+    @property
+    def requests(self) -> int:
+        """Amount of Modbus requests needed to read the plan"""
+        return sum(len(blocks) for blocks in self.meter_blocks.values())
 
-    return _decode_type(register, decoder)
 
+def compile_plan(meters: dict[str, Meter], registers: dict[any, Register],
+                 max_gap: Optional[int] = None) -> ReadPlan:
+    """Plans the requests for a set of registers and compiles their decoders, see ``_plan_reads()``
 
-async def read_registers(meters: dict[str, Meter], registers: dict[str, Register]) -> dict:
-    """Reads a set of registers from the meter
+    Parameters
+    ----------
+    meters : dict[str, Meter]
+        Dictionary of meters, should contain all meters needed for the registers
+    registers : dict[any, Register]
+        Dictionary of registers to read, with any hashable key
+    max_gap : int, optional
+        Amount of unused registers allowed within a single request, defaults to the ``max_read_gap`` setting
 
-    Lazy-connects to the meter if needed
+    Raises
+    ------
+    ValueError
+        If a register type is not defined in the meter configuration or can't be decoded
+
+    Returns
+    -------
+    ReadPlan
+        Plan to pass to ``read_plan()``
+    """
+    assert isinstance(registers, dict)
+    return ReadPlan(list(registers), _plan_reads(meters, registers, max_gap))
+
+
+async def read_plan(meters: dict[str, Meter], plan: ReadPlan) -> dict:
+    """Reads the registers of a plan compiled by ``compile_plan()``
+
+    Lazy-connects to the meters if needed, the connections are kept open for the next reads.
+    Different meters are read concurrently, so a slow meter doesn't delay the others.
+
+    Parameters
+    ----------
+    meters : dict[str, Meter]
+        Dictionary of meters the plan was compiled for
+    plan : ReadPlan
+        Plan of the reads
+
+    Fields which couldn't be read, because their meter didn't respond in time or is skipped
+    after failing repeatedly (see ``readings.health``), are None, so the rest of the reading can still be saved.
+
+    Raises
+    ------
+    ConnectionError | asyncio.TimeoutError | ModbusException
+        If none of the meters could be read
+
+    Returns
+    -------
+    dict
+        Contains the decoded values, with the same keys as the dictionary the plan was compiled from
+    """
+    results = {}
+    errors = []
+    for meter_results in await asyncio.gather(*(_read_meter_blocks(name, meters[name], blocks)
+                                                 for name, blocks in plan.meter_blocks.items()),
+                                               return_exceptions=True):
+        if isinstance(meter_results, READ_ERRORS):
+            errors.append(meter_results)
+        elif isinstance(meter_results, BaseException):
+            raise meter_results
+        else:
+            results.update(meter_results)
+    if errors and not results:
+        raise errors[0]
+    # Keep the order of the input dictionary
+    return {key: results.get(key) for key in plan.keys}
+
+
+async def read_registers(meters: dict[str, Meter], registers: dict[any, Register],
+                         max_gap: Optional[int] = None) -> dict:
+    """Reads a set of registers from the meters
+
+    Lazy-connects to the meters if needed, the connections are kept open for the next reads.
+    Registers close to each other are read with a single request, see ``_plan_reads()``.
+    Different meters are read concurrently, so a slow meter doesn't delay the others.
+
+    The reads are planned for every call,
+    use ``compile_plan()`` and ``read_plan()`` to read the same registers repeatedly.
 
     Parameters
     ----------
@@ -173,33 +639,19 @@ async def read_registers(meters: dict[str, Meter], registers: dict[str, Register
 
         Should contain all meters needed for the registers.
 
-    registers : dict[str, Register]
-        Dictionary of registers to read, with the register name as key and the register object as value
+    registers : dict[any, Register]
+        Dictionary of registers to read, with the register name as key and the register object as value.
+
+        Any hashable key can be used, e.g. ``(symbol, register_name)`` to read all symbols of a table at once.
+    max_gap : int, optional
+        Amount of unused registers allowed within a single request, defaults to the ``max_read_gap`` setting
 
     Returns
     -------
     dict
         Contains the decoded values, with the same keys as the input dictionary
     """
-    assert isinstance(registers, dict)
-
-    results = {}
-    for key, register in registers.items():
-        # Prepare the meter
-        meter = meters[register.meter]
-        assert meter is not None
-        meter.lock.acquire(blocking=True)
-        # --- In lock ---
-        await _connect_meter(meter)
-
-        # Perform the read
-        results[key] = await _read_register(meter, register)
-
-        # Close the connection
-        await meter.client.close()
-        # --- Out of lock ---
-        meter.lock.release()
-    return results
+    return await read_plan(meters, compile_plan(meters, registers, max_gap))
 
 
 # Public functions for reading data from specific register sets
@@ -0,0 +1,416 @@
+"""Module for querying QuestDB over its HTTP endpoint.
+
+Results are streamed as they arrive from QuestDB, without loading whole result sets into memory.
+Connections are kept alive and reused between queries, see ``HttpConnectionPool``.
+
+The endpoint and the limits can be configured with: ::
+
+    [questdb_http]
+    host = # IP address of the QuestDB server
+    port = # Port of the QuestDB's HTTP endpoint
+    max_rows = # Maximum amount of rows returned by a single query
+    max_connections = # Maximum amount of concurrent queries, the others wait for a free connection
+    idle_timeout = # Seconds after which an unused connection is closed
+    timeout = # Timeout of connecting and of waiting for data, in seconds
+    allow_writes = # Whether queries other than SELECT and SHOW are sent, false by default
+
+"""
+import asyncio
+import time
+from typing import AsyncIterator, Optional
+from urllib.parse import urlencode
+
+from config.config_loading import load_settings
+from readings import metrics
+
+# Default values of the query settings, see the module docstring
+DEFAULT_SETTINGS = {
+    "host": "127.0.0.1",
+    "port": 9000,
+    "max_rows": 100000,
+    "max_connections": 4,
+    "idle_timeout": 30.0,
+    "timeout": 30.0,
+    "allow_writes": False,
+}
+# First keywords of the queries sent when writes are not allowed
+READ_KEYWORDS = ("select", "show")
+# Paths of the QuestDB endpoints returning the result in each format
+FORMATS = {
+    "json": "/exec",
+    "csv": "/exp",
+}
+# Maximum size of the pieces of a response body with a known length
+READ_CHUNK_BYTES = 64 * 1024
+
+# Global variables
+# Query settings, lazy-loaded
+settings: Optional[dict[str, any]] = None
+# Connections to the HTTP endpoint, lazy-loaded
+pool: Optional["HttpConnectionPool"] = None
+
+QUERY_ERRORS = metrics.registry.counter(
+    "questdb_query_errors_total", "Amount of queries which failed or were rejected by QuestDB")
+
+
+class HttpStats:
+    """Counters of an ``HttpConnectionPool``.
+
+    Attributes
+    ----------
+    requests : int
+        Amount of requests sent
+    connects : int
+        Amount of connections opened
+    reused : int
+        Amount of requests sent over a kept-alive connection
+    aborted : int
+        Amount of responses closed before being read completely, e.g. because the client disconnected
+    """
+    def __init__(self):
+        self.requests = 0
+        self.connects = 0
+        self.reused = 0
+        self.aborted = 0
+
+
+class _Connection:
+    __slots__ = ("reader", "writer", "last_used")
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+
+    def is_usable(self, idle_timeout: float) -> bool:
+        return (not self.writer.is_closing() and not self.reader.at_eof()
+                and time.monotonic() - self.last_used < idle_timeout)
+
+    def close(self):
+        self.writer.close()
+
+
+class HttpResponse:
+    """Response to a request of ``HttpConnectionPool``, with the body read on demand.
+
+    The response holds its connection until it's closed.
+    A completely read response returns the connection to the pool, otherwise the connection is dropped,
+    which makes QuestDB stop executing the query.
+
+    Attributes
+    ----------
+    status : int
+        HTTP status code
+    headers : dict[str, str]
+        Headers of the response, with lowercase names
+    """
+    def __init__(self, pool: "HttpConnectionPool", connection: _Connection, status: int, headers: dict[str, str]):
+        self.status = status
+        self.headers = headers
+        self._pool = pool
+        self._connection: Optional[_Connection] = connection
+        self._complete = False
+        self._keep_alive = headers.get("connection", "").lower() != "close"
+
+    async def _read_chunks(self) -> AsyncIterator[bytes]:
+        reader = self._connection.reader
+        timeout = self._pool.timeout
+        if self.headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size_line = await asyncio.wait_for(reader.readline(), timeout)
+                size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    # Trailers, ending with an empty line
+                    while (await asyncio.wait_for(reader.readline(), timeout)).strip():
+                        pass
+                    break
+                data = await asyncio.wait_for(reader.readexactly(size + 2), timeout)
+                yield data[:-2]
+        elif "content-length" in self.headers:
+            remaining = int(self.headers["content-length"])
+            while remaining > 0:
+                data = await asyncio.wait_for(reader.read(min(remaining, READ_CHUNK_BYTES)), timeout)
+                if not data:
+                    raise ConnectionError("Connection closed before the end of the response")
+                remaining -= len(data)
+                yield data
+        else:
+            # The body ends with the connection
+            self._keep_alive = False
+            while data := await asyncio.wait_for(reader.read(READ_CHUNK_BYTES), timeout):
+                yield data
+        self._complete = True
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """Yields the body in pieces as they arrive, closing the response at the end or when interrupted"""
+        try:
+            async for data in self._read_chunks():
+                yield data
+        finally:
+            self.close()
+
+    async def read(self) -> bytes:
+        """Reads the whole body, for small responses such as errors"""
+        return b"".join([data async for data in self.stream()])
+
+    def close(self):
+        """Returns the connection to the pool if the response was read completely, otherwise drops it"""
+        if self._connection is None:
+            return
+        connection, self._connection = self._connection, None
+        self._pool._release(connection, reusable=self._complete and self._keep_alive)
+
+
+class HttpConnectionPool:
+    """Pool of keep-alive HTTP/1.1 connections to a single server.
+
+    Limits the amount of concurrent requests, further requests wait for a connection to be released.
+    The pool is bound to the event loop it's first used on, like the arbiters of ``readings.arbitration``
+    it recreates its state when used from a different loop.
+
+    Attributes
+    ----------
+    host : str
+        Address of the server
+    port : int
+        Port of the server
+    max_connections : int
+        Maximum amount of connections in use at once
+    idle_timeout : float
+        Seconds after which an unused connection is closed instead of reused
+    timeout : float
+        Timeout of connecting and of waiting for data, in seconds
+    stats : HttpStats
+        Counters of the pool
+    """
+    def __init__(self, host: str, port: int, max_connections: int = 4, idle_timeout: float = 30.0,
+                 timeout: float = 30.0):
+        self.host = host
+        self.port = int(port)
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.stats = HttpStats()
+        self._idle: list[_Connection] = []
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Connections of another loop can't be used on this one
+            self._idle = []
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+            self._loop = loop
+        return self._semaphore
+
+    async def _connect(self) -> _Connection:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        self.stats.connects += 1
+        return _Connection(reader, writer)
+
+    def _take_idle(self) -> Optional[_Connection]:
+        while self._idle:
+            connection = self._idle.pop()
+            if connection.is_usable(self.idle_timeout):
+                return connection
+            connection.close()
+        return None
+
+    async def _send(self, connection: _Connection, target: str) -> Optional[tuple[int, dict[str, str]]]:
+        """Sends a GET request and reads the head of the response, returns None if the connection was closed"""
+        connection.writer.write((f"GET {target} HTTP/1.1\r\n"
+                                 f"Host: {self.host}:{self.port}\r\n"
+                                 f"Accept-Encoding: identity\r\n"
+                                 f"Connection: keep-alive\r\n\r\n").encode())
+        await connection.writer.drain()
+        status_line = await asyncio.wait_for(connection.reader.readline(), self.timeout)
+        if not status_line:
+            return None
+        _, status, *_ = status_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while (line := await asyncio.wait_for(connection.reader.readline(), self.timeout)).strip():
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return int(status), headers
+
+    async def get(self, path: str, params: Optional[dict[str, any]] = None) -> HttpResponse:
+        """Sends a GET request and returns the response once its head is received.
+
+        The response must be closed, either by reading it completely or with ``HttpResponse.close()``.
+
+        Parameters
+        ----------
+        path : str
+            Path of the request
+        params : dict[str, any], optional
+            Query parameters of the request
+
+        Raises
+        ------
+        OSError
+            If the server can't be connected to or closes the connection
+        asyncio.TimeoutError
+            If the server doesn't respond within the timeout
+
+        Returns
+        -------
+        HttpResponse
+            Response holding its connection
+        """
+        target = path + ("?" + urlencode(params) if params else "")
+        semaphore = self._get_semaphore()
+        await semaphore.acquire()
+        try:
+            self.stats.requests += 1
+            connection = self._take_idle()
+            if connection is not None:
+                self.stats.reused += 1
+                try:
+                    head = await self._send(connection, target)
+                except asyncio.TimeoutError:
+                    # The server is slow rather than gone, the response may still arrive on this connection
+                    connection.close()
+                    raise
+                except OSError:
+                    head = None
+                except BaseException:
+                    connection.close()
+                    raise
+                if head is None:
+                    # Closed by the server while idle
+                    connection.close()
+                    connection = None
+            if connection is None:
+                connection = await self._connect()
+                try:
+                    head = await self._send(connection, target)
+                except BaseException:
+                    connection.close()
+                    raise
+                if head is None:
+                    connection.close()
+                    raise ConnectionError(f"Connection to {self.host}:{self.port} closed without a response")
+        except BaseException:
+            semaphore.release()
+            raise
+        return HttpResponse(self, connection, *head)
+
+    def _release(self, connection: _Connection, reusable: bool):
+        if reusable and self._loop is not None:
+            connection.last_used = time.monotonic()
+            self._idle.append(connection)
+        else:
+            if not reusable:
+                self.stats.aborted += 1
+            connection.close()
+        self._semaphore.release()
+
+    def close_all(self):
+        """Closes the idle connections"""
+        while self._idle:
+            self._idle.pop().close()
+
+    def snapshot(self) -> dict[str, any]:
+        """Returns the counters of the pool as a dictionary, including the amount of idle connections"""
+        return {
+            "idle_connections": len(self._idle),
+            "requests": self.stats.requests,
+            "connects": self.stats.connects,
+            "reused": self.stats.reused,
+            "aborted": self.stats.aborted,
+        }
+
+
+def _get_settings() -> dict[str, any]:
+    global settings
+    if settings is None:
+        settings = load_settings("questdb_http", DEFAULT_SETTINGS)
+    return settings
+
+
+def _get_pool() -> HttpConnectionPool:
+    """Lazily creates the connection pool from the settings"""
+    global pool
+    if pool is None:
+        current = _get_settings()
+        pool = HttpConnectionPool(
+            current["host"], current["port"],
+            max_connections=current["max_connections"],
+            idle_timeout=current["idle_timeout"],
+            timeout=current["timeout"],
+        )
+    return pool
+
+
+def close_connections():
+    """Closes the idle connections to QuestDB, they are reopened by the next query"""
+    if pool is not None:
+        pool.close_all()
+
+
+@metrics.registry.collector
+def _collect_metrics() -> list[metrics.Family]:
+    """Exposes the counters of the connection pool"""
+    if pool is None:
+        return []
+    stats = pool.snapshot()
+    return [
+        ("questdb_queries_total", "counter", "Amount of queries sent to QuestDB", [({}, stats["requests"])]),
+        ("questdb_http_connects_total", "counter", "Amount of connections made to the HTTP endpoint",
+         [({}, stats["connects"])]),
+        ("questdb_queries_aborted_total", "counter", "Amount of results not read until the end",
+         [({}, stats["aborted"])]),
+    ]
+
+
+def _check_read_only(sql: str):
+    """Rejects queries which are not a single SELECT or SHOW statement"""
+    statement = sql.strip().rstrip(";").lstrip("(")
+    keyword = statement.split(None, 1)[0].lower() if statement else ""
+    if keyword not in READ_KEYWORDS:
+        raise ValueError(f"Only SELECT and SHOW queries are allowed, got: {keyword or 'an empty query'}")
+    if ";" in statement:
+        raise ValueError("Only a single statement is allowed per query")
+
+
+async def query(sql: str, format: str = "json", limit: Optional[int] = None) -> HttpResponse:
+    """Sends a query to QuestDB and returns the response, with the result to be streamed.
+
+    Parameters
+    ----------
+    sql : str
+        Query to execute
+    format : str, optional
+        Format of the result, ``"json"`` (default) or ``"csv"``, see ``FORMATS``
+    limit : int, optional
+        Maximum amount of returned rows, capped and defaulting to the ``max_rows`` setting
+
+    Raises
+    ------
+    ValueError
+        If the format is not supported, the limit is not positive,
+        or the query is not a single SELECT or SHOW while the ``allow_writes`` setting is off
+    OSError
+        If QuestDB can't be connected to
+    asyncio.TimeoutError
+        If QuestDB doesn't respond within the timeout
+
+    Returns
+    -------
+    HttpResponse
+        Response of QuestDB, an error if its status is not 200
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unsupported result format: {format}")
+    if not _get_settings()["allow_writes"]:
+        _check_read_only(sql)
+    max_rows = _get_settings()["max_rows"]
+    if limit is None:
+        limit = max_rows
+    elif limit < 1:
+        raise ValueError(f"Row limit must be positive, got {limit}")
+    response = await _get_pool().get(FORMATS[format], {"query": sql, "limit": min(limit, max_rows)})
+    if response.status != 200:
+        QUERY_ERRORS.inc()
+    return response
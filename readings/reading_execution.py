@@ -1,37 +1,253 @@
 """Module containing functions for taking and saving specific readings.
 
+Each reading of a table is timed, see ``PollTiming``. How its rows are stamped can be configured with: ::
+
+    [acquisition]
+    timestamp = # "start" or "midpoint" (default) of the reading
+    latency_column = # Name of a column to store the duration of the reading in seconds, not stored if empty
+
+Tables with a deadband ingest only the values which changed, see ``readings.deadband``,
+and sampled tables ingest a single aggregated row per reading interval, see ``readings.sampling``.
+
 """
 import asyncio
+import time
+from datetime import timedelta
+from typing import Optional
+
+from questdb.ingress import TimestampMicros
 
-from readings.db_functions import ingest, ingest_phases
-from readings.modbus import read_registers, read_phases, read_avg, read_panel
+from config.config_loading import load_settings
+from readings import latest, live, metrics
+from readings.deadband import get_filter
+from readings.sampling import get_aggregator
+from readings.db_functions import ingest, ingest_phases, flush, flush_async
+from readings.modbus import ReadPlan, compile_plan, read_plan, read_phases, read_avg, read_panel
 from readings.data_classes import Meter, Table, Register, DataTemplates, is_correct_to_template
 
+# Default values of the acquisition settings, see the module docstring
+DEFAULT_SETTINGS = {
+    "timestamp": "midpoint",
+    "latency_column": "",
+}
+
+# Acquisition settings, lazy-loaded
+settings: Optional[dict[str, any]] = None
+
+POLL_SECONDS = metrics.registry.histogram(
+    "poll_duration_seconds", "Duration of reading all registers of a table", ("table",))
+
+
+def _get_settings() -> dict[str, any]:
+    global settings
+    if settings is None:
+        settings = load_settings("acquisition", DEFAULT_SETTINGS)
+        if settings["timestamp"] not in PollTiming.MODES:
+            raise ValueError(f"Unknown acquisition timestamp mode: {settings['timestamp']}")
+    return settings
+
+
+class PollTiming:
+    """Start and end of reading a table, on both the wall clock and the monotonic clock.
+
+    Durations are measured with the monotonic clock, so they aren't affected by changes of the system time.
+
+    Attributes
+    ----------
+    start_wall : int
+        Wall clock time of the start, in nanoseconds since the epoch
+    start_monotonic : int
+        Monotonic time of the start, in nanoseconds
+    end_monotonic : int | None
+        Monotonic time of the end, in nanoseconds, None until ``finish()`` is called
+    """
+    MODES = ("start", "midpoint")
+
+    def __init__(self):
+        self.start_wall = time.time_ns()
+        self.start_monotonic = time.monotonic_ns()
+        self.end_monotonic: Optional[int] = None
+
+    def finish(self):
+        """Records the end of the reading"""
+        self.end_monotonic = time.monotonic_ns()
+
+    @property
+    def latency(self) -> float:
+        """Duration of the reading in seconds"""
+        return (self.end_monotonic - self.start_monotonic) / 1e9
+
+    @property
+    def end_wall(self) -> int:
+        """Wall clock time of the end, in nanoseconds since the epoch"""
+        return self.start_wall + self.end_monotonic - self.start_monotonic
+
+    def timestamp(self, mode: str = "midpoint") -> TimestampMicros:
+        """Returns the timestamp for the rows of the reading.
+
+        Parameters
+        ----------
+        mode : str, optional
+            ``"start"`` of the reading or its ``"midpoint"`` (default)
+
+        Returns
+        -------
+        TimestampMicros
+            Timestamp of the reading
+        """
+        match mode:
+            case "start":
+                return TimestampMicros(self.start_wall // 1000)
+            case "midpoint":
+                return TimestampMicros((self.start_wall + (self.end_monotonic - self.start_monotonic) // 2) // 1000)
+            case _:
+                raise ValueError(f"Unknown timestamp mode: {mode}")
+
+
+def _get_plan(table: Table, meters: dict[str, Meter]) -> ReadPlan:
+    """Lazily compiles the plan for reading the table, see ``readings.modbus.compile_plan()``
+
+    The plan of a symbolic table reads all symbols at once, with ``(symbol, register_name)`` keys,
+    so they are read concurrently and can share requests.
+    """
+    if table.plan is None:
+        match table.type:
+            case Table.Types.SIMPLE:
+                registers = table.fields
+            case Table.Types.SYMBOLIC:
+                registers = {
+                    (symbol, name): register
+                    for symbol, fields in table.fields.items()
+                    for name, register in fields.items()
+                }
+            case _:
+                raise ValueError(f"Table type {table.type} not recognized")
+        table.plan = compile_plan(meters, registers)
+    return table.plan
+
+
+async def _read_table(table: Table, table_name: str, meters: dict[str, Meter]) -> (dict, PollTiming):
+    """Reads all registers of the table and times the reading.
+
+    Fields of meters which couldn't be read are None, see ``readings.modbus.read_plan()``.
+    If no field could be read, the last known values of the table are marked as bad, see ``readings.latest``.
+    """
+    timing = PollTiming()
+    try:
+        data = await read_plan(meters, _get_plan(table, meters))
+    except Exception:
+        latest.store.mark_bad(table_name)
+        raise
+    timing.finish()
+    POLL_SECONDS.observe(timing.latency, (table_name,))
+    return data, timing
+
 
 # Old hardcoded functions
 def measure_and_save_phases():
+    timing = PollTiming()
     phases = asyncio.run(read_phases())
+    timing.finish()
     for phase in phases:
         assert is_correct_to_template(phase, DataTemplates.PHASE)
-    ingest_phases(phases)
+    ingest_phases(phases, timestamp=timing.timestamp(_get_settings()["timestamp"]))
 
 
 def measure_and_save_avg():
     avg = asyncio.run(read_avg())
     assert is_correct_to_template(avg, DataTemplates.AVG)
     ingest("electric_avg", avg)
+    flush()
 
 
 def measure_and_save_panel():
     panel = asyncio.run(read_panel())
     assert is_correct_to_template(panel, DataTemplates.PANEL)
     ingest("panel", panel)
+    flush()
+
+
+def _ingest_window(table: Table, table_name: str,
+                   finished: Optional[tuple[int, list[tuple[Optional[str], dict[str, any]]]]]):
+    """Ingests the aggregated rows of a finished window, see ``WindowAggregator.add()``"""
+    if finished is None:
+        return
+    start, aggregated = finished
+    for symbol, row in aggregated:
+        ingest(table_name, row, timestamp=TimestampMicros(start),
+               symbols=None if symbol is None else {table.symbol_field: symbol})
+
+
+def save_open_window(table: Table, table_name: str):
+    """Ingests the window of a sampled table aggregated so far, e.g. when its job stops.
+
+    Does nothing for tables which aren't sampled or haven't been read yet, see ``WindowAggregator.flush()``.
+    The rows are sent with the next flush.
+    """
+    if table.aggregator is not None:
+        _ingest_window(table, table_name, table.aggregator.flush())
+
+
+def _save_rows(table: Table, table_name: str, rows: list[tuple[Optional[str], dict[str, any]]],
+               timestamp: TimestampMicros, window: Optional[timedelta], aggregate: bool = True):
+    """Ingests the rows of a reading, with their symbol (None in a simple table), and publishes them.
+
+    Rows of a sampled table are aggregated instead, see ``readings.sampling``, or only published if not ``aggregate``,
+    and rows of a table with a deadband are filtered, see ``readings.deadband``.
+    The latest values and the live streams get every reading either way.
+    """
+    aggregator = get_aggregator(table)
+    if aggregator is not None:
+        if aggregate:
+            if window is None:
+                raise ValueError(f"Sampled table {table_name} needs a window to aggregate over")
+            finished = aggregator.add(rows, timestamp.value, window // timedelta(microseconds=1))
+            _ingest_window(table, table_name, finished)
+    else:
+        change_filter = get_filter(table)
+        for symbol, values in rows:
+            row = values if change_filter is None else change_filter.filter(
+                values, timestamp.value, symbol=symbol, table_name=table_name)
+            if row is not None:
+                ingest(table_name, row, timestamp=timestamp,
+                       symbols=None if symbol is None else {table.symbol_field: symbol})
+    for symbol, values in rows:
+        latest.store.update(table_name, values, timestamp.value, symbol=symbol)
+        live.broker.publish(table_name, values, timestamp.value, symbol=symbol)
 
 
 # The proper generic API
-def measure_and_save(table: Table, table_name: str, meters: dict[str, Meter]):
+def measure_and_save(table: Table, table_name: str, meters: dict[str, Meter], window: Optional[timedelta] = None):
+    """Takes a reading from a meter and saves it to the database.
+
+    Runs ``measure_and_save_async()`` in a new event loop,
+    use the coroutine directly if an event loop is already running.
+
+    Parameters
+    ----------
+    table : Table
+        Table to save the reading to
+    table_name : str
+        Name of the table (necessary, because Table can't easily get the name from the key it's stored in)
+    meters : dict[str, Meter]
+        Dictionary of meters to take the reading from
+    window : timedelta, optional
+        Interval over which the readings of a sampled table are aggregated, required for sampled tables
+
+    Returns
+    -------
+    dict
+        The saved reading, see ``measure_and_save_async()``
+    """
+    return asyncio.run(measure_and_save_async(table, table_name, meters, window))
+
+
+async def measure_and_save_async(table: Table, table_name: str, meters: dict[str, Meter],
+                                 window: Optional[timedelta] = None, aggregate: bool = True) -> dict:
     """Takes a reading from a meter and saves it to the database.
 
+    Coroutine counterpart of ``measure_and_save()``, for running on a long-lived event loop.
+
     Parameters
     ----------
     table : Table
@@ -40,23 +256,58 @@ def measure_and_save(table: Table, table_name: str, meters: dict[str, Meter]):
         Name of the table (necessary, because Table can't easily get the name from the key it's stored in)
     meters : dict[str, Meter]
         Dictionary of meters to take the reading from
+    window : timedelta, optional
+        Interval over which the readings of a sampled table are aggregated, required for sampled tables,
+        see ``readings.sampling``
+    aggregate : bool, optional
+        Whether the reading of a sampled table is added to its window, by default True,
+        otherwise it's only published, e.g. for an on-demand refresh between the samples
 
+    Returns
+    -------
+    dict
+        The saved reading, with the field names as keys,
+        or in a symbolic table with the symbols as keys and dictionaries of the fields as values.
+        Symbols none of whose fields could be read are neither saved nor published, their values are None
+        and marked as bad in ``readings.latest``
     """
+    current = _get_settings()
+    latency_column = current["latency_column"]
     match table.type:  # Yes, I'm using match-case in Python. Yes, I'm a C++ programmer.
         case Table.Types.SIMPLE:
             # Verify that values of table.fields are Register objects
             if not all(isinstance(field, Register) for field in table.fields.values()):
                 raise TypeError("Simple table fields must be Register objects")
 
-            data = asyncio.run(read_registers(meters, table.fields))
-            ingest(table_name, data)
+            data, timing = await _read_table(table, table_name, meters)
+            if latency_column:
+                data[latency_column] = timing.latency
+            rows = [(None, data)]
+            reading = data
         case Table.Types.SYMBOLIC:
             # Verify that values of table.fields are dicts of Register objects
             if not all(isinstance(fields, dict) for fields in table.fields.values()):
                 raise TypeError("Symbolic table fields must be dicts of Register objects")
 
+            # Read all symbols at once, so they are read concurrently and can share requests
+            data, timing = await _read_table(table, table_name, meters)
+            rows = []
+            reading = {}
             for symbol, fields in table.fields.items():
-                data = asyncio.run(read_registers(meters, fields))
-                ingest(table_name, data, symbols={table.symbol_field: symbol})
+                symbol_data = {name: data[(symbol, name)] for name in fields}
+                if all(value is None for value in symbol_data.values()):
+                    # Its meters didn't answer, there is nothing to save but the latency
+                    latest.store.mark_bad(table_name, str(symbol))
+                    reading[symbol] = symbol_data
+                    continue
+                if latency_column:
+                    symbol_data[latency_column] = timing.latency
+                rows.append((str(symbol), symbol_data))
+                reading[symbol] = symbol_data
         case _:
             raise ValueError(f"Table type {table.type} not recognized")
+    # All symbols are read together, so they share the timestamp
+    _save_rows(table, table_name, rows, timing.timestamp(current["timestamp"]), window, aggregate)
+    # End of the poll, send the rows together with other tables finishing now
+    await flush_async()
+    return reading
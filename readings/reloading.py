@@ -0,0 +1,185 @@
+"""Module for reloading the configuration while the jobs are running.
+
+``ConfigWatcher`` polls the modification times of the configuration files and calls back once a change
+has settled, see ``readings.scheduler.reload_jobs()``. ``diff_config()`` compares two loaded register reference
+files, so only the jobs of the changed tables are touched, while unchanged meters and tables keep their objects,
+along with their connections and compiled read plans.
+
+"""
+import asyncio
+import os
+from typing import Awaitable, Callable, Optional
+
+import yaml
+
+from readings import metrics
+from readings.data_classes import Meter, Table
+
+# Attributes set at runtime, which are not part of the configuration
+RUNTIME_ATTRIBUTES = frozenset(("client", "plan", "change_filter", "aggregator"))
+
+RELOADS = metrics.registry.counter(
+    "config_reloads_total", "Amount of configuration reloads, by whether they were applied", ("result",))
+
+
+def _state(value: any) -> any:
+    """Converts a loaded configuration object into comparable plain values"""
+    if isinstance(value, yaml.YAMLObject):
+        return (type(value).__name__, {
+            name: _state(attribute) for name, attribute in vars(value).items() if name not in RUNTIME_ATTRIBUTES
+        })
+    if isinstance(value, dict):
+        return {key: _state(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_state(item) for item in value]
+    return value
+
+
+def _table_meters(table: Table) -> set[str]:
+    if table.type == Table.Types.SYMBOLIC:
+        return {register.meter for fields in table.fields.values() for register in fields.values()}
+    return {register.meter for register in table.fields.values()}
+
+
+class ConfigDiff:
+    """Differences between two loaded register reference files, see ``diff_config()``.
+
+    Attributes
+    ----------
+    meters : dict[str, Meter]
+        New meters, with the objects of the unchanged meters kept from the old configuration
+    tables : dict[str, Table]
+        New tables, with the objects of the unchanged tables kept from the old configuration
+    changed_meters : set[str]
+        Names of the added, removed and modified meters
+    added : list[str]
+        Names of the tables only in the new configuration
+    removed : list[str]
+        Names of the tables only in the old configuration
+    changed : list[str]
+        Names of the tables whose definition or meters were modified
+    """
+    def __init__(self, meters: dict[str, Meter], tables: dict[str, Table], changed_meters: set[str],
+                 added: list[str], removed: list[str], changed: list[str]):
+        self.meters = meters
+        self.tables = tables
+        self.changed_meters = changed_meters
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __bool__(self) -> bool:
+        return bool(self.changed_meters or self.added or self.removed or self.changed)
+
+
+def diff_config(old_meters: dict[str, Meter], old_tables: dict[str, Table],
+                new_meters: dict[str, Meter], new_tables: dict[str, Table]) -> ConfigDiff:
+    """Compares two loaded register reference files.
+
+    Parameters
+    ----------
+    old_meters : dict[str, Meter]
+        Meters in use
+    old_tables : dict[str, Table]
+        Tables in use
+    new_meters : dict[str, Meter]
+        Freshly loaded meters
+    new_tables : dict[str, Table]
+        Freshly loaded tables
+
+    Returns
+    -------
+    ConfigDiff
+        Differences of the configurations, with the objects to use from now on
+    """
+    meters = {}
+    changed_meters = set(old_meters) - set(new_meters)
+    for name, meter in new_meters.items():
+        old = old_meters.get(name)
+        if old is not None and _state(old) == _state(meter):
+            meters[name] = old
+        else:
+            meters[name] = meter
+            changed_meters.add(name)
+
+    tables = {}
+    added, changed = [], []
+    for name, table in new_tables.items():
+        old = old_tables.get(name)
+        if old is None:
+            tables[name] = table
+            added.append(name)
+        elif _state(old) != _state(table) or _table_meters(table) & changed_meters:
+            tables[name] = table
+            changed.append(name)
+        else:
+            tables[name] = old
+    removed = [name for name in old_tables if name not in new_tables]
+    return ConfigDiff(meters, tables, changed_meters, added, removed, changed)
+
+
+class ConfigWatcher:
+    """Watches files for changes by polling their modification times and sizes.
+
+    A change is reported once the files stayed the same for a whole interval,
+    so a file is not reloaded while an editor is still writing it.
+    Errors of the callback are printed and the watcher keeps running, so a broken file can be fixed in place.
+
+    Attributes
+    ----------
+    paths : list[str]
+        Paths of the watched files, which don't need to exist
+    interval : float
+        Seconds between checks of the files
+    """
+    def __init__(self, paths: list[str], interval: float, on_change: Callable[[], Awaitable[any]]):
+        self.paths = paths
+        self.interval = interval
+        self._on_change = on_change
+        self._stamps: Optional[tuple] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _stamp(self) -> tuple:
+        stamps = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                stamps.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def start(self):
+        """Starts watching on the running event loop, changes made before are not reported"""
+        if self._task is not None and not self._task.done():
+            return
+        self._stamps = self._stamp()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        pending = None
+        while True:
+            await asyncio.sleep(self.interval)
+            stamps = self._stamp()
+            if stamps == self._stamps:
+                pending = None
+            elif stamps != pending:
+                # Wait for the writes to settle
+                pending = stamps
+            else:
+                self._stamps, pending = stamps, None
+                try:
+                    await self._on_change()
+                    RELOADS.inc(("applied",))
+                except Exception as e:
+                    RELOADS.inc(("failed",))
+                    print(f"Reloading the configuration failed, keeping the previous one: {e!r}")
@@ -0,0 +1,155 @@
+"""Module for aggregating the readings of sampled tables into a single row per window.
+
+Tables with sampling, see ``readings.data_classes.Sampling``, are read every sampling interval,
+and ``WindowAggregator`` folds their readings into running aggregates, kept in compact arrays per field,
+so the memory doesn't grow with the amount of readings within a window.
+
+Windows are aligned to multiples of the table's reading interval since the epoch.
+The row of a window is ingested with the first reading of the next one, timestamped with the start of the window.
+A window still open when the job stops or the table is removed is ingested early, with the readings so far,
+see ``WindowAggregator.flush()``.
+
+"""
+from array import array
+from math import inf
+from typing import Optional
+
+from readings.data_classes import Sampling, Table
+
+
+class _Accumulators:
+    """Running aggregates of the fields of a single row (a symbol of a symbolic table)"""
+    __slots__ = ("slots", "minimum", "maximum", "total", "numbers", "count", "last")
+
+    def __init__(self):
+        # Index of each field in the arrays
+        self.slots: dict[str, int] = {}
+        self.minimum = array("d")
+        self.maximum = array("d")
+        self.total = array("d")
+        # Amount of numbers within the read values, which the mean is computed from
+        self.numbers = array("q")
+        self.count = array("q")
+        self.last: list[any] = []
+
+    def _add_slot(self, name: str) -> int:
+        slot = self.slots[name] = len(self.last)
+        self.minimum.append(inf)
+        self.maximum.append(-inf)
+        self.total.append(0.0)
+        self.numbers.append(0)
+        self.count.append(0)
+        self.last.append(None)
+        return slot
+
+    def add(self, values: dict[str, any]):
+        for name, value in values.items():
+            if value is None:
+                continue
+            slot = self.slots.get(name)
+            if slot is None:
+                slot = self._add_slot(name)
+            self.count[slot] += 1
+            self.last[slot] = value
+            # Booleans are ints, but aggregating them as numbers makes no sense
+            if (type(value) is float or type(value) is int) and value == value:
+                if value < self.minimum[slot]:
+                    self.minimum[slot] = value
+                if value > self.maximum[slot]:
+                    self.maximum[slot] = value
+                self.total[slot] += value
+                self.numbers[slot] += 1
+
+    def row(self, aggregates: list[str]) -> dict[str, any]:
+        row = {}
+        for name, slot in self.slots.items():
+            numbers = self.numbers[slot]
+            for aggregate in aggregates:
+                match aggregate:
+                    case "min" if numbers:
+                        row[f"{name}_min"] = self.minimum[slot]
+                    case "max" if numbers:
+                        row[f"{name}_max"] = self.maximum[slot]
+                    case "mean" if numbers:
+                        row[f"{name}_mean"] = self.total[slot] / numbers
+                    case "last":
+                        row[f"{name}_last"] = self.last[slot]
+                    case "count":
+                        row[f"{name}_count"] = self.count[slot]
+        return row
+
+
+class WindowAggregator:
+    """Aggregates the readings of a sampled table over windows aligned to the wall clock.
+
+    Attributes
+    ----------
+    aggregates : list[str]
+        Aggregates computed for each field, see ``Sampling.AGGREGATES``
+    window_start : int | None
+        Start of the current window, in microseconds since the epoch, None before the first reading
+    window_length : int
+        Length of the current window, in microseconds
+    """
+    def __init__(self, sampling: Sampling):
+        self.aggregates = list(sampling.aggregates)
+        self.window_start: Optional[int] = None
+        self.window_length = 0
+        self._rows: dict[Optional[str], _Accumulators] = {}
+
+    def add(self, rows: list[tuple[Optional[str], dict[str, any]]], timestamp: int,
+            window: int) -> Optional[tuple[int, list[tuple[Optional[str], dict[str, any]]]]]:
+        """Adds a reading to its window, finishing the previous window if the reading is past it.
+
+        Parameters
+        ----------
+        rows : list[tuple[str | None, dict[str, any]]]
+            Values of the reading with their symbol, None in a simple table
+        timestamp : int
+            Timestamp of the reading, in microseconds since the epoch
+        window : int
+            Length of the windows, in microseconds
+
+        Returns
+        -------
+        tuple[int, list[tuple[str | None, dict[str, any]]]] | None
+            Start of the finished window and its aggregated rows with their symbols,
+            None if the reading belongs to the current window
+        """
+        start = timestamp - timestamp % window
+        finished = None
+        if start != self.window_start or window != self.window_length:
+            finished = self.flush()
+            self.window_start, self.window_length = start, window
+        for symbol, values in rows:
+            accumulators = self._rows.get(symbol)
+            if accumulators is None:
+                accumulators = self._rows[symbol] = _Accumulators()
+            accumulators.add(values)
+        return finished
+
+    def flush(self) -> Optional[tuple[int, list[tuple[Optional[str], dict[str, any]]]]]:
+        """Finishes the current window, e.g. before it ends because the job stops.
+
+        Readings added later start over in the same window, so it can get a second row with the same timestamp.
+
+        Returns
+        -------
+        tuple[int, list[tuple[str | None, dict[str, any]]]] | None
+            Start of the window and its aggregated rows with their symbols, None if no reading was added to it
+        """
+        if not self._rows:
+            return None
+        finished = (self.window_start,
+                    [(symbol, accumulators.row(self.aggregates)) for symbol, accumulators in self._rows.items()])
+        self._rows = {}
+        return finished
+
+
+def get_aggregator(table: Table) -> Optional[WindowAggregator]:
+    """Lazily creates the aggregator of a table, returns None if the table isn't sampled"""
+    if table.sampling is None:
+        return None
+    if table.aggregator is None:
+        table.aggregator = WindowAggregator(table.sampling)
+    return table.aggregator
@@ -3,24 +3,174 @@
 It can be run as a standalone script, which launches jobs for all implemented meters,
 or imported and used in another script.
 
+Jobs run either as tasks on a single event loop (``AsyncJob``, the default of the script),
+or each in its own thread (``Job``, with ``--threaded``).
+Only ``AsyncJob`` keeps the Modbus connections open between readings, see ``readings.connection_pool``,
+a ``Job`` connects anew for every reading.
+The tables can also be spread over several worker processes, each with its own event loop,
+by running ``readings.sharding`` instead.
+
 The working directory must be the root of the project (one folder up) for the script to work.
 
 If not specified, the default interval is 15 minutes.
+Sampled tables are read every sampling interval instead, and their readings are aggregated
+over the configured interval, see ``readings.sampling``.
+
+By default, the next reading is taken one interval after the previous one has finished.
+Readings can instead be aligned to the wall clock, see ``Schedule``, configured with: ::
+
+    [scheduling]
+    aligned = true # e.g. every 15 minutes on :00, :15, :30 and :45
+    jitter = # Maximum random delay of a reading after its tick, in seconds
+    refresh_max_age = # Age in seconds up to which refresh() returns the last reading instead of taking a new one
+    watch_interval = # Seconds between checks of the configuration files for changes, 0 disables reloading
+
+While ``AsyncJob`` tasks run, changes of the register reference file and of the reading intervals
+are applied without restarting, see ``reload_jobs()``.
 
 """
+import argparse
+import asyncio
+import math
+import random
 import threading
 import time
 from datetime import timedelta
-from typing import Optional
+from typing import Iterable, Optional
+
+from config.config_loading import (CONFIG_PATH, load_config, ConfigNotFound, load_yaml_config, load_settings,
+                                   get_register_reference_path)
+from readings import db_functions, metrics, modbus
+from readings.data_classes import Meter, Table
+from readings.modbus import close_connections
+from readings.reloading import ConfigWatcher, diff_config
+from readings.reading_execution import measure_and_save, measure_and_save_async, save_open_window
+
+
+# Default values of the scheduling settings, see the module docstring
+DEFAULT_SETTINGS = {
+    "aligned": False,
+    "jitter": 0.0,
+    "refresh_max_age": 5.0,
+    "watch_interval": 2.0,
+}
+
+# Interval of the tables without a configured one
+DEFAULT_INTERVAL = timedelta(minutes=15)
 
-from config.config_loading import load_config, ConfigNotFound, load_yaml_config
-from readings.reading_execution import measure_and_save
+# Scheduling settings, lazy-loaded
+settings: Optional[dict[str, any]] = None
+
+LAG_SECONDS = metrics.registry.histogram(
+    "scheduler_lag_seconds", "Delay of executions after their intended time", ("job",))
+JOB_ERRORS = metrics.registry.counter(
+    "scheduler_errors_total", "Amount of executions of the job which ended with an error", ("job",))
+REFRESHES = metrics.registry.counter(
+    "scheduler_refreshes_total", "Amount of on-demand refreshes, by whether the last reading was reused",
+    ("job", "cached"))
+
+
+def _get_settings() -> dict[str, any]:
+    global settings
+    if settings is None:
+        settings = load_settings("scheduling", DEFAULT_SETTINGS)
+    return settings
+
+
+class Schedule:
+    """Decides when a job runs next and measures how late it actually runs.
+
+    In the aligned mode, ticks fall on multiples of the interval since the Unix epoch,
+    so jobs with the same interval take their readings together, without drifting by the duration of the readings.
+    Ticks missed because a reading took longer than the interval are skipped, so the readings don't pile up.
+
+    Otherwise, the next tick is one interval after the previous execution has finished.
+
+    Attributes
+    ----------
+    interval : timedelta
+        The interval between ticks.
+    aligned : bool
+        Whether the ticks are aligned to the wall clock.
+    jitter : float
+        Maximum random delay added to each tick, in seconds,
+        so jobs with the same interval don't all hit the same gateway at once.
+    name : str
+        Name of the job, used as the label of its metrics.
+    runs : int
+        Amount of ticks the job has run on.
+    skipped : int
+        Amount of ticks skipped because the previous execution overran them.
+    last_lag : float
+        Delay of the last execution after its intended time (tick plus jitter), in seconds.
+    max_lag : float
+        Highest delay so far, in seconds.
+    total_lag : float
+        Sum of all delays, in seconds.
+    """
+    def __init__(self, interval: timedelta, aligned: bool = False, jitter: float = 0.0, name: str = ""):
+        self.interval = interval
+        self.aligned = aligned
+        self.jitter = jitter
+        self.name = name
+        self._labels = (name,)
+        self.runs = 0
+        self.skipped = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self._tick: Optional[float] = None
+        self._intended = 0.0
+
+    def next_run(self) -> float:
+        """Computes the wall clock time of the next execution and remembers it.
+
+        Returns
+        -------
+        float
+            Time of the next execution, as returned by ``time.time()``, including the jitter
+        """
+        now = time.time()
+        interval = self.interval.total_seconds()
+        if not self.aligned:
+            tick = now + interval
+        else:
+            tick = (math.floor(now / interval) + 1) * interval
+            if self._tick is not None:
+                self.skipped += max(round((tick - self._tick) / interval) - 1, 0)
+        self._tick = tick
+        self._intended = tick + (random.uniform(0, self.jitter) if self.jitter > 0 else 0.0)
+        return self._intended
+
+    def started(self):
+        """Records the start of an execution planned by ``next_run()``"""
+        lag = max(time.time() - self._intended, 0.0)
+        self.runs += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.total_lag += lag
+        LAG_SECONDS.observe(lag, self._labels)
+
+    def snapshot(self) -> dict[str, any]:
+        """Returns the scheduling statistics as a dictionary"""
+        return {
+            "aligned": self.aligned,
+            "interval": self.interval.total_seconds(),
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+            "avg_lag": self.total_lag / self.runs if self.runs else 0.0,
+        }
 
 
 # Base source: https://medium.com/greedygame-engineering/an-elegant-way-to-run-periodic-tasks-in-python-61b7c477b679
 class Job(threading.Thread):
     """A job that runs periodically.
 
+    Each execution of ``measure_and_save()`` runs in a new event loop, so the connections to the meters
+    are not reused between the executions, unlike with ``AsyncJob``.
+
     Attributes
     ----------
     interval : timedelta
@@ -31,10 +181,12 @@ class Job(threading.Thread):
         The arguments to pass to the function.
     kwargs : dict
         The keyword arguments to pass to the function.
+    schedule : Schedule
+        Decides when the function is executed, by default one interval after the previous execution.
 
 
     """
-    def __init__(self, interval, execute, *args, **kwargs):
+    def __init__(self, interval, execute, *args, schedule: Optional[Schedule] = None, **kwargs):
         threading.Thread.__init__(self)
         self.daemon = False
         self.stopped = threading.Event()
@@ -42,6 +194,7 @@ class Job(threading.Thread):
         self.execute = execute
         self.args = args
         self.kwargs = kwargs
+        self.schedule = schedule or Schedule(interval)
 
     def stop(self):
         self.stopped.set()
@@ -50,50 +203,369 @@ class Job(threading.Thread):
     def run(self):
         """Starts the job.
 
-        Function in field ``execute`` will now be executed periodically, according to the interval.
+        Function in field ``execute`` will now be executed periodically, according to the schedule.
+        Errors of single executions are printed and counted, the job keeps running.
 
         """
-        while not self.stopped.wait(self.interval.total_seconds()):
-            self.execute(*self.args, **self.kwargs)
+        while not self.stopped.wait(max(self.schedule.next_run() - time.time(), 0.0)):
+            self.schedule.started()
+            try:
+                self.execute(*self.args, **self.kwargs)
+            except Exception as e:
+                JOB_ERRORS.inc((self.schedule.name,))
+                print(f"Job {self.schedule.name} failed: {e!r}")
 
 
-jobs: dict[str, Optional[Job]] = {}
+class AsyncJob:
+    """A job that runs periodically as a task on the running event loop.
 
+    Counterpart of ``Job`` for coroutines, so all jobs can share one event loop and its connections.
 
-def init_jobs():
-    """Initializes the jobs with the intervals specified in the config file.
+    Attributes
+    ----------
+    interval : timedelta
+        The interval between executions.
+    execute : coroutine function
+        The coroutine function to execute periodically.
+    args : list
+        The arguments to pass to the function.
+    kwargs : dict
+        The keyword arguments to pass to the function.
+    schedule : Schedule
+        Decides when the function is executed, by default one interval after the previous execution.
+    task : asyncio.Task
+        The task running the job, created by ``start()``.
+    last_result : any
+        Value returned by the last successful execution.
+    last_finished : float | None
+        Monotonic time of the end of the last successful execution, None before the first one.
+    last_finished_wall : float | None
+        Wall clock time of the same, as returned by ``time.time()``.
+
+    """
+    def __init__(self, interval, execute, *args, schedule: Optional[Schedule] = None, **kwargs):
+        self.stopped = asyncio.Event()
+        self.interval = interval
+        self.execute = execute
+        self.args = args
+        self.kwargs = kwargs
+        self.schedule = schedule or Schedule(interval)
+        self.task: Optional[asyncio.Task] = None
+        self.last_result = None
+        self.last_finished: Optional[float] = None
+        self.last_finished_wall: Optional[float] = None
+        self._in_flight: Optional[asyncio.Task] = None
+        # Execution of refreshes with their own arguments, see refresh()
+        self._refreshing: Optional[asyncio.Task] = None
+        # Set to wake the job up when it's stopped or rescheduled
+        self._changed = asyncio.Event()
+
+    @property
+    def running(self) -> bool:
+        """Whether the task of the job is running"""
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        """Creates the task of the job, must be called with the event loop running.
+
+        A stopped job can be started again, starting a running job does nothing.
+
+        """
+        if self.running:
+            return
+        self.stopped.clear()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        self.stopped.set()
+        self._changed.set()
+        if self.task is not None:
+            await self.task
+
+    def reschedule(self, interval: Optional[timedelta] = None, aligned: Optional[bool] = None,
+                   jitter: Optional[float] = None):
+        """Changes the schedule of the job, the next execution is planned again right away.
+
+        Parameters
+        ----------
+        interval : timedelta, optional
+            New interval between executions
+        aligned : bool, optional
+            Whether the executions are aligned to the wall clock, see ``Schedule``
+        jitter : float, optional
+            Maximum random delay of the executions, in seconds
+
+        Values which are not specified stay unchanged.
+        """
+        if interval is not None:
+            self.interval = self.schedule.interval = interval
+        if aligned is not None:
+            self.schedule.aligned = aligned
+        if jitter is not None:
+            self.schedule.jitter = jitter
+        self._changed.set()
+
+    async def run(self):
+        """Runs the job.
+
+        Coroutine in field ``execute`` will now be awaited periodically, according to the schedule.
+        Errors of single executions are printed and counted, the job keeps running.
+
+        """
+        while not self.stopped.is_set():
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), max(self.schedule.next_run() - time.time(), 0.0))
+            except asyncio.TimeoutError:
+                self.schedule.started()
+                try:
+                    await self._execute()
+                except Exception as e:
+                    JOB_ERRORS.inc((self.schedule.name,))
+                    print(f"Job {self.schedule.name} failed: {e!r}")
+
+    async def _execute(self) -> any:
+        """Executes the coroutine, or joins its execution already in flight.
+
+        The execution runs in its own task, so a cancelled caller doesn't cancel it for the others.
+        """
+        if self._in_flight is None:
+            self._in_flight = asyncio.get_running_loop().create_task(self._execute_once())
+        return await asyncio.shield(self._in_flight)
+
+    async def _execute_once(self) -> any:
+        try:
+            return await self._call(self.kwargs)
+        finally:
+            self._in_flight = None
+
+    async def _call(self, kwargs: dict[str, any]) -> any:
+        result = await self.execute(*self.args, **kwargs)
+        self.last_result = result
+        self.last_finished = time.monotonic()
+        self.last_finished_wall = time.time()
+        return result
+
+    async def _refresh_once(self, overrides: dict[str, any]) -> any:
+        try:
+            return await self._call({**self.kwargs, **overrides})
+        finally:
+            self._refreshing = None
+
+    async def refresh(self, max_age: float = 0.0, **overrides) -> dict[str, any]:
+        """Executes the coroutine now, unless the last result is at most ``max_age`` seconds old.
+
+        Concurrent refreshes share a single execution, which is also shared with a scheduled execution in flight.
+        With ``overrides``, an execution of the refreshes is not joined by the scheduled executions,
+        as their arguments differ.
+
+        Parameters
+        ----------
+        max_age : float, optional
+            Age of the last result in seconds up to which it's returned without executing, by default 0.0
+        overrides
+            Keyword arguments replacing those of the job when the refresh doesn't join a scheduled execution
+
+        Returns
+        -------
+        dict[str, any]
+            The ``result``, its ``timestamp`` (wall clock), its ``age`` in seconds
+            and whether it was ``cached`` from an earlier execution
+        """
+        cached = self.last_finished is not None and time.monotonic() - self.last_finished <= max_age
+        if not cached:
+            if not overrides or self._in_flight is not None:
+                await self._execute()
+            else:
+                if self._refreshing is None:
+                    self._refreshing = asyncio.get_running_loop().create_task(self._refresh_once(overrides))
+                await asyncio.shield(self._refreshing)
+        return {
+            "result": self.last_result,
+            "timestamp": self.last_finished_wall,
+            "age": time.monotonic() - self.last_finished,
+            "cached": cached,
+        }
+
+
+jobs: dict[str, Optional[Job | AsyncJob]] = {}
+# Configuration the jobs were created from, replaced by reload_jobs()
+loaded_meters: dict[str, Meter] = {}
+loaded_tables: dict[str, Table] = {}
+loaded_intervals: dict[str, timedelta] = {}
+# Tables selected by init_jobs(), None for all tables
+selected_tables: Optional[set[str]] = None
+# Watcher of the configuration files, running with the AsyncJob tasks
+watcher: Optional[ConfigWatcher] = None
+# Serializes reloads of the watcher and of the API, lazy-loaded
+reload_lock: Optional[asyncio.Lock] = None
+
+
+def load_intervals() -> dict[str, timedelta]:
+    """Loads the reading intervals of the tables from the config file.
 
     Intervals can be configured in the /config/config.ini file: ::
 
         [reading_intervals]
         job_name = # Interval in seconds
 
-    Defaults to 15 minutes if an interval is not specified.
-
-    The jobs are readings of tables loaded from the register reference file.
+    Tables without an interval are read every 15 minutes, see ``DEFAULT_INTERVAL``.
 
+    Returns
+    -------
+    dict[str, timedelta]
+        Configured intervals, with the table names as keys
     """
     # TODO: Move intervals to yaml config
     try:
         intervals = load_config(section="reading_intervals")
-        for name, interval in intervals.items():
-            intervals[name] = int(interval)
     except ConfigNotFound:
         print("Interval config not found, using default values of 15 minutes")
-        intervals = {}
+        return {}
+    return {name: timedelta(seconds=int(interval)) for name, interval in intervals.items()}
 
-    global jobs
 
-    meters, tables = load_yaml_config()
-    for name, table in tables.items():
-        jobs[name] = Job(
-            interval=timedelta(seconds=intervals.get(name, 15 * 60)),
-            execute=measure_and_save,
-            # kwargs passed to measure_and_save
-            table=table,
-            table_name=name,
-            meters=meters,
-        )
+def init_jobs(asynchronous: bool = False, tables: Optional[Iterable[str]] = None):
+    """Initializes the jobs with the intervals specified in the config file, see ``load_intervals()``.
+
+    The jobs are readings of tables loaded from the register reference file.
+    Their schedules follow the ``[scheduling]`` section, see the module docstring.
+
+    Parameters
+    ----------
+    asynchronous : bool, optional
+        Whether to create ``AsyncJob`` tasks instead of ``Job`` threads, by default False
+    tables : Iterable[str], optional
+        Names of the tables to create jobs for, by default all tables,
+        e.g. a shard of the tables run by a worker process, see ``readings.sharding``
+
+    """
+    global loaded_meters, loaded_tables, loaded_intervals, selected_tables
+
+    intervals = load_intervals()
+    meters, all_tables = load_yaml_config()
+    selected = None if tables is None else set(tables)
+    job_class = AsyncJob if asynchronous else Job
+    for name, table in all_tables.items():
+        if selected is not None and name not in selected:
+            continue
+        jobs[name] = _create_job(job_class, name, table, meters, intervals.get(name, DEFAULT_INTERVAL))
+    loaded_meters = meters
+    loaded_tables = {name: table for name, table in all_tables.items() if name in jobs}
+    loaded_intervals = intervals
+    selected_tables = selected
+
+
+def get_poll_interval(table: Table, interval: timedelta) -> timedelta:
+    """Returns the interval between the readings of a table, its sampling interval if it's sampled"""
+    return interval if table.sampling is None else timedelta(seconds=table.sampling.interval)
+
+
+def _create_job(job_class: type, name: str, table: Table, meters: dict[str, Meter],
+                interval: timedelta) -> Job | AsyncJob:
+    settings = _get_settings()
+    poll_interval = get_poll_interval(table, interval)
+    return job_class(
+        interval=poll_interval,
+        execute=measure_and_save_async if job_class is AsyncJob else measure_and_save,
+        schedule=Schedule(poll_interval, aligned=settings["aligned"], jitter=settings["jitter"], name=name),
+        # kwargs passed to measure_and_save
+        table=table,
+        table_name=name,
+        meters=meters,
+        window=interval,
+    )
+
+
+def _keep_window(old: Table, new: Table, name: str):
+    """Hands the window aggregated so far over to the new definition of a changed table.
+
+    If the aggregates changed or the table isn't sampled anymore, the window is ingested instead.
+    """
+    if old.aggregator is None:
+        return
+    if new.sampling is not None and list(new.sampling.aggregates) == old.aggregator.aggregates:
+        new.aggregator = old.aggregator
+    else:
+        save_open_window(old, name)
+
+
+async def reload_jobs() -> dict[str, list[str]]:
+    """Reloads the register reference file and the reading intervals, updating only the affected jobs.
+
+    Jobs of removed tables are stopped after their reading in flight, jobs of added tables are started,
+    and the jobs of changed tables read the new definition from their next reading on.
+    Unchanged meters and tables keep their objects, so their connections and read plans stay in use,
+    see ``readings.reloading.diff_config()``. Jobs stopped through ``stop_job()`` stay stopped.
+    When the jobs were created for a subset of the tables, other tables are ignored.
+    Connections, arbiters and circuit breakers of changed meters are recreated, see ``modbus.forget_meters()``.
+    Windows of sampled tables aggregated so far are ingested for removed tables and kept for changed ones.
+    Concurrent reloads, e.g. of the watcher and of the API, run one after another.
+
+    Raises
+    ------
+    config.config_compiler.ConfigError
+        If the register reference file is invalid, the jobs then keep running with the previous configuration
+    yaml.YAMLError
+        If the register reference file can't be parsed
+    OSError
+        If a configuration file can't be read
+
+    Returns
+    -------
+    dict[str, list[str]]
+        Names of the ``added``, ``removed``, ``changed`` and ``rescheduled`` tables
+    """
+    global reload_lock
+    if reload_lock is None:
+        reload_lock = asyncio.Lock()
+    async with reload_lock:
+        return await _reload_jobs()
+
+
+async def _reload_jobs() -> dict[str, list[str]]:
+    global loaded_meters, loaded_tables, loaded_intervals
+
+    current = _get_async_jobs()
+    new_meters, new_tables = await asyncio.to_thread(load_yaml_config)
+    intervals = load_intervals()
+    if selected_tables is not None:
+        new_tables = {name: table for name, table in new_tables.items() if name in selected_tables}
+    diff = diff_config(loaded_meters, loaded_tables, new_meters, new_tables)
+
+    for name in diff.removed:
+        job = current.pop(name)
+        await job.stop()
+        _save_open_window(job)
+    for name in diff.changed:
+        _keep_window(loaded_tables[name], diff.tables[name], name)
+    rescheduled = []
+    for name, job in current.items():
+        interval = intervals.get(name, DEFAULT_INTERVAL)
+        poll_interval = get_poll_interval(diff.tables[name], interval)
+        if poll_interval != get_poll_interval(loaded_tables[name], loaded_intervals.get(name, DEFAULT_INTERVAL)):
+            job.reschedule(poll_interval)
+            rescheduled.append(name)
+        job.kwargs["meters"] = diff.meters
+        job.kwargs["table"] = diff.tables[name]
+        job.kwargs["window"] = interval
+    for name in diff.added:
+        current[name] = _create_job(AsyncJob, name, diff.tables[name], diff.meters,
+                                    intervals.get(name, DEFAULT_INTERVAL))
+        current[name].start()
+
+    if diff.changed_meters:
+        definitions = [meters[name] for meters in (loaded_meters, diff.meters)
+                       for name in diff.changed_meters if name in meters]
+        await modbus.forget_meters(diff.changed_meters, definitions)
+        modbus.forget_register_reference()
+    loaded_meters, loaded_tables, loaded_intervals = diff.meters, diff.tables, intervals
+    # Sends the windows of the removed tables
+    await db_functions.flush_async()
+    changes = {"added": diff.added, "removed": diff.removed, "changed": diff.changed, "rescheduled": rescheduled}
+    if any(changes.values()):
+        print(f"Reloaded the configuration: {changes}")
+    return changes
 
 
 def start_jobs():
@@ -102,16 +574,215 @@ def start_jobs():
     If the jobs have not been initialized, ``init_jobs()`` is run.
 
     """
-    if not jobs or any(job is None for job in jobs.values()):
+    if not jobs or any(not isinstance(job, Job) for job in jobs.values()):
         init_jobs()
     for job in jobs.values():
         job.start()
 
 
+def job_stats() -> dict[str, dict[str, any]]:
+    """Returns the scheduling statistics of each job, see ``Schedule.snapshot()``, and whether it's running"""
+    return {
+        name: {**job.schedule.snapshot(), "running": job.running if isinstance(job, AsyncJob) else job.is_alive()}
+        for name, job in jobs.items() if job is not None
+    }
+
+
+def _get_async_jobs() -> dict[str, AsyncJob]:
+    """Returns the jobs, running ``init_jobs(asynchronous=True)`` if they are not ``AsyncJob``"""
+    if not jobs or any(not isinstance(job, AsyncJob) for job in jobs.values()):
+        init_jobs(asynchronous=True)
+    return jobs
+
+
+def _get_async_job(name: str) -> AsyncJob:
+    return _get_async_jobs()[name]
+
+
+def start_job(name: str):
+    """Starts the job of a table on the running event loop, if it's not running already
+
+    Raises
+    ------
+    KeyError
+        If the table doesn't exist
+    """
+    _get_async_job(name).start()
+
+
+async def stop_job(name: str):
+    """Stops the job of a table, waiting for its execution in flight to finish
+
+    Its connections stay open for the other jobs and a later start.
+    The window of a sampled table aggregated so far is ingested, see ``save_open_window()``.
+
+    Raises
+    ------
+    KeyError
+        If the table doesn't exist
+    """
+    job = _get_async_job(name)
+    await job.stop()
+    _save_open_window(job)
+    await db_functions.flush_async()
+
+
+def reschedule_job(name: str, interval: Optional[float] = None, aligned: Optional[bool] = None,
+                   jitter: Optional[float] = None):
+    """Changes the schedule of the job of a table, see ``AsyncJob.reschedule()``
+
+    Parameters
+    ----------
+    name : str
+        Name of the table
+    interval : float, optional
+        New interval in seconds
+    aligned : bool, optional
+        Whether the readings are aligned to the wall clock
+    jitter : float, optional
+        Maximum random delay of the readings, in seconds
+
+    Raises
+    ------
+    KeyError
+        If the table doesn't exist
+    ValueError
+        If the interval is not positive or the jitter is negative
+    """
+    job = _get_async_job(name)
+    if interval is not None and interval <= 0:
+        raise ValueError(f"Interval must be positive, got {interval}")
+    if jitter is not None and jitter < 0:
+        raise ValueError(f"Jitter can't be negative, got {jitter}")
+    job.reschedule(None if interval is None else timedelta(seconds=interval), aligned, jitter)
+
+
+@metrics.registry.collector
+def _collect_metrics() -> list[metrics.Family]:
+    """Exposes the amount of runs and skipped ticks of each job"""
+    stats = job_stats()
+    return [
+        ("scheduler_runs_total", "counter", "Amount of executions of the job",
+         [({"job": name}, job["runs"]) for name, job in stats.items()]),
+        ("scheduler_skipped_ticks_total", "counter", "Amount of ticks skipped because of overrunning executions",
+         [({"job": name}, job["skipped"]) for name, job in stats.items()]),
+    ]
+
+
+async def start_async_jobs():
+    """Starts all the jobs as tasks on the running event loop, and the watcher of the configuration files.
+
+    If the jobs have not been initialized as ``AsyncJob``, ``init_jobs(asynchronous=True)`` is run.
+
+    """
+    global watcher
+    for job in _get_async_jobs().values():
+        job.start()
+    interval = _get_settings()["watch_interval"]
+    if interval > 0 and watcher is None:
+        watcher = ConfigWatcher([get_register_reference_path(), CONFIG_PATH], interval, reload_jobs)
+        watcher.start()
+
+
+def _refresh_overrides(job: AsyncJob) -> dict[str, any]:
+    # A reading between the samples would skew the aggregates of the window, so it's only published
+    return {"aggregate": False} if job.kwargs["table"].sampling is not None else {}
+
+
+def _save_open_window(job: Job | AsyncJob):
+    """Ingests the window aggregated so far by a stopped job of a sampled table, see ``save_open_window()``"""
+    save_open_window(job.kwargs["table"], job.kwargs["table_name"])
+
+
+async def refresh(name: Optional[str] = None, max_age: Optional[float] = None) -> dict[str, dict[str, any]]:
+    """Takes readings of a table or all tables now, see ``AsyncJob.refresh()``.
+
+    Works whether the jobs are running or not, as long as they are ``AsyncJob``,
+    otherwise ``init_jobs(asynchronous=True)`` is run.
+    Readings of sampled tables taken by a refresh are not aggregated, see ``measure_and_save_async()``.
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the table, all tables are refreshed if not specified
+    max_age : float, optional
+        Age of the last reading in seconds up to which it's reused, defaults to the ``refresh_max_age`` setting
+
+    Raises
+    ------
+    KeyError
+        If the table doesn't exist
+    Exception
+        If reading a single table fails, when refreshing all tables the error is stored in its ``error`` entry instead
+
+    Returns
+    -------
+    dict[str, dict[str, any]]
+        Refresh of each table, with the table name as key
+    """
+    if max_age is None:
+        max_age = _get_settings()["refresh_max_age"]
+    names = list(_get_async_jobs()) if name is None else [name]
+    selected = [_get_async_job(job_name) for job_name in names]
+
+    results = await asyncio.gather(*(job.refresh(max_age, **_refresh_overrides(job)) for job in selected),
+                                   return_exceptions=name is None)
+    refreshes = {}
+    for job_name, result in zip(names, results):
+        if isinstance(result, Exception):
+            result = {"error": repr(result)}
+        else:
+            REFRESHES.inc((job_name, str(result["cached"]).lower()))
+        refreshes[job_name] = result
+    return refreshes
+
+
+async def stop_async_jobs():
+    """Stops all the running ``AsyncJob`` tasks and closes their Modbus and QuestDB connections.
+
+    Jobs which already ended with an error don't prevent the others from stopping.
+    The windows of sampled tables aggregated so far are ingested before closing.
+
+    """
+    global watcher
+    if watcher is not None:
+        await watcher.stop()
+        watcher = None
+    for name, result in zip(jobs, await asyncio.gather(*(job.stop() for job in jobs.values()),
+                                                       return_exceptions=True)):
+        if isinstance(result, Exception):
+            print(f"Job {name} ended with an error: {result!r}")
+    for job in jobs.values():
+        _save_open_window(job)
+    await close_connections()
+    await asyncio.to_thread(db_functions.close)
+
+
+async def _run_async():
+    await start_async_jobs()
+    try:
+        # Run until cancelled
+        await asyncio.Event().wait()
+    finally:
+        await stop_async_jobs()
+
+
 def _main():
     """Main function for running the scheduler as a standalone script.
 
     """
+    parser = argparse.ArgumentParser(description="Periodically reads the meters and saves the readings")
+    parser.add_argument("--threaded", action="store_true",
+                        help="run each job in its own thread instead of all on a single event loop")
+    args = parser.parse_args()
+
+    if not args.threaded:
+        try:
+            asyncio.run(_run_async())
+        except KeyboardInterrupt:
+            pass
+        return
+
     start_jobs()
     while True:
         try:
@@ -119,6 +790,8 @@ def _main():
         except KeyboardInterrupt:
             for job in jobs.values():
                 job.stop()
+                _save_open_window(job)
+            db_functions.close()
             break
 
 
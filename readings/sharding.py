@@ -0,0 +1,448 @@
+"""Module for spreading the jobs of the tables over several worker processes.
+
+A single event loop reads all the tables in one process, so decoding and ingestion of many meters
+are limited by a single core. The supervisor instead splits the tables into shards, each run by the jobs
+of its own worker process, see ``readings.scheduler``. Tables reading the same meter, and meters sharing
+a Modbus endpoint, always end up in the same shard, so every connection and its arbiter stay in a single process.
+Shards are balanced by the estimated amount of registers read per second.
+
+The workers send the rows of their readings and snapshots of their metrics back to the supervisor,
+which stores the rows in ``readings.latest``, publishes them to ``readings.live``
+and exposes the metrics of each worker with a ``worker`` label.
+Crashed workers are restarted, with a delay growing while they keep crashing.
+Each worker spools the rows it couldn't send in a directory of its own, see ``readings.db_functions``.
+Each worker reloads changes of its own tables, see ``readings.scheduler.reload_jobs()``,
+while tables added to the register reference file are only picked up by restarting the supervisor.
+
+Run from the root of the project with: ::
+
+    python -m readings.sharding --workers 4
+
+The supervisor can be configured with: ::
+
+    [sharding]
+    workers = # Amount of worker processes, 0 runs all jobs in the main process
+    report_interval = # Seconds between metrics reports of the workers
+    restart_delay = # Seconds before restarting a crashed worker, doubled while it keeps crashing
+    max_restart_delay = # Upper limit of the restart delay, a worker running this long is considered healthy
+
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from datetime import timedelta
+from typing import Optional
+
+from config.config_loading import load_settings, load_yaml_config
+from readings import db_functions, latest, live, metrics, scheduler
+from readings.data_classes import Meter, Register, Table
+
+# Default values of the sharding settings, see the module docstring
+DEFAULT_SETTINGS = {
+    "workers": 0,
+    "report_interval": 5.0,
+    "restart_delay": 1.0,
+    "max_restart_delay": 60.0,
+}
+# Seconds given to a worker to stop its jobs and flush its rows before it's killed
+STOP_TIMEOUT = 10.0
+# Seconds between checks of the worker processes
+MONITOR_INTERVAL = 0.5
+
+# Global variables
+# Sharding settings, lazy-loaded
+settings: Optional[dict[str, any]] = None
+# Running supervisor, created by start()
+supervisor: Optional["Supervisor"] = None
+
+
+def _get_settings() -> dict[str, any]:
+    global settings
+    if settings is None:
+        settings = load_settings("sharding", DEFAULT_SETTINGS)
+    return settings
+
+
+def _table_registers(table: Table) -> list[Register]:
+    if table.type == Table.Types.SYMBOLIC:
+        return [register for fields in table.fields.values() for register in fields.values()]
+    return list(table.fields.values())
+
+
+def plan_shards(meters: dict[str, Meter], tables: dict[str, Table], workers: int,
+                intervals: Optional[dict[str, timedelta]] = None) -> list[list[str]]:
+    """Splits the tables into shards for the worker processes.
+
+    Tables connected through a shared meter or a shared endpoint (gateway or serial bus) form a group,
+    which is never split. The groups are assigned heaviest first to the least loaded shard,
+    weighing each table by its amount of registers divided by its interval (its sampling interval if it's sampled).
+
+    Parameters
+    ----------
+    meters : dict[str, Meter]
+        Meters of the register reference file
+    tables : dict[str, Table]
+        Tables of the register reference file
+    workers : int
+        Maximum amount of shards
+    intervals : dict[str, timedelta], optional
+        Reading intervals of the tables, missing ones default to ``readings.scheduler.DEFAULT_INTERVAL``
+
+    Raises
+    ------
+    ValueError
+        If the amount of workers is not positive
+
+    Returns
+    -------
+    list[list[str]]
+        Names of the tables of each shard, without empty shards
+    """
+    if workers < 1:
+        raise ValueError(f"Amount of workers must be positive, got {workers}")
+    intervals = intervals or {}
+
+    # Union-find over the tables, meters and endpoints
+    parents: dict[tuple, tuple] = {}
+
+    def find(node: tuple) -> tuple:
+        parents.setdefault(node, node)
+        while parents[node] != node:
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+        return node
+
+    def union(first: tuple, second: tuple):
+        parents[find(first)] = find(second)
+
+    weights: dict[str, float] = {}
+    for name, table in tables.items():
+        find(("table", name))
+        registers = _table_registers(table)
+        interval = scheduler.get_poll_interval(table, intervals.get(name, scheduler.DEFAULT_INTERVAL))
+        weights[name] = len(registers) / interval.total_seconds()
+        for register in registers:
+            union(("table", name), ("meter", register.meter))
+            meter = meters.get(register.meter)
+            if meter is not None:
+                union(("meter", register.meter), ("endpoint", *meter.id.endpoint))
+
+    groups: dict[tuple, list[str]] = {}
+    for name in tables:
+        groups.setdefault(find(("table", name)), []).append(name)
+
+    shards: list[list[str]] = [[] for _ in range(min(workers, len(groups)))]
+    loads = [0.0] * len(shards)
+    for group in sorted(groups.values(), key=lambda names: -sum(weights[name] for name in names)):
+        lightest = loads.index(min(loads))
+        shards[lightest].extend(group)
+        loads[lightest] += sum(weights[name] for name in group)
+    return [shard for shard in shards if shard]
+
+
+async def _run_worker(index: int, tables: list[str], reports: multiprocessing.Queue, report_interval: float):
+    """Runs the jobs of a shard until cancelled, or until one of them fails"""
+    db_functions.use_worker_spool(index)
+    scheduler.init_jobs(asynchronous=True, tables=tables)
+    subscription = live.broker.subscribe()
+    await scheduler.start_async_jobs()
+
+    async def forward_rows():
+        while True:
+            reports.put(("rows", index, await subscription.get()))
+
+    async def report_metrics():
+        while True:
+            reports.put(("metrics", index, metrics.registry.families()))
+            await asyncio.sleep(report_interval)
+
+    async def watch_jobs():
+        # Reloads stop and replace jobs, so the current ones are looked up on every check
+        while True:
+            await asyncio.sleep(MONITOR_INTERVAL)
+            for name, job in list(scheduler.jobs.items()):
+                if job.task is not None and job.task.done() and not job.stopped.is_set():
+                    # Raises the error of a failed job, so the worker exits and is restarted
+                    if not job.task.cancelled():
+                        job.task.result()
+                    raise RuntimeError(f"Job {name} of worker {index} stopped unexpectedly")
+
+    tasks = [asyncio.create_task(forward_rows()), asyncio.create_task(report_metrics()),
+             asyncio.create_task(watch_jobs())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+        raise RuntimeError(f"Worker {index} stopped unexpectedly")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await scheduler.stop_async_jobs()
+        # Rows of the readings in flight when stopping, and the final counters of the worker
+        if rows := subscription.drain():
+            reports.put(("rows", index, rows))
+        subscription.close()
+        reports.put(("metrics", index, metrics.registry.families()))
+
+
+def _worker_main(index: int, tables: list[str], reports: multiprocessing.Queue, report_interval: float):
+    """Entry point of a worker process, stops gracefully on SIGTERM"""
+    # Interrupting the terminal is left to the supervisor, which stops the workers in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    async def main():
+        task = asyncio.current_task()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+        await _run_worker(index, tables, reports, report_interval)
+
+    try:
+        asyncio.run(main())
+    except asyncio.CancelledError:
+        pass
+
+
+class _Worker:
+    """State of a single worker process of the supervisor"""
+    __slots__ = ("index", "tables", "process", "started", "restarts", "restart_at", "delay", "families",
+                 "reported_at")
+
+    def __init__(self, index: int, tables: list[str], delay: float):
+        self.index = index
+        self.tables = tables
+        self.process: Optional[multiprocessing.Process] = None
+        self.started = 0.0
+        self.restarts = 0
+        self.restart_at: Optional[float] = None
+        self.delay = delay
+        self.families: list[metrics.RenderedFamily] = []
+        self.reported_at: Optional[float] = None
+
+
+class Supervisor:
+    """Runs the shards in worker processes, restarts them when they crash and collects their reports.
+
+    The workers are spawned rather than forked, so they don't inherit the connections or the event loop
+    of the supervisor. The supervisor runs in two threads of its own, monitoring the processes
+    and receiving the reports, so it can be used both from a plain script and alongside an event loop.
+
+    Attributes
+    ----------
+    shards : list[list[str]]
+        Names of the tables of each worker, see ``plan_shards()``
+    report_interval : float
+        Seconds between metrics reports of the workers
+    restart_delay : float
+        Seconds before restarting a crashed worker, doubled after each crash of a worker running shorter
+        than ``max_restart_delay``
+    max_restart_delay : float
+        Upper limit of the restart delay
+    """
+    def __init__(self, shards: list[list[str]], report_interval: float = 5.0, restart_delay: float = 1.0,
+                 max_restart_delay: float = 60.0):
+        self.shards = shards
+        self.report_interval = report_interval
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self._context = multiprocessing.get_context("spawn")
+        self._reports: Optional[multiprocessing.Queue] = None
+        self._workers = [_Worker(index, tables, restart_delay) for index, tables in enumerate(shards)]
+        self._stopping = threading.Event()
+        self._monitor_thread: Optional[threading.Thread] = None
+        self._receiver_thread: Optional[threading.Thread] = None
+
+    def _spawn(self, worker: _Worker):
+        worker.process = self._context.Process(
+            target=_worker_main, name=f"readings-worker-{worker.index}",
+            args=(worker.index, worker.tables, self._reports, self.report_interval),
+        )
+        worker.process.start()
+        worker.started = time.monotonic()
+        worker.restart_at = None
+
+    def start(self):
+        """Starts the worker processes and the threads of the supervisor.
+
+        Rows spooled by workers of a previous run with more shards are handed over to the new workers first.
+        """
+        self._stopping.clear()
+        db_functions.merge_worker_spools(len(self._workers))
+        self._reports = self._context.Queue()
+        for worker in self._workers:
+            self._spawn(worker)
+        self._monitor_thread = threading.Thread(target=self._monitor, name="sharding-monitor", daemon=True)
+        self._receiver_thread = threading.Thread(target=self._receive, name="sharding-receiver", daemon=True)
+        self._monitor_thread.start()
+        self._receiver_thread.start()
+
+    def stop(self, timeout: float = STOP_TIMEOUT):
+        """Stops the workers, giving them ``timeout`` seconds to flush their readings before killing them"""
+        self._stopping.set()
+        if self._monitor_thread is not None:
+            # No worker is restarted from now on
+            self._monitor_thread.join()
+        for worker in self._workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            if worker.process is None:
+                continue
+            worker.process.join(max(deadline - time.monotonic(), 0.0))
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+        if self._receiver_thread is not None:
+            # Received after the last reports of the workers
+            self._reports.put(None)
+            self._receiver_thread.join()
+        self._monitor_thread = self._receiver_thread = None
+
+    def _monitor(self):
+        while not self._stopping.wait(MONITOR_INTERVAL):
+            now = time.monotonic()
+            for worker in self._workers:
+                if worker.restart_at is not None:
+                    if now >= worker.restart_at:
+                        self._spawn(worker)
+                elif not worker.process.is_alive():
+                    self._crashed(worker, now)
+
+    def _crashed(self, worker: _Worker, now: float):
+        print(f"Worker {worker.index} exited with code {worker.process.exitcode}, "
+              f"restarting in {worker.delay:.1f} s")
+        worker.restarts += 1
+        worker.families = []
+        if now - worker.started >= self.max_restart_delay:
+            # Ran long enough to be considered healthy, start over with the initial delay
+            worker.delay = self.restart_delay
+        worker.restart_at = now + worker.delay
+        worker.delay = min(worker.delay * 2, self.max_restart_delay)
+
+    def _receive(self):
+        while True:
+            try:
+                message = self._reports.get(timeout=MONITOR_INTERVAL)
+            except queue.Empty:
+                continue
+            if message is None:
+                return
+            kind, index, payload = message
+            worker = self._workers[index]
+            if kind == "metrics":
+                worker.families = payload
+                worker.reported_at = time.time()
+            elif kind == "rows":
+                for row in payload:
+                    latest.store.update(row["table"], row["values"], row["timestamp"], symbol=row["symbol"])
+                    live.broker.publish(row["table"], row["values"], row["timestamp"], symbol=row["symbol"])
+
+    def worker_families(self) -> list[metrics.RenderedFamily]:
+        """Returns the last reported metrics of all workers, labelled with their indexes"""
+        return [
+            metrics.with_labels(family, {"worker": str(worker.index)})
+            for worker in self._workers for family in worker.families
+        ]
+
+    def snapshot(self) -> list[dict[str, any]]:
+        """Returns the state of each worker as a dictionary"""
+        return [
+            {
+                "worker": worker.index,
+                "tables": worker.tables,
+                "pid": worker.process.pid if worker.process is not None else None,
+                "alive": worker.process is not None and worker.process.is_alive(),
+                "restarts": worker.restarts,
+                "reported_at": worker.reported_at,
+            }
+            for worker in self._workers
+        ]
+
+
+def start(workers: Optional[int] = None) -> Supervisor:
+    """Plans the shards of the register reference file and starts their workers.
+
+    Parameters
+    ----------
+    workers : int, optional
+        Amount of worker processes, defaults to the ``workers`` setting
+
+    Raises
+    ------
+    ValueError
+        If the amount of workers is not positive
+
+    Returns
+    -------
+    Supervisor
+        The started supervisor, also kept in the ``supervisor`` global variable
+    """
+    global supervisor
+    current = _get_settings()
+    meters, tables = load_yaml_config()
+    shards = plan_shards(meters, tables, current["workers"] if workers is None else workers, scheduler.load_intervals())
+    supervisor = Supervisor(
+        shards,
+        report_interval=current["report_interval"],
+        restart_delay=current["restart_delay"],
+        max_restart_delay=current["max_restart_delay"],
+    )
+    supervisor.start()
+    return supervisor
+
+
+def stop():
+    """Stops the running supervisor and its workers, if any"""
+    global supervisor
+    if supervisor is not None:
+        supervisor.stop()
+        supervisor = None
+
+
+def is_enabled() -> bool:
+    """Whether the jobs are configured to run in worker processes"""
+    return _get_settings()["workers"] > 0
+
+
+@metrics.registry.source
+def _worker_metrics() -> list[metrics.RenderedFamily]:
+    return supervisor.worker_families() if supervisor is not None else []
+
+
+@metrics.registry.collector
+def _collect_metrics() -> list[metrics.Family]:
+    """Exposes the state of the workers"""
+    if supervisor is None:
+        return []
+    workers = supervisor.snapshot()
+    return [
+        ("sharding_worker_up", "gauge", "Whether the worker process is running",
+         [({"worker": str(worker["worker"])}, int(worker["alive"])) for worker in workers]),
+        ("sharding_worker_restarts_total", "counter", "Amount of restarts of the worker process after crashing",
+         [({"worker": str(worker["worker"])}, worker["restarts"]) for worker in workers]),
+    ]
+
+
+def _main():
+    """Main function for running the supervisor as a standalone script, in place of ``readings.scheduler``"""
+    parser = argparse.ArgumentParser(description="Reads the meters in several worker processes")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="amount of worker processes, defaults to the workers setting or the amount of CPU cores")
+    args = parser.parse_args()
+
+    workers = args.workers or _get_settings()["workers"] or os.cpu_count()
+    start(workers)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop()
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,233 @@
+"""Module for keeping readings on disk while QuestDB is unreachable.
+
+Rows which could not be sent are appended, as InfluxDB line protocol text, to segment files in the spool directory.
+The lines contain the original timestamps, so replaying them later doesn't change the data.
+
+Segments are append-only and synced to disk once per appended batch.
+When the spool exceeds its size cap, the oldest segments are evicted, losing the oldest readings first.
+Segments left over by a previous run are picked up and replayed as well.
+
+"""
+import os
+import threading
+from typing import Callable, Optional
+
+SEGMENT_SUFFIX = ".ilp"
+
+
+class SpoolStats:
+    """Counters describing the work done by a ``Spool``.
+
+    Attributes
+    ----------
+    spooled_rows : int
+        Amount of rows written to the spool
+    replayed_rows : int
+        Amount of rows sent from the spool
+    evicted_rows : int
+        Amount of rows lost because of exceeding the size cap
+    evicted_bytes : int
+        Amount of bytes lost because of exceeding the size cap
+    """
+    def __init__(self):
+        self.spooled_rows = 0
+        self.replayed_rows = 0
+        self.evicted_rows = 0
+        self.evicted_bytes = 0
+
+
+class Spool:
+    """Append-only, size-capped store of line protocol rows split into segment files.
+
+    Safe to use from several threads.
+
+    Attributes
+    ----------
+    directory : str
+        Directory containing the segment files
+    max_bytes : int
+        Maximum total size of the segments, the oldest are evicted above it
+    segment_bytes : int
+        Size after which a new segment is started
+    stats : SpoolStats
+        Counters of the spool
+    """
+    def __init__(self, directory: str, max_bytes: int = 100 * 1024 * 1024, segment_bytes: int = 4 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.stats = SpoolStats()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # Closed segments, oldest first, with their sizes
+        self._segments: list[tuple[str, int]] = [
+            (path, os.path.getsize(path)) for path in sorted(
+                os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX)
+            )
+        ]
+        self._next_index = 1 + max((int(os.path.basename(path)[:-len(SEGMENT_SUFFIX)])
+                                    for path, _ in self._segments), default=0)
+        self._current: Optional[tuple[str, object]] = None
+        self._current_size = 0
+
+    def _segment_path(self, index: int) -> str:
+        return os.path.join(self.directory, f"{index:09d}{SEGMENT_SUFFIX}")
+
+    def _close_current(self):
+        if self._current is not None:
+            path, file = self._current
+            file.close()
+            self._segments.append((path, self._current_size))
+            self._current = None
+            self._current_size = 0
+
+    def _evict(self):
+        total = sum(size for _, size in self._segments) + self._current_size
+        while total > self.max_bytes and self._segments:
+            path, size = self._segments.pop(0)
+            try:
+                with open(path, "rb") as file:
+                    self.stats.evicted_rows += file.read().count(b"\n")
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.stats.evicted_bytes += size
+            total -= size
+
+    def append(self, data: bytes):
+        """Appends line protocol rows to the spool and syncs them to disk.
+
+        Parameters
+        ----------
+        data : bytes
+            Complete lines of the InfluxDB line protocol
+        """
+        if not data:
+            return
+        with self._lock:
+            if self._current is None:
+                path = self._segment_path(self._next_index)
+                self._next_index += 1
+                self._current = (path, open(path, "ab"))
+            file = self._current[1]
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+            self._current_size += len(data)
+            self.stats.spooled_rows += data.count(b"\n")
+            if self._current_size >= self.segment_bytes:
+                self._close_current()
+            self._evict()
+
+    def pending_bytes(self) -> int:
+        """Returns the total size of the data waiting to be replayed"""
+        with self._lock:
+            return sum(size for _, size in self._segments) + self._current_size
+
+    def replay(self, send: Callable[[bytes], None], chunk_bytes: int = 1024 * 1024) -> int:
+        """Sends the spooled rows, oldest first, in chunks of complete lines.
+
+        Segments are removed once they are completely sent.
+        If sending fails, the unsent rest of the segment is kept for the next replay and the exception is raised.
+
+        Parameters
+        ----------
+        send : Callable[[bytes], None]
+            Function sending a chunk of line protocol rows, raising an exception on failure
+        chunk_bytes : int, optional
+            Approximate size of the chunks, by default 1 MiB
+
+        Returns
+        -------
+        int
+            Amount of rows sent
+        """
+        with self._lock:
+            # The current segment is closed, so new failures don't append to a segment being replayed
+            self._close_current()
+            segments = list(self._segments)
+
+        sent_rows = 0
+        for path, _ in segments:
+            try:
+                with open(path, "rb") as file:
+                    data = file.read()
+            except FileNotFoundError:
+                # Evicted in the meantime
+                continue
+            offset = 0
+            try:
+                while offset < len(data):
+                    end = data.rfind(b"\n", offset, offset + chunk_bytes) + 1
+                    if end <= offset:
+                        # A single line longer than the chunk
+                        end = data.index(b"\n", offset) + 1
+                    send(data[offset:end])
+                    rows = data.count(b"\n", offset, end)
+                    sent_rows += rows
+                    self.stats.replayed_rows += rows
+                    offset = end
+            except BaseException:
+                self._keep_rest(path, data[offset:])
+                raise
+            self._remove(path)
+        return sent_rows
+
+    def _keep_rest(self, path: str, rest: bytes):
+        """Replaces a partially replayed segment with its unsent part"""
+        with self._lock:
+            for i, (segment_path, _) in enumerate(self._segments):
+                if segment_path == path:
+                    temporary = path + ".tmp"
+                    with open(temporary, "wb") as file:
+                        file.write(rest)
+                        file.flush()
+                        os.fsync(file.fileno())
+                    os.replace(temporary, path)
+                    self._segments[i] = (path, len(rest))
+                    break
+
+    def _remove(self, path: str):
+        with self._lock:
+            self._segments = [(segment_path, size) for segment_path, size in self._segments if segment_path != path]
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def adopt(self, directory: str) -> int:
+        """Moves the segments of another spool directory into this spool, to be replayed after its own.
+
+        The other directory must not be in use by a spool, it's removed once it's empty.
+
+        Parameters
+        ----------
+        directory : str
+            Directory containing the segment files
+
+        Returns
+        -------
+        int
+            Amount of moved segments
+        """
+        with self._lock:
+            # Closed first, so the rows appended to it so far are replayed before the adopted ones
+            self._close_current()
+            names = sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+            for name in names:
+                path = self._segment_path(self._next_index)
+                self._next_index += 1
+                os.replace(os.path.join(directory, name), path)
+                self._segments.append((path, os.path.getsize(path)))
+            self._evict()
+        try:
+            os.rmdir(directory)
+        except OSError:
+            # Not empty, e.g. a partial replay left a temporary file
+            pass
+        return len(names)
+
+    def close(self):
+        """Closes the current segment, the spooled data stays on disk"""
+        with self._lock:
+            self._close_current()
@@ -0,0 +1,70 @@
+"""Tests of the grouping of registers into block reads, see ``readings.modbus._plan_reads()``."""
+import pytest
+
+from readings.data_classes import Meter, Register
+from readings.modbus import MAX_BLOCK_LENGTH, _plan_reads
+
+FLOAT = Meter.RegisterType(">", ">", 2, "input")
+FLAG = Meter.RegisterType(">", ">", 1, "holding")
+
+
+def _meters() -> dict[str, Meter]:
+    return {
+        "electric": Meter(Meter.Identification("electric", 1, "127.0.0.1", 502), {"float": FLOAT}),
+        "panel": Meter(Meter.Identification("panel", 2, "127.0.0.1", 502), {"float": FLOAT, "bool16": FLAG}),
+    }
+
+
+def _floats(*addresses: int, meter: str = "electric") -> dict[str, Register]:
+    return {f"{meter}_{address}": Register(address, "float", meter) for address in addresses}
+
+
+def _spans(blocks) -> list[tuple[int, int]]:
+    return [(block.start, block.count) for block in blocks]
+
+
+def test_contiguous_registers_are_read_in_one_block():
+    blocks = _plan_reads(_meters(), _floats(104, 100, 102), max_gap=0)
+    assert _spans(blocks) == [(100, 6)]
+    assert [key for key, _, _ in blocks[0].fields] == ["electric_100", "electric_102", "electric_104"]
+
+
+def test_gap_up_to_max_gap_is_read_over():
+    # 4 unused registers between 102 and 106
+    assert _spans(_plan_reads(_meters(), _floats(100, 106), max_gap=4)) == [(100, 8)]
+    assert _spans(_plan_reads(_meters(), _floats(100, 106), max_gap=3)) == [(100, 2), (106, 2)]
+
+
+def test_blocks_are_split_at_max_block_length():
+    addresses = range(0, 2 * 70, 2)
+    blocks = _plan_reads(_meters(), _floats(*addresses), max_gap=0)
+    assert [block.count for block in blocks] == [124, 16]
+    assert all(block.count <= MAX_BLOCK_LENGTH for block in blocks)
+    assert sum(len(block.fields) for block in blocks) == len(addresses)
+    # No field straddles two blocks
+    assert blocks[1].start == blocks[0].end
+
+
+def test_meters_and_read_types_are_read_separately():
+    registers = {
+        **_floats(100, 102),
+        **_floats(104, meter="panel"),
+        "flag": Register(106, "bool16", "panel"),
+    }
+    blocks = _plan_reads(_meters(), registers, max_gap=10)
+    assert sorted((block.meter, block.read_type, block.start, block.count) for block in blocks) == [
+        ("electric", "input", 100, 4),
+        ("panel", "holding", 106, 1),
+        ("panel", "input", 104, 2),
+    ]
+
+
+def test_planned_blocks_decode_their_fields():
+    blocks = _plan_reads(_meters(), _floats(100, 104), max_gap=4)
+    registers = [0x3F80, 0x0000, 0xFFFF, 0xFFFF, 0x4000, 0x0000]
+    assert blocks[0].decoder.decode(registers) == {"electric_100": 1.0, "electric_104": 2.0}
+
+
+def test_unknown_register_type_is_rejected():
+    with pytest.raises(ValueError):
+        _plan_reads(_meters(), {"voltage": Register(100, "int", "electric")}, max_gap=0)
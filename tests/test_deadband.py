@@ -0,0 +1,74 @@
+"""Tests of the change-only ingestion of tables with a deadband, see ``readings.deadband``."""
+from readings.data_classes import Deadband, Register, Table
+from readings.deadband import ChangeFilter, get_filter
+
+SECOND = 1_000_000
+START = 1_700_000_000 * SECOND
+
+
+def _table(deadband: Deadband, **field_deadbands: Deadband) -> Table:
+    fields = {name: Register(2 * i, "float", "electric", field_deadbands.get(name))
+              for i, name in enumerate(["voltage", "current"])}
+    return Table(fields, deadband=deadband)
+
+
+def _ingested(change_filter: ChangeFilter, readings: list[dict], step: int = SECOND, symbol: str = None) -> list:
+    """Filters readings taken ``step`` microseconds apart, returns what is ingested of each"""
+    return [change_filter.filter(values, START + i * step, symbol) for i, values in enumerate(readings)]
+
+
+def test_table_without_deadband_is_not_filtered():
+    assert get_filter(_table(None)) is None
+    assert get_filter(_table(None, voltage=Deadband(absolute=1.0))) is not None
+
+
+def test_absolute_deadband():
+    change_filter = ChangeFilter(_table(Deadband(absolute=1.0)))
+    readings = [{"voltage": 230.0}, {"voltage": 230.9}, {"voltage": 231.5}, {"voltage": 230.6}, {"voltage": 230.4}]
+    assert _ingested(change_filter, readings) == [readings[0], None, readings[2], None, readings[4]]
+
+
+def test_slow_drift_is_compared_with_the_last_ingested_value():
+    change_filter = ChangeFilter(_table(Deadband(absolute=1.0)))
+    readings = [{"voltage": 230.0 + 0.4 * i} for i in range(6)]
+    # 231.2 is the first value more than 1 away from 230.0, and 232.0 is still within 1 of 231.2
+    assert [values is not None for values in _ingested(change_filter, readings)] == [
+        True, False, False, True, False, False]
+
+
+def test_percent_deadband():
+    change_filter = ChangeFilter(_table(Deadband(percent=10.0)))
+    readings = [{"current": 10.0}, {"current": 10.9}, {"current": 11.1}, {"current": 10.1}, {"current": 9.9}]
+    assert _ingested(change_filter, readings) == [readings[0], None, readings[2], None, readings[4]]
+
+
+def test_field_deadband_overrides_the_table():
+    change_filter = ChangeFilter(_table(Deadband(absolute=5.0), current=Deadband(absolute=0.1)))
+    readings = [{"voltage": 230.0, "current": 10.0}, {"voltage": 231.0, "current": 10.0},
+                {"voltage": 231.0, "current": 10.2}]
+    assert _ingested(change_filter, readings) == [readings[0], None, readings[2]]
+
+
+def test_heartbeat_after_max_silence():
+    change_filter = ChangeFilter(_table(Deadband(absolute=1.0, max_silence=60)))
+    readings = [{"voltage": 230.0}] * 8
+    ingested = _ingested(change_filter, readings, step=20 * SECOND)
+    # Unchanged values are still ingested once every 60 seconds
+    assert [values is not None for values in ingested] == [True, False, False, True, False, False, True, False]
+
+
+def test_column_mode_ingests_only_changed_fields():
+    change_filter = ChangeFilter(_table(Deadband(absolute=1.0, mode=Deadband.Modes.COLUMN)))
+    readings = [{"voltage": 230.0, "current": 10.0, "latency": 0.1},
+                {"voltage": 232.0, "current": 10.5, "latency": 0.2},
+                {"voltage": 232.5, "current": 10.5, "latency": 0.3}]
+    assert _ingested(change_filter, readings) == [readings[0], {"voltage": 232.0, "latency": 0.2}, None]
+
+
+def test_symbols_are_filtered_separately():
+    fields = {symbol: {"voltage": Register(symbol, "float", "electric")} for symbol in (1, 2)}
+    change_filter = ChangeFilter(Table(fields, Table.Types.SYMBOLIC, "phase", deadband=Deadband(absolute=1.0)))
+    assert change_filter.filter({"voltage": 230.0}, START, "1") is not None
+    assert change_filter.filter({"voltage": 230.0}, START, "2") is not None
+    assert change_filter.filter({"voltage": 230.5}, START + SECOND, "1") is None
+    assert change_filter.filter({"voltage": 232.0}, START + SECOND, "2") is not None
@@ -0,0 +1,81 @@
+"""Tests of ``readings.decoding.BlockDecoder`` against ``pymodbus.payload.BinaryPayloadDecoder``.
+
+Every supported type is decoded in every byte and word order, from registers with distinct bytes,
+so a misplaced byte or word changes the value.
+
+"""
+import itertools
+import math
+
+import pytest
+from pymodbus.constants import Endian
+from pymodbus.payload import BinaryPayloadDecoder
+
+from readings.data_classes import Meter, Register
+from readings.decoding import TYPES, BlockDecoder
+
+ORDERS = {">": Endian.Big, "<": Endian.Little}
+LENGTHS = {"float": 2, "int": 1, "uint8": 1, "bool16": 1}
+# Registers of a block, with no two bytes alike
+REGISTERS = [0x4049, 0x0FDB, 0xC2F6, 0xE979, 0x8001, 0x00FF, 0x1234, 0xABCD]
+
+
+def _reference(registers: list[int], type_name: str, byteorder: str, wordorder: str) -> any:
+    """Decodes a value the way the readings were decoded before ``BlockDecoder``"""
+    decoder = BinaryPayloadDecoder.fromRegisters(registers, byteorder=ORDERS[byteorder],
+                                                 wordorder=ORDERS[wordorder])
+    match type_name:
+        case "float":
+            return decoder.decode_32bit_float()
+        case "int":
+            return decoder.decode_16bit_int()
+        case "uint8":
+            return decoder.decode_8bit_uint()
+        case "bool16":
+            return bool(decoder.decode_16bit_uint())
+
+
+def _same(value: any, expected: any) -> bool:
+    if isinstance(expected, float) and math.isnan(expected):
+        return isinstance(value, float) and math.isnan(value)
+    return value == expected and type(value) is type(expected)
+
+
+def test_all_types_are_covered():
+    assert set(LENGTHS) == set(TYPES)
+
+
+@pytest.mark.parametrize("type_name", sorted(TYPES))
+@pytest.mark.parametrize("byteorder, wordorder", list(itertools.product(ORDERS, repeat=2)))
+def test_single_field_matches_pymodbus(type_name, byteorder, wordorder):
+    reg_type = Meter.RegisterType(byteorder, wordorder, LENGTHS[type_name])
+    for address in range(len(REGISTERS) - LENGTHS[type_name] + 1):
+        decoder = BlockDecoder(0, len(REGISTERS), [("value", Register(address, type_name, "meter"), reg_type)])
+        expected = _reference(REGISTERS[address:address + LENGTHS[type_name]], type_name, byteorder, wordorder)
+        assert _same(decoder.decode(REGISTERS)["value"], expected), (address, byteorder, wordorder)
+
+
+@pytest.mark.parametrize("byteorder, wordorder", list(itertools.product(ORDERS, repeat=2)))
+def test_block_of_mixed_fields_matches_pymodbus(byteorder, wordorder):
+    types = {name: Meter.RegisterType(byteorder, wordorder, length) for name, length in LENGTHS.items()}
+    layout = [("float", 0), ("int", 2), ("float", 4), ("bool16", 6), ("uint8", 7)]
+    fields = [(f"{name}_{address}", Register(address, name, "meter"), types[name]) for name, address in layout]
+
+    decoded = BlockDecoder(0, len(REGISTERS), fields).decode(REGISTERS)
+
+    for key, register, _ in fields:
+        registers = REGISTERS[register.register:register.register + LENGTHS[register.type]]
+        assert _same(decoded[key], _reference(registers, register.type, byteorder, wordorder)), key
+
+
+def test_fields_sharing_a_register_are_decoded_separately():
+    reg_type = Meter.RegisterType(">", ">", 1)
+    fields = [("flag", Register(5, "bool16", "meter"), reg_type), ("high", Register(5, "uint8", "meter"), reg_type)]
+    decoder = BlockDecoder(5, 1, fields)
+    assert not decoder.single
+    assert decoder.decode([0x00FF]) == {"flag": True, "high": 0}
+
+
+def test_too_short_register_type_is_rejected():
+    with pytest.raises(ValueError):
+        BlockDecoder(0, 2, [("value", Register(0, "float", "meter"), Meter.RegisterType(">", ">", 1))])
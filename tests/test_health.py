@@ -0,0 +1,108 @@
+"""Tests of the isolation of unresponsive meters, see ``readings.health``, and of saving their partial readings."""
+import asyncio
+
+import pytest
+
+from readings import health, latest, live, reading_execution
+from readings.data_classes import Register, Table
+from readings.health import CircuitBreaker
+
+
+class _Clock:
+    """Replaces ``time.monotonic()`` of the module under test"""
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> _Clock:
+    clock = _Clock()
+    monkeypatch.setattr(health.time, "monotonic", clock)
+    return clock
+
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, backoff_initial=5.0)
+    breaker.failed()
+    breaker.succeeded()
+    for _ in range(2):
+        breaker.failed()
+        assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+    breaker.failed()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.trips == 1
+    assert not breaker.allow()
+    assert breaker.snapshot()["retry_in"] == 5.0
+
+
+def test_single_probe_after_the_backoff_closes_the_circuit(clock):
+    breaker = CircuitBreaker(failure_threshold=1, backoff_initial=5.0)
+    breaker.failed()
+    clock.now += 4.9
+    assert not breaker.allow()
+
+    clock.now += 0.1
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Other reads wait for the probe
+    assert not breaker.allow()
+
+    breaker.succeeded()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+    assert breaker.allow()
+
+
+def test_failed_probe_doubles_the_backoff_up_to_the_limit(clock):
+    breaker = CircuitBreaker(failure_threshold=1, backoff_initial=5.0, backoff_max=15.0)
+    breaker.failed()
+    for backoff in (10.0, 15.0, 15.0):
+        clock.now = breaker.open_until
+        assert breaker.allow()
+        breaker.failed()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.open_until - clock.now == backoff
+
+    # Closing resets the backoff
+    clock.now = breaker.open_until
+    breaker.allow()
+    breaker.succeeded()
+    breaker.failed()
+    assert breaker.open_until - clock.now == 5.0
+
+
+def test_symbols_without_any_read_value_are_not_saved(monkeypatch):
+    table_name = "test_health_phases"
+    table = Table({symbol: {"voltage": Register(symbol, "float", "electric"),
+                            "current": Register(10 + symbol, "float", "electric")} for symbol in (1, 2)},
+                  Table.Types.SYMBOLIC, "phase")
+    # The second symbol is read from a meter which didn't answer
+    values = {(1, "voltage"): 230.0, (1, "current"): None, (2, "voltage"): None, (2, "current"): None}
+    ingested, published = [], []
+
+    async def read_plan(meters, plan):
+        return dict(values)
+
+    async def flush_async():
+        pass
+
+    table.plan = object()
+    monkeypatch.setattr(reading_execution, "read_plan", read_plan)
+    monkeypatch.setattr(reading_execution, "flush_async", flush_async)
+    monkeypatch.setattr(reading_execution, "ingest", lambda name, row, timestamp, symbols: ingested.append(symbols))
+    monkeypatch.setattr(live.broker, "publish", lambda name, row, timestamp, symbol: published.append(symbol))
+    latest.store.update(table_name, {"voltage": 229.0, "current": 5.0}, 1, symbol="2")
+
+    reading = asyncio.run(reading_execution.measure_and_save_async(table, table_name, {}))
+
+    assert reading[2] == {"voltage": None, "current": None}
+    assert ingested == [{"phase": "1"}]
+    assert published == ["1"]
+    stored = latest.store.get(table_name, "2")
+    assert stored["voltage"] == {"value": 229.0, "timestamp": 1, "quality": "bad"}
+    assert latest.store.get(table_name, "1")["voltage"]["quality"] == "good"
@@ -0,0 +1,100 @@
+"""Tests of the batched ingestion into QuestDB, see ``readings.db_functions.IngestionService``.
+
+QuestDB is replaced by a fake ``Sender`` recording the sent lines, which can hold a flush in flight.
+
+"""
+import asyncio
+import threading
+
+import pytest
+
+from readings import db_functions
+from readings.db_functions import IngestionService
+
+
+class _Sender:
+    """Stands in for ``questdb.ingress.Sender``, shared by all the connections of a test"""
+    lines: list[str] = []
+    connections = 0
+    open_connections = 0
+    # Cleared to hold the next flush until it's set, ``sending`` is set once a flush is held
+    release = threading.Event()
+    sending = threading.Event()
+
+    def __init__(self, host, port, auto_flush=False):
+        pass
+
+    def connect(self):
+        cls = type(self)
+        cls.connections += 1
+        cls.open_connections += 1
+
+    def flush(self, buffer, clear=False):
+        type(self).sending.set()
+        assert type(self).release.wait(5)
+        type(self).lines += str(buffer).splitlines()
+
+    def close(self, flush=False):
+        type(self).open_connections -= 1
+
+
+@pytest.fixture
+def sender(monkeypatch) -> type[_Sender]:
+    sender = type("Sender", (_Sender,), {"lines": [], "release": threading.Event(), "sending": threading.Event()})
+    sender.release.set()
+    monkeypatch.setattr(db_functions, "Sender", sender)
+    return sender
+
+
+def _add_rows(service: IngestionService, first: int, count: int):
+    for i in range(first, first + count):
+        service.row("phases", {"voltage": float(i)}, {"phase": "1"})
+
+
+def _voltages(lines: list[str]) -> list[int]:
+    return [int(float(line.split("voltage=")[1].split()[0])) for line in lines]
+
+
+def test_close_waits_for_the_flush_in_flight(sender):
+    service = IngestionService("127.0.0.1", 9009)
+    _add_rows(service, 0, 10)
+    sender.release.clear()
+    flushing = threading.Thread(target=service.flush)
+    flushing.start()
+    # The first 10 rows are swapped out of the buffer and held in the flush
+    assert sender.sending.wait(5)
+    _add_rows(service, 10, 5)
+
+    closing = threading.Thread(target=service.close)
+    closing.start()
+    closing.join(0.1)
+    assert closing.is_alive()
+
+    sender.release.set()
+    flushing.join(5)
+    closing.join(5)
+    assert _voltages(sender.lines) == list(range(15))
+    assert service.snapshot()["buffered_rows"] == 0
+    assert sender.open_connections == 0
+
+
+def test_flush_async_scheduled_before_close(sender, monkeypatch):
+    service = IngestionService("127.0.0.1", 9009)
+    monkeypatch.setattr(db_functions, "service", service)
+
+    async def main():
+        _add_rows(service, 0, 10)
+        sender.release.clear()
+        flush = asyncio.ensure_future(db_functions.flush_async())
+        await asyncio.to_thread(sender.sending.wait, 5)
+        _add_rows(service, 10, 5)
+        closing = asyncio.ensure_future(asyncio.to_thread(service.close))
+        sender.release.set()
+        await asyncio.gather(flush, closing)
+        # Rows added after close() are still sent, without leaving a connection open
+        _add_rows(service, 15, 5)
+        await db_functions.flush_async()
+
+    asyncio.run(main())
+    assert _voltages(sender.lines) == list(range(20))
+    assert sender.open_connections == 0
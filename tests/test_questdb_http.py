@@ -0,0 +1,59 @@
+"""Tests of the HTTP client of QuestDB: the reuse of connections and the checks of the queries.
+
+The server is a local asyncio one answering every request with a fixed body, except those it's told to ignore.
+
+"""
+import asyncio
+
+import pytest
+
+from readings import questdb_http
+from readings.questdb_http import HttpConnectionPool
+
+
+async def _serve(ignored: set[int]) -> tuple[asyncio.AbstractServer, int]:
+    """Starts a server which never answers the requests whose numbers, counted from 1, are in ``ignored``"""
+    count = 0
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        nonlocal count
+        while await reader.readline():
+            while (await reader.readline()).strip():
+                pass
+            count += 1
+            if count not in ignored:
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+                await writer.drain()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def test_timeout_on_a_reused_connection_releases_it():
+    async def run():
+        server, port = await _serve(ignored={2})
+        async with server:
+            pool = HttpConnectionPool("127.0.0.1", port, max_connections=1, timeout=0.2)
+            assert await (await pool.get("/")).read() == b"ok"
+
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.get("/")
+
+            # The only connection must be free again, and the timed out one not reused
+            response = await asyncio.wait_for(pool.get("/"), 2)
+            assert await response.read() == b"ok"
+            assert pool.snapshot()["connects"] == 2
+            pool.close_all()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("sql", ["select * from phases", "  SHOW TABLES;", "(SELECT 1)"])
+def test_read_queries_are_allowed(sql):
+    questdb_http._check_read_only(sql)
+
+
+@pytest.mark.parametrize("sql", ["drop table phases", "insert into phases values(1)", "select 1; drop table phases", ""])
+def test_other_queries_are_rejected(sql):
+    with pytest.raises(ValueError):
+        questdb_http._check_read_only(sql)
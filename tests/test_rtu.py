@@ -0,0 +1,208 @@
+"""Tests of the Modbus RTU support: the framing of the requests, the bus arbitration and the decoded values.
+
+Run from the root of the project: ::
+
+    python -m pytest tests
+
+The meters are read over RTU-over-TCP from local servers, a hand-written one checking the frames byte by byte
+and a pymodbus server, so neither hardware nor pyserial is needed.
+The bus arbitration is timed against a fake clock.
+
+"""
+import asyncio
+import contextlib
+import socket
+import struct
+import time
+
+import pytest
+from pymodbus.datastore import ModbusServerContext, ModbusSlaveContext, ModbusSparseDataBlock
+from pymodbus.framer.rtu_framer import ModbusRtuFramer
+from pymodbus.server.async_io import ModbusTcpServer
+
+from readings import arbitration, modbus
+from readings.arbitration import BusArbiter, inter_frame_gap
+from readings.data_classes import Meter, Register
+
+FLOAT = Meter.RegisterType(">", ">", 2, "input")
+# Silence between the frames of the tests
+GAP = 0.02
+
+
+@pytest.fixture(autouse=True)
+def modbus_state(monkeypatch):
+    """Gives every test its own connections, arbiters and circuit breakers, so they don't leak between the tests"""
+    monkeypatch.setattr(modbus, "pool", None)
+    monkeypatch.setattr(modbus, "arbiters", {})
+    monkeypatch.setattr(modbus, "breakers", {})
+
+
+class _Clock:
+    """Replaces the monotonic clock and ``asyncio.sleep()``, which advances the clock instead of waiting"""
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float):
+        self.sleeps.append(delay)
+        self.now += delay
+        await _real_sleep(0)
+
+
+_real_sleep = asyncio.sleep
+
+
+@pytest.fixture
+def clock(monkeypatch) -> _Clock:
+    clock = _Clock()
+    monkeypatch.setattr(arbitration.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(arbitration.asyncio, "sleep", clock.sleep)
+    return clock
+
+
+def _crc(frame: bytes) -> bytes:
+    """CRC-16/MODBUS of a frame, in the byte order it's sent in"""
+    crc = 0xFFFF
+    for byte in frame:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc.to_bytes(2, "little")
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def _float_registers(value: float) -> list[int]:
+    """Registers of a float in the byte and word order of ``FLOAT``"""
+    return list(struct.unpack(">2H", struct.pack(">f", value)))
+
+
+@contextlib.asynccontextmanager
+async def _rtu_gateway(port: int, registers: dict[int, dict[int, int]]):
+    """Runs an RTU-over-TCP server with the input registers of each slave id, yields the list of received requests"""
+    requests = []
+    slaves = {slave_id: ModbusSlaveContext(ir=ModbusSparseDataBlock(values), zero_mode=True)
+              for slave_id, values in registers.items()}
+    server = ModbusTcpServer(ModbusServerContext(slaves=slaves, single=False), framer=ModbusRtuFramer,
+                             address=("127.0.0.1", port), allow_reuse_address=True,
+                             request_tracer=lambda request, *_: requests.append(request))
+    task = asyncio.create_task(server.serve_forever())
+    await server.serving
+    try:
+        yield requests
+    finally:
+        await server.shutdown()
+        task.cancel()
+
+
+def _meter(slave_id: int, port: int) -> Meter:
+    identification = Meter.Identification(f"meter_{slave_id}", slave_id, "127.0.0.1", port,
+                                          transport="rtu_over_tcp", inter_frame_gap=GAP)
+    return Meter(identification, {"float": FLOAT})
+
+
+def test_inter_frame_gap():
+    assert inter_frame_gap(9600) == pytest.approx(3.5 * 11 / 9600)
+    assert inter_frame_gap(19200) == pytest.approx(3.5 * 11 / 19200)
+    assert inter_frame_gap(115200) == 0.00175
+
+
+def test_bus_arbiter_serializes_requests_and_keeps_the_gap(clock):
+    arbiter = BusArbiter(GAP)
+    spans = []
+
+    async def request(slave_id: int, address: int):
+        async with arbiter.hold(f"meter_{slave_id}", slave_id, address):
+            start = clock.now
+            await asyncio.sleep(0.005)
+            spans.append((start, clock.now, slave_id, address))
+
+    async def main():
+        await asyncio.gather(*(request(slave_id, address)
+                               for slave_id, address in ((3, 0), (1, 10), (2, 0), (1, 0), (3, 10), (2, 10))))
+
+    asyncio.run(main())
+    assert len(spans) == 6
+    for (_, end, _, _), (start, _, _, _) in zip(spans, spans[1:]):
+        # One request at a time, each after the silence following the previous response
+        assert start - end == pytest.approx(GAP)
+    # The first request is served right away, then the same slave first, the others by slave id and address
+    assert [(slave_id, address) for _, _, slave_id, address in spans] == [
+        (3, 0), (3, 10), (1, 0), (1, 10), (2, 0), (2, 10)]
+
+
+def test_rtu_requests_are_framed_and_decoded():
+    frames = []
+    in_flight = 0
+    overlapped = False
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        nonlocal in_flight, overlapped
+        try:
+            while True:
+                frame = await reader.readexactly(8)
+                in_flight += 1
+                overlapped |= in_flight > 1
+                frames.append((time.monotonic(), frame))
+                slave_id, function, address, count = struct.unpack(">BBHH", frame[:6])
+                assert frame[6:] == _crc(frame[:6])
+                registers = _float_registers(slave_id * 100 + address / 10)
+                payload = struct.pack(">BBB", slave_id, function, 2 * count) + struct.pack(">2H", *registers)
+                await asyncio.sleep(0.005)
+                in_flight -= 1
+                writer.write(payload + _crc(payload))
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        meters = {f"meter_{slave_id}": _meter(slave_id, port) for slave_id in (1, 2)}
+        registers = {(slave_id, address): Register(address, "float", f"meter_{slave_id}")
+                     for slave_id in (1, 2) for address in (0, 100)}
+        try:
+            async with server:
+                return await modbus.read_plan(meters, modbus.compile_plan(meters, registers, max_gap=0))
+        finally:
+            await modbus.close_connections()
+
+    values = asyncio.run(main())
+    assert values == {(slave_id, address): pytest.approx(slave_id * 100 + address / 10)
+                      for slave_id in (1, 2) for address in (0, 100)}
+    # Read input registers, 2 registers per float
+    assert sorted(struct.unpack(">BBHH", frame[:6]) for _, frame in frames) == [
+        (1, 4, 0, 2), (1, 4, 100, 2), (2, 4, 0, 2), (2, 4, 100, 2)]
+    assert not overlapped
+    for (previous, _), (current, _) in zip(frames, frames[1:]):
+        # The gap follows the response, which takes another 5 ms, so this holds with a margin
+        assert current - previous >= GAP
+
+
+def test_rtu_read_from_gateway():
+    port = _free_port()
+    slaves = (1, 2, 3)
+    registers = {slave_id: dict(enumerate(_float_registers(230.5 + slave_id), start=7500)) for slave_id in slaves}
+
+    async def main():
+        async with _rtu_gateway(port, registers) as requests:
+            meters = {f"meter_{slave_id}": _meter(slave_id, port) for slave_id in slaves}
+            fields = {slave_id: Register(7500, "float", f"meter_{slave_id}") for slave_id in slaves}
+            try:
+                values = await modbus.read_plan(meters, modbus.compile_plan(meters, fields))
+            finally:
+                await modbus.close_connections()
+            return values, len(requests), modbus.arbiters[meters["meter_1"].id.endpoint]
+
+    values, requests, arbiter = asyncio.run(main())
+    assert values == {slave_id: pytest.approx(230.5 + slave_id) for slave_id in slaves}
+    assert requests == len(slaves)
+    assert isinstance(arbiter, BusArbiter)
+    assert arbiter.gap == GAP
@@ -0,0 +1,115 @@
+"""Tests of the aggregation of sampled tables over windows, see ``readings.sampling``."""
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from readings import scheduler
+from readings.data_classes import Register, Sampling, Table
+from readings.sampling import WindowAggregator, get_aggregator
+
+SECOND = 1_000_000
+MINUTE = 60 * SECOND
+# Start of a minute
+START = 28_333_333 * MINUTE
+
+
+def _aggregator(aggregates: list[str] = None) -> WindowAggregator:
+    return WindowAggregator(Sampling(aggregates=aggregates or list(Sampling.AGGREGATES)))
+
+
+def test_window_is_finished_by_the_first_reading_past_it():
+    aggregator = _aggregator()
+    for i, voltage in enumerate([230.0, 232.0, 228.0]):
+        assert aggregator.add([(None, {"voltage": voltage})], START + 20 * i * SECOND, MINUTE) is None
+    # The last microsecond of the window still belongs to it
+    assert aggregator.add([(None, {"voltage": 231.0})], START + MINUTE - 1, MINUTE) is None
+
+    finished = aggregator.add([(None, {"voltage": 240.0})], START + MINUTE, MINUTE)
+
+    assert finished == (START, [(None, {"voltage_min": 228.0, "voltage_max": 232.0, "voltage_mean": 230.25,
+                                        "voltage_last": 231.0, "voltage_count": 4})])
+    assert aggregator.window_start == START + MINUTE
+    assert aggregator.flush() == (START + MINUTE, [(None, {"voltage_min": 240.0, "voltage_max": 240.0,
+                                                           "voltage_mean": 240.0, "voltage_last": 240.0,
+                                                           "voltage_count": 1})])
+
+
+def test_windows_are_aligned_to_the_clock():
+    aggregator = _aggregator(["count"])
+    aggregator.add([(None, {"voltage": 230.0})], START + 45 * SECOND, MINUTE)
+    finished = aggregator.add([(None, {"voltage": 230.0})], START + 75 * SECOND, MINUTE)
+    assert finished == (START, [(None, {"voltage_count": 1})])
+    assert aggregator.window_start == START + MINUTE
+
+
+def test_skipped_windows_are_not_ingested():
+    aggregator = _aggregator(["count"])
+    aggregator.add([(None, {"voltage": 230.0})], START, MINUTE)
+    finished = aggregator.add([(None, {"voltage": 230.0})], START + 5 * MINUTE, MINUTE)
+    assert finished == (START, [(None, {"voltage_count": 1})])
+    assert aggregator.flush() == (START + 5 * MINUTE, [(None, {"voltage_count": 1})])
+
+
+def test_changed_window_length_finishes_the_window():
+    aggregator = _aggregator(["count"])
+    aggregator.add([(None, {"voltage": 230.0})], START, MINUTE)
+    finished = aggregator.add([(None, {"voltage": 230.0})], START + SECOND, 5 * MINUTE)
+    assert finished == (START, [(None, {"voltage_count": 1})])
+    assert aggregator.window_length == 5 * MINUTE
+
+
+def test_symbols_missing_values_and_non_numbers():
+    aggregator = _aggregator(["min", "mean", "last", "count"])
+    aggregator.add([("1", {"voltage": 230.0, "on": True}), ("2", {"voltage": None, "on": False})], START, MINUTE)
+    aggregator.add([("1", {"voltage": float("nan"), "on": False}), ("2", {"voltage": 231.0, "on": False})],
+                   START + SECOND, MINUTE)
+
+    assert dict(aggregator.flush()[1]) == {
+        "1": {"voltage_min": 230.0, "voltage_mean": 230.0, "voltage_count": 2, "on_last": False, "on_count": 2,
+              "voltage_last": pytest.approx(float("nan"), nan_ok=True)},
+        "2": {"voltage_min": 231.0, "voltage_mean": 231.0, "voltage_last": 231.0, "voltage_count": 1,
+              "on_last": False, "on_count": 2},
+    }
+
+
+def test_flush_of_an_empty_window():
+    aggregator = _aggregator()
+    assert aggregator.flush() is None
+    aggregator.add([(None, {"voltage": 230.0})], START, MINUTE)
+    assert aggregator.flush() is not None
+    assert aggregator.flush() is None
+
+
+def _sampled_table() -> Table:
+    return Table({"voltage": Register(0, "float", "electric")}, sampling=Sampling(interval=1.0))
+
+
+def test_refresh_of_a_sampled_table_is_not_aggregated():
+    calls = []
+
+    async def execute(table, table_name, meters, window, aggregate=True):
+        calls.append(aggregate)
+        await asyncio.sleep(0.01)
+        return {"voltage": 230.0}
+
+    async def run():
+        table = _sampled_table()
+        job = scheduler.AsyncJob(timedelta(seconds=1), execute, table=table, table_name="sampled", meters={},
+                                 window=timedelta(minutes=1))
+        await asyncio.gather(*(job.refresh(0.0, **scheduler._refresh_overrides(job)) for _ in range(3)))
+        # A scheduled execution doesn't join a refresh in flight and aggregates
+        refresh = asyncio.ensure_future(job.refresh(0.0, **scheduler._refresh_overrides(job)))
+        await asyncio.sleep(0)
+        await job._execute()
+        await refresh
+
+    asyncio.run(run())
+    assert calls == [False, False, True]
+
+
+def test_reload_keeps_the_window_of_a_changed_table():
+    old, new = _sampled_table(), _sampled_table()
+    get_aggregator(old).add([(None, {"voltage": 230.0})], START, MINUTE)
+    scheduler._keep_window(old, new, "sampled")
+    assert new.aggregator is old.aggregator
@@ -0,0 +1,85 @@
+"""Tests of the split of the tables over worker processes and of the merge of their spools, see ``readings.sharding``."""
+import os
+from datetime import timedelta
+
+import pytest
+
+from readings.data_classes import Meter, Register, Table
+from readings.sharding import plan_shards
+from readings.spool import SEGMENT_SUFFIX, Spool
+
+FLOAT = Meter.RegisterType(">", ">", 2, "input")
+
+
+def _meter(name: str, slave_id: int, port: int, transport: str = "tcp") -> Meter:
+    return Meter(Meter.Identification(name, slave_id, "127.0.0.1", port, transport=transport), {"float": FLOAT})
+
+
+def _table(meter: str, registers: int = 1) -> Table:
+    return Table({f"field_{i}": Register(2 * i, "float", meter) for i in range(registers)})
+
+
+def _shard_of(shards: list[list[str]]) -> dict[str, int]:
+    return {name: index for index, shard in enumerate(shards) for name in shard}
+
+
+def test_tables_of_a_shared_bus_stay_in_one_shard():
+    meters = {
+        # Two meters behind one RTU gateway, on the same serial bus
+        "bus_1": _meter("bus_1", 1, 5020, "rtu_over_tcp"),
+        "bus_2": _meter("bus_2", 2, 5020, "rtu_over_tcp"),
+        "alone_1": _meter("alone_1", 1, 5021),
+        "alone_2": _meter("alone_2", 1, 5022),
+    }
+    tables = {
+        "first_on_bus": _table("bus_1"),
+        "second_on_bus": _table("bus_2"),
+        "same_meter": _table("alone_1"),
+        "other_meter": _table("alone_1"),
+        "independent": _table("alone_2"),
+    }
+
+    shards = plan_shards(meters, tables, workers=3)
+
+    shard_of = _shard_of(shards)
+    assert sorted(shard_of) == sorted(tables)
+    assert shard_of["first_on_bus"] == shard_of["second_on_bus"]
+    assert shard_of["same_meter"] == shard_of["other_meter"]
+    assert len(shards) == 3
+
+
+def test_groups_are_balanced_by_registers_per_second():
+    meters = {name: _meter(name, 1, 5020 + i) for i, name in enumerate(["a", "b", "c"])}
+    tables = {"heavy": _table("a", registers=8), "light_1": _table("b", 4), "light_2": _table("c", 4)}
+
+    shards = plan_shards(meters, tables, workers=2)
+    assert sorted(map(sorted, shards)) == [["heavy"], ["light_1", "light_2"]]
+
+    # A shorter interval makes a table heavier
+    intervals = {"light_1": timedelta(minutes=1)}
+    shards = plan_shards(meters, tables, workers=2, intervals=intervals)
+    assert sorted(map(sorted, shards)) == [["heavy", "light_2"], ["light_1"]]
+
+
+def test_no_more_shards_than_groups():
+    meters = {"bus_1": _meter("bus_1", 1, 5020, "rtu_over_tcp"), "bus_2": _meter("bus_2", 2, 5020, "rtu_over_tcp")}
+    tables = {"first": _table("bus_1"), "second": _table("bus_2")}
+    assert plan_shards(meters, tables, workers=4) == [["first", "second"]]
+    with pytest.raises(ValueError):
+        plan_shards(meters, tables, workers=0)
+
+
+def test_adopted_worker_spool_is_replayed_after_the_own_rows(tmp_path):
+    worker = Spool(str(tmp_path / "worker-0"))
+    worker.append(b"phases voltage=2.0 2\n")
+    worker.close()
+    spool = Spool(str(tmp_path / "main"))
+    spool.append(b"phases voltage=1.0 1\n")
+
+    assert spool.adopt(worker.directory) == 1
+    assert not os.path.exists(worker.directory)
+
+    chunks = []
+    assert spool.replay(chunks.append) == 2
+    assert b"".join(chunks) == b"phases voltage=1.0 1\nphases voltage=2.0 2\n"
+    assert not [name for name in os.listdir(spool.directory) if name.endswith(SEGMENT_SUFFIX)]
@@ -0,0 +1,96 @@
+"""Tests of the on-disk spool of unsent readings, see ``readings.spool``."""
+import os
+
+import pytest
+
+from readings.spool import SEGMENT_SUFFIX, Spool
+
+
+def _lines(first: int, count: int) -> bytes:
+    return b"".join(b"phases,phase=1 voltage=%d.0 %d\n" % (i, i) for i in range(first, first + count))
+
+
+def _segments(directory) -> list[str]:
+    return sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+
+
+class _Sender:
+    """Collects the replayed chunks, failing after ``fail_after`` successful chunks"""
+    def __init__(self, fail_after: int = None):
+        self.fail_after = fail_after
+        self.chunks = []
+
+    def __call__(self, chunk: bytes):
+        if self.fail_after is not None and len(self.chunks) >= self.fail_after:
+            raise ConnectionError("QuestDB is unreachable")
+        self.chunks.append(chunk)
+
+    @property
+    def data(self) -> bytes:
+        return b"".join(self.chunks)
+
+
+def test_appended_rows_are_replayed_in_order(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=200)
+    for first in range(0, 30, 10):
+        spool.append(_lines(first, 10))
+    assert len(_segments(tmp_path)) > 1
+    assert spool.stats.spooled_rows == 30
+
+    sender = _Sender()
+    assert spool.replay(sender) == 30
+    assert sender.data == _lines(0, 30)
+    assert spool.pending_bytes() == 0
+    assert _segments(tmp_path) == []
+
+
+def test_chunks_hold_complete_lines(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append(_lines(0, 50))
+    sender = _Sender()
+    spool.replay(sender, chunk_bytes=100)
+    assert len(sender.chunks) > 1
+    assert all(chunk.endswith(b"\n") and len(chunk) <= 100 for chunk in sender.chunks)
+    assert sender.data == _lines(0, 50)
+
+
+def test_oldest_segments_are_evicted_above_the_cap(tmp_path):
+    # Batches of equal size from here on, each in its own segment
+    batch = _lines(10, 10)
+    spool = Spool(str(tmp_path), max_bytes=3 * len(batch), segment_bytes=len(_lines(0, 10)))
+    for first in range(0, 50, 10):
+        spool.append(_lines(first, 10))
+
+    assert spool.stats.evicted_rows == 20
+    assert spool.pending_bytes() <= spool.max_bytes
+    sender = _Sender()
+    spool.replay(sender)
+    assert sender.data == _lines(20, 30)
+
+
+def test_failed_replay_keeps_the_unsent_rest(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append(_lines(0, 40))
+
+    failing = _Sender(fail_after=2)
+    with pytest.raises(ConnectionError):
+        spool.replay(failing, chunk_bytes=200)
+    sent = failing.data
+    assert sent and _lines(0, 40).startswith(sent)
+
+    sender = _Sender()
+    spool.replay(sender)
+    assert sent + sender.data == _lines(0, 40)
+    assert spool.stats.replayed_rows == 40
+
+
+def test_segments_of_a_previous_run_are_replayed(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append(_lines(0, 10))
+    spool.close()
+
+    restarted = Spool(str(tmp_path))
+    restarted.append(_lines(10, 10))
+    sender = _Sender()
+    assert restarted.replay(sender) == 20
+    assert sender.data == _lines(0, 20)